@@ -1,46 +1,20 @@
 
 import os
+import sys
 import django
-from faker import Faker
+from pathlib import Path
 
 
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx-backend-graphql.settings')
+# Runnable as a plain script from anywhere: the project root must be importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
 django.setup()
 
-from crm.models import Customer, Product, Order
-
-fake = Faker()
-
-def seed_customers(count=10):
-    for _ in range(count):
-        Customer.objects.create(
-            name=fake.name(),
-            email=fake.email(),
-            phone=fake.phone_number()[:15]
-        )
-
-def seed_products(count=5):
-    for i in range(count):
-        Product.objects.create(
-            name=f"Product {i+1}",
-            price=fake.random_number(digits=2),
-            stock=fake.random_number(digits=2)
-        )
-
-def seed_orders(count=3):
-    customers = Customer.objects.all()
-    products = list(Product.objects.all())
-    
-    for _ in range(count):
-        customer = fake.random_element(customers)
-        order = Order.objects.create(customer=customer)
-        order.products.set(fake.random_elements(products, length=2, unique=True))
-        order.save()
+from crm.seeding import seed
 
+# Small demo dataset; use `manage.py seed_crm` for large ones
 if __name__ == '__main__':
     print("Seeding data...")
-    seed_customers()
-    seed_products()
-    seed_orders()
-    print("Seeding complete!")
\ No newline at end of file
+    counts = seed(customers=10, products=5, orders=3, products_per_order=(2, 2))
+    print("Seeding complete!", counts)
\ No newline at end of file
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -82,9 +83,34 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Read replica for GraphQL queries once CRM_READ_REPLICA = 'replica' (see crm/routers.py).
+    # Locally a second SQLite file standing in for a streaming replica of the primary
+    # (git-ignored; commands that check every alias, e.g. makemigrations, create it empty).
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+    },
 }
 
+DATABASE_ROUTERS = ['crm.routers.ReplicaRouter']
+
+# Alias GraphQL query operations read from (None: the primary), and how long a client
+# reads its own writes from the primary after a mutation
+CRM_READ_REPLICA = None
+CRM_READ_YOUR_WRITES_SECONDS = 5
+
+# Tuned SQLite for edge boxes (crm/sqlite.py), opt in with CRM_SQLITE_TUNED=1 in the environment:
+# WAL and the other PRAGMAs on every connection, BEGIN IMMEDIATE so writers queue on busy_timeout
+# instead of failing when a read lock cannot be upgraded, and persistent connections that are
+# health-checked before reuse
+CRM_SQLITE_TUNED = os.environ.get('CRM_SQLITE_TUNED') == '1'
+if CRM_SQLITE_TUNED:
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.sqlite3':
+            database.update(CONN_MAX_AGE=600, CONN_HEALTH_CHECKS=True)
+            database.setdefault('OPTIONS', {})['transaction_mode'] = 'IMMEDIATE'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -133,9 +159,37 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Graphene settings
 GRAPHENE = {
-    'SCHEMA': 'alx_backend_graphql.schema.schema'  # path to schema object
+    'SCHEMA': 'alx_backend_graphql.schema.schema',  # path to schema object
+    'MIDDLEWARE': ['crm.tracing.TracingMiddleware'],
 }
 
+# Cache for GraphQL responses (crm/response_cache.py), on only with CRM_CACHE_URL set to a Redis
+# server, e.g. redis://localhost:6379/1. Cron jobs, Celery tasks, management commands and every
+# web worker invalidate entries through it, so it has to be a cache they all share; the default
+# per-process LocMemCache would keep serving stale results after their writes
+CRM_CACHE_URL = os.environ.get('CRM_CACHE_URL')
+if CRM_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CRM_CACHE_URL,
+        },
+    }
+CRM_RESPONSE_CACHE = 'default' if CRM_CACHE_URL else None
+
+# Share of GraphQL operations traced into extensions and /graphql/metrics (0 to 1)
+CRM_TRACE_SAMPLE_RATE = 0.0
+
+# Client addresses /graphql/stats and /graphql/metrics answer besides DEBUG and staff users;
+# set to () behind a reverse proxy on the same host
+CRM_LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+# Rows per database fetch and per response piece of the /export/ endpoints
+CRM_EXPORT_CHUNK_SIZE = 2000
+
+# Most operations one /graphql request may send as a JSON array (a batch)
+CRM_GRAPHQL_MAX_BATCH_SIZE = 50
+
 
 # Cron job settings
 CRONJOBS = [
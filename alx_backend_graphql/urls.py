@@ -15,12 +15,18 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
-from graphene_django.views import GraphQLView
+from django.urls import path, re_path
 from django.views.decorators.csrf import csrf_exempt
+from crm.views import AsyncGraphQLView, CachedGraphQLView, export, graphql_metrics, graphql_stats
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('grahql', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    re_path(r'^graphql/?$', csrf_exempt(CachedGraphQLView.as_view(graphiql=True))),
+    path('graphql/stats', graphql_stats),
+    path('graphql/metrics', graphql_metrics),
+    # Async execution; serve with an ASGI server (alx_backend_graphql.asgi)
+    re_path(r'^graphql/async/?$', csrf_exempt(AsyncGraphQLView.as_view())),
+    # Streaming CSV/NDJSON exports, e.g. /export/orders.csv?order_date__gte=2024-01-01
+    path('export/<str:dataset>.<str:format>', export),
 ]
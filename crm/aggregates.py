@@ -0,0 +1,135 @@
+
+
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Sum, Value, When
+from .models import Customer, Order, Counter
+from .filters import CustomerFilter, OrderFilter
+from .cost import FIELD_COSTS
+from .response_cache import FIELD_TAGS
+
+
+
+# Counter rows and the aggregate each one caches
+COUNTERS = ("customers", "orders", "revenue")
+
+FIELD_TAGS.update({
+    ("Query", "totalCustomers"): [Customer],
+    ("Query", "totalOrders"): [Order],
+    ("Query", "totalRevenue"): [Order],
+})
+
+# One counter read or aggregate query each
+FIELD_COSTS.update({
+    ("Query", "totalCustomers"): 1,
+    ("Query", "totalOrders"): 1,
+    ("Query", "totalRevenue"): 1,
+})
+
+
+
+def bump(**deltas):
+    """Add ``deltas`` to the named counters with one UPDATE, e.g. ``bump(orders=1, revenue=Decimal("9.99"))``."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    Counter.objects.filter(name__in=deltas).update(value=F("value") + Case(
+        *[When(name=name, then=Value(Decimal(delta))) for name, delta in deltas.items()],
+        output_field=DecimalField(max_digits=20, decimal_places=2),
+    ))
+
+
+def computed():
+    # The three aggregates straight from the base tables, in two statements
+    orders = Order.objects.aggregate(count=Count("pk"), revenue=Sum("total_amount"))
+    return {
+        "customers": Customer.objects.count(),
+        "orders": orders["count"],
+        "revenue": orders["revenue"] or Decimal("0"),
+    }
+
+
+def drifted():
+    """``{name: (stored, actual)}`` for every counter that no longer matches the base tables."""
+    stored = dict(Counter.objects.values_list("name", "value"))
+    actual = {name: Decimal(value).quantize(Decimal("0.01")) for name, value in computed().items()}
+    return {name: (stored.get(name), actual[name]) for name in COUNTERS if stored.get(name) != actual[name]}
+
+
+def reconcile():
+    """Recompute the drifted counters from the base tables and return what changed (see ``drifted``)."""
+    with transaction.atomic():
+        # Lock the counter rows so concurrent bumps wait for the rewrite (no-op on SQLite)
+        list(Counter.objects.select_for_update())
+        drift = drifted()
+        for name, (_, value) in drift.items():
+            Counter.objects.update_or_create(name=name, defaults={"value": value})
+    return drift
+
+
+def _counter(name):
+    value = Counter.objects.filter(name=name).values_list("value", flat=True).first()
+    # Missing row (e.g. before the first reconcile): fall back to the aggregate
+    return computed()[name] if value is None else value
+
+
+def _filtered(filters):
+    return {key: value for key, value in (filters or {}).items() if value is not None}
+
+
+
+def total_customers(**filters):
+    """COUNT of customers matching ``CustomerFilter`` arguments, or the counter when unfiltered."""
+    filters = _filtered(filters)
+    if filters:
+        return CustomerFilter(filters).qs.count()
+    return int(_counter("customers"))
+
+
+def total_orders(**filters):
+    """COUNT of orders matching ``OrderFilter`` arguments, or the counter when unfiltered."""
+    filters = _filtered(filters)
+    if filters:
+        return OrderFilter(filters).qs.count()
+    return int(_counter("orders"))
+
+
+def total_revenue(**filters):
+    """SUM of ``total_amount`` over the orders matching ``OrderFilter`` arguments, or the counter when unfiltered."""
+    filters = _filtered(filters)
+    if filters:
+        revenue = OrderFilter(filters).qs.aggregate(revenue=Sum("total_amount"))["revenue"]
+        return revenue or Decimal("0")
+    return _counter("revenue")
+
+
+
+# Async counterparts for the async GraphQL view (Django's async ORM)
+async def _acounter(name):
+    value = await Counter.objects.filter(name=name).values_list("value", flat=True).afirst()
+    if value is None:
+        return (await sync_to_async(computed)())[name]
+    return value
+
+
+async def atotal_customers(**filters):
+    filters = _filtered(filters)
+    if filters:
+        return await CustomerFilter(filters).qs.acount()
+    return int(await _acounter("customers"))
+
+
+async def atotal_orders(**filters):
+    filters = _filtered(filters)
+    if filters:
+        return await OrderFilter(filters).qs.acount()
+    return int(await _acounter("orders"))
+
+
+async def atotal_revenue(**filters):
+    filters = _filtered(filters)
+    if filters:
+        revenue = (await OrderFilter(filters).qs.aaggregate(revenue=Sum("total_amount")))["revenue"]
+        return revenue or Decimal("0")
+    return await _acounter("revenue")
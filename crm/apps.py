@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from . import signals  # noqa: F401 - registers the Order.total_amount and response cache handlers
+        from . import sqlite  # noqa: F401 - registers the tuned-SQLite connection_created hook
@@ -0,0 +1,301 @@
+
+
+import itertools
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.utils import IntegrityError
+from django.core.exceptions import ValidationError
+from .models import Customer, Product, Order, OrderProduct
+from .response_cache import invalidate
+from .search import index_rows
+from .aggregates import bump
+from . import rollups
+from .sqlite import retry_on_locked
+
+
+
+# Rows per INSERT statement and per email__in lookup
+BULK_BATCH_SIZE = 1000
+
+
+
+def chunked(items, size=BULK_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def parse_pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def first_error(e):
+    # (field, message) of the first problem in a ValidationError
+    if hasattr(e, "error_dict"):
+        field, errors = next(iter(e.message_dict.items()))
+        return field, errors[0]
+    return "non_field_errors", e.messages[0]
+
+
+
+def bulk_create_customers(inputs, batch_size=BULK_BATCH_SIZE):
+    """
+    Validate and insert many customers with a constant number of queries per chunk.
+
+    Rows are validated in memory, email uniqueness is checked with one
+    ``email__in`` query per chunk plus a set of emails already seen in the
+    batch, and valid rows are written with ``bulk_create``. Returns the created
+    customers and a list of ``(row_index, field, message)`` errors.
+    """
+    errors = []
+    candidates = []
+    seen = set()
+
+    for idx, input in enumerate(inputs):
+        customer = Customer(name=input.name, email=input.email, phone=input.phone or "")
+        try:
+            customer.full_clean(validate_unique=False, validate_constraints=False)
+        except ValidationError as e:
+            errors.append((idx, *first_error(e)))
+            continue
+
+        if customer.email in seen:
+            errors.append((idx, "email", "Duplicate email in this batch"))
+            continue
+        seen.add(customer.email)
+        candidates.append((idx, customer))
+
+    created = []
+    for chunk in chunked(candidates, batch_size):
+        existing = set(Customer.objects.filter(
+            email__in=[customer.email for _, customer in chunk]
+        ).values_list("email", flat=True))
+        rows = []
+        for idx, customer in chunk:
+            if customer.email in existing:
+                errors.append((idx, "email", "Email already exists"))
+            else:
+                rows.append((idx, customer))
+        created.extend(_insert(rows, errors))
+
+    if created:
+        # bulk_create sends no post_save, so cached responses are dropped and rows indexed here
+        invalidate(Customer)
+        index_rows(Customer, created)
+    errors.sort(key=lambda error: error[0])
+    return created, errors
+
+
+def _insert(rows, errors):
+    try:
+        with transaction.atomic():
+            created = Customer.objects.bulk_create([customer for _, customer in rows])
+            bump(customers=len(created))
+            return created
+    except IntegrityError:
+        pass
+
+    # A concurrent writer took one of the emails; find it row by row
+    created = []
+    for idx, customer in rows:
+        try:
+            with transaction.atomic():
+                customer.save()
+            created.append(customer)
+        except IntegrityError:
+            errors.append((idx, "email", "Email already exists"))
+    return created
+
+
+
+def bulk_create_products(inputs, batch_size=BULK_BATCH_SIZE):
+    """
+    Validate and insert many products, committing each chunk on its own.
+
+    Returns the created products and ``(row_index, field, message)`` errors.
+    """
+    created = []
+    errors = []
+
+    for chunk in chunked(list(enumerate(inputs)), batch_size):
+        rows = []
+        for idx, input in chunk:
+            product = Product(name=input.name, price=input.price, stock=input.stock or 0)
+            try:
+                product.full_clean(validate_unique=False, validate_constraints=False)
+            except ValidationError as e:
+                errors.append((idx, *first_error(e)))
+                continue
+            rows.append(product)
+
+        with transaction.atomic():
+            created.extend(Product.objects.bulk_create(rows))
+
+    if created:
+        invalidate(Product)
+        index_rows(Product, created)
+    return created, errors
+
+
+def bulk_create_orders(inputs, batch_size=BULK_BATCH_SIZE):
+    """
+    Validate many ``OrderInput``-like rows and insert them with ``ingest_orders``.
+
+    Each chunk costs one customer lookup and one product lookup on top of the
+    ingestion statements, and commits on its own. Returns the created orders
+    and ``(row_index, field, message)`` errors.
+    """
+    created = []
+    errors = []
+
+    for chunk in chunked(list(enumerate(inputs)), batch_size):
+        customer_ids = set(Customer.objects.filter(
+            pk__in={parse_pk(input.customer_id) for _, input in chunk} - {None}
+        ).values_list("pk", flat=True))
+        product_ids = set(Product.objects.filter(
+            pk__in={parse_pk(pk) for _, input in chunk for pk in input.product_ids} - {None}
+        ).values_list("pk", flat=True))
+
+        rows = []
+        for idx, input in chunk:
+            customer_id = parse_pk(input.customer_id)
+            if customer_id not in customer_ids:
+                errors.append((idx, "customer_id", "Customer does not exist"))
+                continue
+
+            missing = [pk for pk in input.product_ids if parse_pk(pk) not in product_ids]
+            if missing:
+                errors.append((idx, "product_ids", f"Product with ID {missing[0]} does not exist"))
+                continue
+            if not input.product_ids:
+                errors.append((idx, "product_ids", "At least one product must be specified"))
+                continue
+
+            rows.append((customer_id, [parse_pk(pk) for pk in input.product_ids],
+                         getattr(input, "order_date", None)))
+
+        created.extend(ingest_orders(rows, batch_size))
+
+    return created, errors
+
+
+def ingest_orders(rows, batch_size=BULK_BATCH_SIZE):
+    """
+    Insert orders from ``(customer_id, product_ids)`` or ``(customer_id, product_ids, order_date)`` rows.
+
+    The order ingestion path shared by the bulk mutations, the CSV import and
+    seeding; the ids must already be known to exist. Per chunk, in one
+    transaction: one SELECT of the product prices, one order INSERT with the
+    totals summed from them, one OrderProduct INSERT with the prices, one
+    counter update and one upsert per sales rollup (crm.rollups). Repeated product ids count once and a missing
+    ``order_date`` means now. No m2m signals are sent; the counters and cached
+    responses are updated here instead. A chunk that fails on a locked SQLite
+    database is retried when no outer transaction holds it. Returns the
+    created orders with their totals.
+    """
+    rows = iter(rows)
+    created = []
+
+    while True:
+        chunk = list(itertools.islice(rows, batch_size))
+        if not chunk:
+            break
+        created.extend(_ingest_chunk(chunk))
+
+    if created:
+        invalidate(Order)
+    return created
+
+
+@retry_on_locked
+def _ingest_chunk(chunk):
+    links = [dict.fromkeys(product_ids) for _, product_ids, *_ in chunk]
+
+    with transaction.atomic():
+        # The lines keep these prices (OrderProduct.price); a product deleted meanwhile fails the INSERT
+        prices = dict(Product.objects.filter(pk__in={pk for ids in links for pk in ids}).values_list("pk", "price"))
+        orders = []
+        for (customer_id, _, *order_date), product_ids in zip(chunk, links):
+            order = Order(customer_id=customer_id,
+                          total_amount=sum((prices.get(pk, 0) for pk in product_ids), Decimal("0")))
+            if order_date and order_date[0] is not None:
+                order.order_date = order_date[0]
+            orders.append(order)
+
+        orders = Order.objects.bulk_create(orders)
+        OrderProduct.objects.bulk_create(
+            OrderProduct(order_id=order.pk, product_id=pk, price=prices.get(pk))
+            for order, product_ids in zip(orders, links)
+            for pk in product_ids
+        )
+        bump(orders=len(orders), revenue=sum(order.total_amount for order in orders))
+        rollups.record(Order.objects.filter(pk__in=[order.pk for order in orders]))
+    return orders
+
+
+
+def restock_low_stock(threshold=10, increment=10, batch_size=BULK_BATCH_SIZE):
+    """
+    Add ``increment`` to the stock of every product below ``threshold``.
+
+    Walks the catalog in primary-key order (keyset batches) and restocks each
+    batch with one ``UPDATE ... SET stock = stock + N``. The ``stock < threshold``
+    check is repeated in the UPDATE so rows restocked concurrently are skipped.
+    Returns the updated products. Raises ValidationError unless ``threshold``
+    and ``increment`` are positive.
+    """
+    for field, value in (("threshold", threshold), ("increment", increment)):
+        if value < 1:
+            raise ValidationError({field: "Must be a positive integer"})
+
+    updated = []
+    last_pk = 0
+
+    while True:
+        ids = list(Product.objects.filter(stock__lt=threshold, pk__gt=last_pk)
+                   .order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            if updated:
+                invalidate(Product)
+            return updated
+        last_pk = ids[-1]
+
+        with transaction.atomic():
+            if _can_update_returning():
+                updated.extend(_restock_returning(ids, threshold, increment))
+            else:
+                updated.extend(_restock_locked(ids, threshold, increment))
+
+
+def _can_update_returning():
+    # SQLite 3.35+ and PostgreSQL support UPDATE ... RETURNING; MySQL/MariaDB do not
+    return connection.vendor in ("sqlite", "postgresql") and connection.features.can_return_columns_from_insert
+
+
+def _restock_locked(ids, threshold, increment):
+    # Without RETURNING: lock the rows still below the threshold, so the UPDATE
+    # changes exactly those, and read only them back
+    changed = list(Product.objects.select_for_update().filter(pk__in=ids, stock__lt=threshold)
+                   .order_by("pk").values_list("pk", flat=True))
+    if not changed:
+        return []
+    Product.objects.filter(pk__in=changed).update(stock=F("stock") + increment)
+    return list(Product.objects.filter(pk__in=changed).order_by("pk"))
+
+
+def _restock_returning(ids, threshold, increment):
+    qn = connection.ops.quote_name
+    table = qn(Product._meta.db_table)
+    pk = qn(Product._meta.pk.column)
+    stock = qn(Product._meta.get_field("stock").column)
+    columns = ", ".join(qn(field.column) for field in Product._meta.concrete_fields)
+    sql = (
+        f"UPDATE {table} SET {stock} = {stock} + %s "
+        f"WHERE {pk} IN ({', '.join(['%s'] * len(ids))}) AND {stock} < %s "
+        f"RETURNING {columns}"
+    )
+    # A raw queryset applies the backend's column converters (e.g. for price)
+    return sorted(Product.objects.raw(sql, [increment, *ids, threshold]), key=lambda product: product.pk)
@@ -0,0 +1,178 @@
+
+
+from django.conf import settings
+from graphql import (
+    FieldNode, FragmentDefinitionNode, GraphQLError, InlineFragmentNode, IntValueNode,
+    OperationDefinitionNode, VariableNode, get_named_type, get_nullable_type,
+    is_composite_type, is_list_type,
+)
+from graphql.validation import ValidationRule
+from graphene.relay import Connection
+from graphene_django.settings import graphene_settings
+
+
+
+# Budget per operation; set CRM_QUERY_MAX_COST / CRM_QUERY_MAX_DEPTH to None to lift a limit
+QUERY_MAX_COST = 50000
+QUERY_MAX_DEPTH = 12
+
+# Cost of fields that run a query of their own, e.g. {("Query", "totalRevenue"): 1}.
+# A type name of None matches the field on every type. Other object fields cost 1
+# per object, scalars nothing.
+FIELD_COSTS = {}
+
+
+
+class QueryCost:
+    """Static cost of one operation: objects it may resolve and its field depth."""
+
+    __slots__ = ("cost", "depth", "max_cost", "max_depth")
+
+    def __init__(self, cost, depth, max_cost=None, max_depth=None):
+        self.cost = cost
+        self.depth = depth
+        self.max_cost = max_cost
+        self.max_depth = max_depth
+
+    def extensions(self):
+        return {"requestedQueryCost": self.cost, "maximumAvailable": self.max_cost, "depth": self.depth}
+
+
+
+def max_cost():
+    return getattr(settings, "CRM_QUERY_MAX_COST", QUERY_MAX_COST)
+
+
+def max_depth():
+    return getattr(settings, "CRM_QUERY_MAX_DEPTH", QUERY_MAX_DEPTH)
+
+
+def operation_cost(schema, operation, fragments):
+    """
+    ``(cost, depth)`` of an operation, before it runs.
+
+    Each object costs 1 and a list or connection multiplies the cost of its
+    items: connections by their ``first``/``last`` argument (literal or
+    variable default, else the relay max limit), plain lists by the max limit.
+    Plain lists are not paged, so for them this is an estimate; the root
+    customers/products/orders lists are deprecated for that reason.
+    So ``allCustomers(first: 20) { edges { node { orders(first: 10) { edges { node { id } } } } } }``
+    costs 1 + 20 * (1 + 1 + 10 * 1) = 241.
+    """
+    root = schema.get_root_type(operation.operation)
+    if root is None:
+        return 0, 0
+    defaults = {
+        definition.variable.name.value: definition.default_value
+        for definition in operation.variable_definitions or ()
+    }
+    return _selection_cost(schema, root, operation.selection_set, fragments, defaults, frozenset())
+
+
+def _selection_cost(schema, parent, selection_set, fragments, defaults, spreads, page=1):
+    # ``page`` is the page size when ``parent`` is a connection
+    cost = depth = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            field = getattr(parent, "fields", {}).get(selection.name.value)
+            # __typename, introspection and unknown fields (the latter are reported by other rules)
+            if field is None:
+                continue
+            named = get_named_type(field.type)
+            child_cost = child_depth = 0
+            if selection.selection_set is not None:
+                child_page = _page_size(selection, defaults) if _is_connection(named) else 1
+                child_cost, child_depth = _selection_cost(
+                    schema, named, selection.selection_set, fragments, defaults, spreads, child_page
+                )
+            cost += _field_cost(parent, selection, field, named, child_cost, page)
+            depth = max(depth, child_depth + 1)
+            continue
+
+        if isinstance(selection, InlineFragmentNode):
+            condition, selections = selection.type_condition, selection.selection_set
+        else:
+            fragment = fragments.get(selection.name.value)
+            # Cycles are reported by NoFragmentCyclesRule; just stop walking them
+            if fragment is None or selection.name.value in spreads:
+                continue
+            spreads = spreads | {selection.name.value}
+            condition, selections = fragment.type_condition, fragment.selection_set
+        fragment_type = schema.get_type(condition.name.value) if condition else parent
+        fragment_cost, fragment_depth = _selection_cost(
+            schema, fragment_type or parent, selections, fragments, defaults, spreads, page
+        )
+        cost += fragment_cost
+        depth = max(depth, fragment_depth)
+    return cost, depth
+
+
+def _field_cost(parent, node, field, named, child_cost, page):
+    weight = FIELD_COSTS.get((parent.name, node.name.value), FIELD_COSTS.get((None, node.name.value)))
+    is_list = is_list_type(get_nullable_type(field.type))
+    if _is_connection(parent):
+        # The connection already paid for its page: edges repeat per node, pageInfo and totalCount once
+        return (weight or 0) + (page if is_list else 1) * child_cost
+    if weight is None:
+        weight = 1 if is_composite_type(named) else 0
+    if is_list:
+        return graphene_settings.RELAY_CONNECTION_MAX_LIMIT * (weight + child_cost)
+    return weight + child_cost
+
+
+def _is_connection(graphql_type):
+    graphene_type = getattr(graphql_type, "graphene_type", None)
+    return isinstance(graphene_type, type) and issubclass(graphene_type, Connection)
+
+
+def _page_size(node, defaults):
+    sizes = [graphene_settings.RELAY_CONNECTION_MAX_LIMIT]
+    for argument in node.arguments:
+        if argument.name.value not in ("first", "last"):
+            continue
+        value = argument.value
+        if isinstance(value, VariableNode):
+            value = defaults.get(value.name.value)
+        if isinstance(value, IntValueNode):
+            sizes.append(max(int(value.value), 0))
+    return min(sizes)
+
+
+
+def cost_limit_validator(max_cost=None, max_depth=None, callback=None):
+    """
+    Validation rule rejecting operations above ``max_cost`` or ``max_depth``.
+
+    ``callback`` receives ``{operation name: QueryCost}`` for the whole
+    document, as graphene's ``depth_limit_validator`` does for depths.
+    """
+
+    class CostLimitValidator(ValidationRule):
+        def __init__(self, context):
+            super().__init__(context)
+            document = context.document
+            fragments = {
+                definition.name.value: definition for definition in document.definitions
+                if isinstance(definition, FragmentDefinitionNode)
+            }
+            costs = {}
+            for operation in document.definitions:
+                if not isinstance(operation, OperationDefinitionNode):
+                    continue
+                cost = QueryCost(*operation_cost(context.schema, operation, fragments), max_cost, max_depth)
+                costs[operation.name.value if operation.name else None] = cost
+
+                if max_depth is not None and cost.depth > max_depth:
+                    self.report_error(GraphQLError(
+                        f"Query depth {cost.depth} exceeds the maximum depth of {max_depth}",
+                        operation, extensions={"code": "QUERY_TOO_DEEP", "cost": cost.extensions()},
+                    ))
+                elif max_cost is not None and cost.cost > max_cost:
+                    self.report_error(GraphQLError(
+                        f"Query cost {cost.cost} exceeds the maximum cost of {max_cost}",
+                        operation, extensions={"code": "QUERY_TOO_COMPLEX", "cost": cost.extensions()},
+                    ))
+            if callback is not None:
+                callback(costs)
+
+    return CostLimitValidator
@@ -3,8 +3,7 @@
 
 import os
 import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from .executor import execute
 
 
 
@@ -21,22 +20,13 @@ def log_crm_heartbeat():
 
     # --- Optional: Check GraphQL hello field ---
     try:
-        transport = RequestsHTTPTransport(
-            url="http://localhost:8000/graphql/",  # Update to your actual GraphQL endpoint
-            verify=True,
-            retries=3,
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-
-        query = gql(
+        result = execute(
             """
             query {
                 hello
             }
             """
         )
-
-        result = client.execute(query)
         gql_message = f"{timestamp} GraphQL hello response: {result.get('hello')}\n"
 
         # Append GraphQL result to the log
@@ -49,15 +39,8 @@ def log_crm_heartbeat():
             f.write(error_message)
 
 def update_low_stock():
-    # GraphQL endpoint
-    transport = RequestsHTTPTransport(
-        url="http://127.0.0.1:8000/graphql/",
-        use_json=True,
-    )
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-
-    # Define mutation
-    mutation = gql(
+    # Executed in-process (see crm/executor.py); no HTTP or schema introspection
+    response = execute(
         """
         mutation {
             updateLowStockProducts {
@@ -72,9 +55,6 @@ def update_low_stock():
         """
     )
 
-    # Execute mutation
-    response = client.execute(mutation)
-
     timestamp = datetime.datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
     log_file = "/tmp/low_stock_updates_log.txt"
 
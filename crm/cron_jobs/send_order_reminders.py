@@ -1,54 +1,26 @@
-
-
 #!/usr/bin/env python3
+import os
 import sys
 import logging
-from datetime import datetime, timedelta
-
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
 
 # Setup logging
 LOG_FILE = "/tmp/order_reminders_log.txt"
 logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format="%(asctime)s - %(message)s")
 
+# Run against the project's database directly; see crm/reminders.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+
 def main():
     try:
-        # GraphQL endpoint
-        transport = RequestsHTTPTransport(
-            url="http://localhost:8000/graphql",
-            verify=True,
-            retries=3,
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-
-        # Calculate date range (last 7 days)
-        today = datetime.now()
-        last_week = today - timedelta(days=7)
-        today_str = today.strftime("%Y-%m-%d")
-        last_week_str = last_week.strftime("%Y-%m-%d")
-
-        # GraphQL query for orders in last 7 days
-        query = gql("""
-        query GetRecentOrders($startDate: Date!, $endDate: Date!) {
-            orders(orderDate_Gte: $startDate, orderDate_Lte: $endDate) {
-                id
-                customer {
-                    email
-                }
-            }
-        }
-        """)
-
-        variables = {"startDate": last_week_str, "endDate": today_str}
-        result = client.execute(query, variable_values=variables)
+        import django
+        django.setup()
+        from crm.reminders import send_reminders
 
-        # Log each reminder
-        orders = result.get("orders", [])
+        # Streams the last 7 days after the checkpointed order id
+        orders, reminders = send_reminders()
         if orders:
-            for order in orders:
-                log_message = f"Reminder: Order {order['id']} for {order['customer']['email']}"
-                logging.info(log_message)
+            logging.info(f"Processed {orders} orders, sent {reminders} reminders")
         else:
             logging.info("No recent orders found.")
 
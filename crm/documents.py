@@ -0,0 +1,153 @@
+
+
+import hashlib
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from graphql import parse
+from graphql.validation import specified_rules, validate
+from graphene_django.settings import graphene_settings
+from .cost import cost_limit_validator, max_cost, max_depth
+
+
+
+# Parsed and validated documents kept per process
+DOCUMENT_CACHE_SIZE = 256
+
+# Automatic Persisted Queries protocol version we speak
+APQ_VERSION = 1
+
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+
+class CachedDocument:
+    """
+    A parsed ``DocumentNode`` with the errors it produced during validation.
+
+    ``costs`` holds the ``QueryCost`` of each operation by name (see crm/cost.py);
+    ``operations`` memoizes per-operation analysis (e.g. response cache tags) by operation name.
+    """
+
+    __slots__ = ("document", "errors", "costs", "operations")
+
+    def __init__(self, document, errors, costs=None):
+        self.document = document
+        self.errors = errors
+        self.costs = costs or {}
+        self.operations = {}
+
+    def cost(self, operation_ast):
+        if operation_ast is None:
+            return None
+        return self.costs.get(operation_ast.name.value if operation_ast.name else None)
+
+
+
+class DocumentCache:
+    """
+    LRU cache of parsed and validated documents keyed by the sha256 of their text.
+
+    Parsing and validation depend only on the query text, the schema, the
+    validation rules and the query cost budget, so one cache must not be shared
+    between schemas, and must be cleared when the budget changes. Every
+    document is costed and checked against the budget (crm/cost.py). Documents
+    that fail to parse are not cached; documents that fail validation are, with
+    their errors.
+    """
+
+    def __init__(self, maxsize=DOCUMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, schema, query, validation_rules=None):
+        key = query_hash(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Raises GraphQLError on a syntax error
+        document = parse(query)
+        costs = {}
+        rules = [*(validation_rules or specified_rules), cost_limit_validator(max_cost(), max_depth(), costs.update)]
+        errors = validate(schema, document, rules, graphene_settings.MAX_VALIDATION_ERRORS)
+        entry = CachedDocument(document, errors, costs)
+
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+
+
+class PersistedQueryError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class PersistedQueries:
+    """
+    Automatic Persisted Queries (APQ) store.
+
+    A client first sends only ``extensions.persistedQuery.sha256Hash``; if the
+    hash is unknown it gets ``PersistedQueryNotFound`` and retries with the full
+    query, which is stored under its hash. The texts live in the Django cache
+    named by ``settings.CRM_PERSISTED_QUERY_CACHE`` (``"default"`` if unset), so
+    every process behind a shared cache sees them.
+    """
+
+    key_prefix = "crm:apq:"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, "CRM_PERSISTED_QUERY_CACHE", "default")]
+
+    def resolve(self, extensions, query):
+        """Return the query text for a request, registering it if it came with a hash."""
+        persisted = (extensions or {}).get("persistedQuery")
+        if not persisted:
+            return query
+        if persisted.get("version") != APQ_VERSION:
+            raise PersistedQueryError("Unsupported persisted query version", "PERSISTED_QUERY_NOT_SUPPORTED")
+
+        sha256 = persisted.get("sha256Hash")
+        if query:
+            if query_hash(query) != sha256:
+                raise PersistedQueryError("provided sha does not match query", "BAD_USER_INPUT")
+            self.cache.set(self.key_prefix + sha256, query, None)
+            return query
+
+        query = self.cache.get(self.key_prefix + str(sha256))
+        if query is None:
+            self.misses += 1
+            raise PersistedQueryError("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+        self.hits += 1
+        return query
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
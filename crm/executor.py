@@ -0,0 +1,124 @@
+
+
+import time
+import logging
+from types import SimpleNamespace
+import requests
+from graphql import execute as execute_document
+from django.conf import settings
+from .documents import DocumentCache, query_hash
+
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a remote GraphQL server
+HTTP_TIMEOUT = 30
+
+
+
+class GraphQLExecutionError(Exception):
+    def __init__(self, errors):
+        super().__init__("; ".join(error.get("message", str(error)) for error in errors))
+        self.errors = errors
+
+
+
+class LocalExecutor:
+    """
+    Runs documents through ``alx_backend_graphql.schema`` inside this process.
+
+    No HTTP round-trip, JSON serialization or schema introspection: the document
+    is parsed and validated once (see ``DocumentCache``) and executed directly.
+    """
+
+    name = "local"
+    documents = DocumentCache()
+
+    def execute(self, query, variables=None, operation_name=None):
+        from alx_backend_graphql.schema import schema
+
+        start = time.perf_counter()
+        graphql_schema = schema.graphql_schema
+        cached = self.documents.get(graphql_schema, query)
+        if cached.errors:
+            raise GraphQLExecutionError([error.formatted for error in cached.errors])
+        result = execute_document(
+            graphql_schema,
+            cached.document,
+            variable_values=variables,
+            operation_name=operation_name,
+            # Fresh per call, so loaders never outlive one execution
+            context_value=SimpleNamespace(),
+        )
+        _log(self.name, query, operation_name, start)
+        if result.errors:
+            raise GraphQLExecutionError([error.formatted for error in result.errors])
+        return result.data
+
+
+class HttpExecutor:
+    """
+    Posts documents to a GraphQL server, for workers that run outside the deployment.
+
+    Documents go out as Automatic Persisted Queries: only the sha256 is sent
+    once the server has seen the text, and nothing is introspected.
+    """
+
+    name = "http"
+
+    def __init__(self, url, timeout=HTTP_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def execute(self, query, variables=None, operation_name=None):
+        start = time.perf_counter()
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": query_hash(query)}}
+        body = {"variables": variables, "operationName": operation_name, "extensions": extensions}
+
+        response = self._post(body)
+        if _persisted_query_not_found(response):
+            response = self._post(dict(body, query=query))
+        _log(self.name, query, operation_name, start)
+
+        if response.get("errors"):
+            raise GraphQLExecutionError(response["errors"])
+        return response.get("data")
+
+    def _post(self, body):
+        response = self.session.post(self.url, json=body, timeout=self.timeout)
+        try:
+            return response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise
+
+
+def _persisted_query_not_found(response):
+    return any(
+        error.get("extensions", {}).get("code") == "PERSISTED_QUERY_NOT_FOUND"
+        for error in response.get("errors") or []
+    )
+
+
+def _log(name, query, operation_name, start):
+    operation = operation_name or " ".join(query.split())[:60]
+    logger.info("graphql %s executor: %s in %.1f ms", name, operation, (time.perf_counter() - start) * 1000)
+
+
+
+def get_executor():
+    """
+    The executor for jobs: ``HttpExecutor`` when ``settings.CRM_GRAPHQL_URL`` is
+    set (remote workers), otherwise ``LocalExecutor``.
+    """
+    url = getattr(settings, "CRM_GRAPHQL_URL", None)
+    if url:
+        return HttpExecutor(url)
+    return LocalExecutor()
+
+
+def execute(query, variables=None, operation_name=None):
+    """Run ``query`` with the configured executor and return its data, raising ``GraphQLExecutionError`` on errors."""
+    return get_executor().execute(query, variables, operation_name)
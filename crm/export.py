@@ -0,0 +1,136 @@
+
+
+import contextvars
+import csv
+import io
+from datetime import datetime
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .filters import CustomerFilter, OrderFilter
+from .models import Customer, Order
+from .routers import reading_from
+
+
+
+# Rows per database fetch (``iterator(chunk_size=...)``) and per piece of the response
+EXPORT_CHUNK_SIZE = 2000
+
+# Content types of the export formats
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Exportable datasets: the allCustomers/allOrders filters, the columns read with values_list()
+# and the order rows are streamed in. Orders also get a product_ids column, so an export can be
+# fed back to ``manage.py import_orders``.
+EXPORTS = {
+    "customers": {
+        "model": Customer,
+        "filterset": CustomerFilter,
+        "columns": ("id", "name", "email", "phone"),
+        "order_by": ("id",),
+    },
+    "orders": {
+        "model": Order,
+        "filterset": OrderFilter,
+        "columns": ("id", "customer_id", "order_date", "total_amount"),
+        "order_by": ("order_date", "id"),
+    },
+}
+
+# CSV text of the columns csv.writer would not write as wanted: ISO dates, and the product_ids
+# separator import_orders reads
+CSV_FORMATS = {
+    "order_date": datetime.isoformat,
+    "product_ids": lambda ids: ";".join(map(str, ids)),
+}
+
+
+
+def chunk_size():
+    return getattr(settings, "CRM_EXPORT_CHUNK_SIZE", EXPORT_CHUNK_SIZE)
+
+
+def filterset(dataset, params):
+    """The dataset's FilterSet bound to ``params`` (filter names as in the FilterSet, e.g. ``total_amount__gte``)."""
+    export = EXPORTS[dataset]
+    return export["filterset"](params, queryset=export["model"].objects.all())
+
+
+def _chunks(queryset, size):
+    # Lists of up to ``size`` rows; the iterator holds one fetch of rows at a time
+    rows = queryset.iterator(chunk_size=size)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _with_product_ids(chunks):
+    # Per chunk, the order-product rows of exactly the chunk's orders (by id, not by re-running
+    # the filter, which could match orders committed since), instead of a join that repeats order rows
+    for chunk in chunks:
+        product_ids = {row[0]: [] for row in chunk}
+        for order_id, product_id in (
+            Order.products.through.objects.filter(order_id__in=list(product_ids))
+            .order_by("order_id", "product_id").values_list("order_id", "product_id")
+        ):
+            product_ids[order_id].append(product_id)
+        yield [(*row, product_ids[row[0]]) for row in chunk]
+
+
+def _csv(columns, chunks):
+    formats = [(i, CSV_FORMATS[column]) for i, column in enumerate(columns) if column in CSV_FORMATS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    # The header goes out before the first query runs
+    yield buffer.getvalue().encode()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in chunk:
+            row = list(row)
+            for i, format in formats:
+                row[i] = format(row[i])
+            writer.writerow(row)
+        yield buffer.getvalue().encode()
+
+
+def _ndjson(columns, chunks):
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    for chunk in chunks:
+        yield "".join(encoder.encode(dict(zip(columns, row))) + "\n" for row in chunk).encode()
+
+
+def stream(dataset, queryset, format, alias=None):
+    """
+    Yield ``queryset`` of ``dataset`` as CSV or NDJSON bytes, one piece per chunk of rows.
+
+    Rows are read with ``values_list().iterator()``, so memory holds one chunk
+    whatever the row count, as long as the server sends the pieces as they
+    come: under ASGI wrap the iterator in ``aiterate``, since Django's ASGI
+    handler reads a sync streaming iterator fully before sending it. Reads go
+    to ``alias`` (see crm.routers); None keeps them on the primary.
+    """
+    export = EXPORTS[dataset]
+    columns = export["columns"]
+    size = chunk_size()
+    with reading_from(alias):
+        chunks = _chunks(queryset.order_by(*export["order_by"]).values_list(*columns), size)
+        if dataset == "orders":
+            chunks = _with_product_ids(chunks)
+            columns = (*columns, "product_ids")
+        encode = _csv if format == "csv" else _ndjson
+        yield from encode(columns, chunks)
+
+
+async def aiterate(pieces):
+    """Async iterator over the sync iterator ``pieces``, one ``next()`` per piece in Django's sync thread."""
+    pieces = iter(pieces)
+    # One context for the whole iteration, so the generator's context variables (reading_from) persist
+    context = contextvars.copy_context()
+    next_piece = sync_to_async(context.run)
+    while (piece := await next_piece(next, pieces, None)) is not None:
+        yield piece
@@ -3,12 +3,13 @@
 import django_filters
 from django.db.models import Q
 from .models import Customer, Product, Order
+from .search import search
 
 
 
 class CustomerFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(field_name="name", lookup_expr='icontains')
-    email = django_filters.CharFilter(field_name="email", lookup_expr='icontains')
+    name = django_filters.CharFilter(field_name="name", method='filter_search')  # Substring search, see crm/search.py
+    email = django_filters.CharFilter(field_name="email", method='filter_search')
     created_at__gte = django_filters.DateFilter(field_name="id", lookup_expr='gte')  # If you have a created_at field, use it; else adjust.
     created_at__lte = django_filters.DateFilter(field_name="id", lookup_expr='lte')  # Same as above.
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern') # Custom filter: phone starts with +1
@@ -16,6 +17,9 @@ class CustomerFilter(django_filters.FilterSet):
     def filter_phone_pattern(self, queryset, name, value):
         return queryset.filter(phone__startswith=value)
 
+    def filter_search(self, queryset, name, value):
+        return search(queryset, name, value)
+
     class Meta:
         model = Customer
         fields = ['name', 'email', 'created_at__gte', 'created_at__lte', 'phone_pattern']
@@ -24,7 +28,7 @@ class CustomerFilter(django_filters.FilterSet):
 
 
 class ProductFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(field_name="name", lookup_expr='icontains')
+    name = django_filters.CharFilter(field_name="name", method='filter_search')
     price__gte = django_filters.NumberFilter(field_name="price", lookup_expr='gte')
     price__lte = django_filters.NumberFilter(field_name="price", lookup_expr='lte')
     stock__gte = django_filters.NumberFilter(field_name="stock", lookup_expr='gte')
@@ -36,6 +40,9 @@ class ProductFilter(django_filters.FilterSet):
             return queryset.filter(stock__lt=10)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search(queryset, name, value)
+
     class Meta:
         model = Product
         fields = ['name', 'price__gte', 'price__lte', 'stock__gte', 'stock__lte', 'low_stock']
@@ -47,12 +54,17 @@ class OrderFilter(django_filters.FilterSet):
     total_amount__lte = django_filters.NumberFilter(field_name="total_amount", lookup_expr='lte')
     order_date__gte = django_filters.DateFilter(field_name="order_date", lookup_expr='gte')
     order_date__lte = django_filters.DateFilter(field_name="order_date", lookup_expr='lte')
-    customer_name = django_filters.CharFilter(field_name="customer__name", lookup_expr='icontains')
+    customer_name = django_filters.CharFilter(method='filter_customer_name')
     product_name = django_filters.CharFilter(method='filter_product_name')
     product_id = django_filters.NumberFilter(method='filter_product_id') # Challenge: filter orders including a specific product ID
 
+    def filter_customer_name(self, queryset, name, value):
+        return queryset.filter(customer__in=search(Customer.objects.all(), "name", value))
+
     def filter_product_name(self, queryset, name, value):
-        return queryset.filter(products__name__icontains=value)
+        # Semi-join through the M2M table so an order matching several products appears once
+        products = search(Product.objects.all(), "name", value)
+        return queryset.filter(pk__in=Order.products.through.objects.filter(product__in=products).values("order_id"))
 
     def filter_product_id(self, queryset, name, value):
         return queryset.filter(products__id=value)
@@ -0,0 +1,208 @@
+
+
+import asyncio
+from inspect import isawaitable
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet, aprefetch_related_objects, prefetch_related_objects
+from graphene_django.filter import DjangoFilterConnectionField
+
+
+
+# Arguments that only page through a connection; anything else is a filter.
+PAGING_ARGS = {"first", "last", "before", "after", "offset"}
+
+
+
+def is_async():
+    """
+    True when resolving on an event loop (the async GraphQL view), where
+    resolvers return awaitables and read through Django's async ORM.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+
+class Loaders:
+    """
+    Per-request batching of the FK and M2M edges between Customer, Product and Order.
+
+    Every model instance handed to GraphQL is registered under its nesting level
+    in the query. The first time an edge (e.g. ``Order.products``) is resolved for
+    one instance, it is loaded for every sibling on the same level with a single
+    ``IN (...)`` query, so each edge costs one query per level instead of one per row.
+    """
+
+    def __init__(self):
+        self._levels = defaultdict(list)
+        self._level_of = {}
+        self._loaded = {}
+        self._fetches = defaultdict(list)
+
+    def register(self, instances, info):
+        level = tuple(key for key in info.path.as_list() if isinstance(key, str))
+        return self._register(instances, level)
+
+    def _register(self, instances, level):
+        instances = list(instances)
+        for obj in instances:
+            if id(obj) not in self._level_of:
+                self._level_of[id(obj)] = level
+                self._levels[level].append(obj)
+        return instances
+
+    def load(self, instance, field_name):
+        pending = self._pending(instance, field_name)
+        if pending:
+            prefetch_related_objects(pending, field_name)
+            self._register_children(pending, field_name)
+        return self._result(instance, field_name)
+
+    async def aload(self, instance, field_name):
+        """``load`` for async resolvers, through ``aprefetch_related_objects``."""
+        pending = self._pending(instance, field_name)
+        key = (self._level_of[id(instance)], field_name)
+        if pending:
+            self._fetches[key].append(asyncio.ensure_future(self._afetch(pending, field_name)))
+        # Siblings resolving concurrently wait for the same batch query
+        await asyncio.gather(*self._fetches[key])
+        return self._result(instance, field_name)
+
+    async def _afetch(self, pending, field_name):
+        await aprefetch_related_objects(pending, field_name)
+        self._register_children(pending, field_name)
+
+    def _pending(self, instance, field_name):
+        # Instances that did not come from a list (mutation payloads, node lookups)
+        # are batched with the other stray instances of their model
+        level = self._level_of.get(id(instance), (instance._meta.label,))
+        self._register([instance], level)
+
+        # Only instances registered since the last load of this edge need fetching
+        batch = self._levels[level]
+        done = self._loaded.get((level, field_name), 0)
+        self._loaded[(level, field_name)] = len(batch)
+        return batch[done:]
+
+    def _register_children(self, pending, field_name):
+        # Children become the batch for the next nesting level
+        child_level = self._level_of[id(pending[0])] + (field_name,)
+        for obj in pending:
+            self._register(self._related(obj, field_name), child_level)
+
+    def _result(self, instance, field_name):
+        related = self._related(instance, field_name)
+        if instance._meta.get_field(field_name).many_to_one:
+            return related[0]
+        return related
+
+    @staticmethod
+    def _related(instance, field_name):
+        if instance._meta.get_field(field_name).many_to_one:
+            return [getattr(instance, field_name)]
+        return list(getattr(instance, field_name).all())
+
+
+def get_loaders(info):
+    """Return the loaders bound to the current request, creating them on first use."""
+    context = info.context
+    loaders = getattr(context, "loaders", None)
+    if loaders is None:
+        loaders = Loaders()
+        if context is not None:
+            context.loaders = loaders
+    return loaders
+
+
+def load_related(field_name):
+    """Build a resolver that reads ``field_name`` through the request's loaders."""
+
+    def resolver(root, info, **kwargs):
+        # Filtered edges still need the database; only plain edges are batched
+        if any(value is not None for key, value in kwargs.items() if key not in PAGING_ARGS):
+            return getattr(root, field_name).all()
+        if is_async():
+            return get_loaders(info).aload(root, field_name)
+        return get_loaders(info).load(root, field_name)
+
+    return resolver
+
+
+def load_list(queryset, info):
+    """Evaluate a root list and register its rows with the loaders (awaitable on an event loop)."""
+    loaders = get_loaders(info)
+    if is_async():
+        async def evaluate():
+            return loaders.register([obj async for obj in queryset], info)
+        return evaluate()
+    return loaders.register(queryset, info)
+
+
+def load_node(cls, info, id):
+    """``DjangoObjectType.get_node`` that reads through the async ORM on an event loop."""
+    queryset = cls.get_queryset(cls._meta.model.objects, info).filter(pk=id)
+    if is_async():
+        return queryset.afirst()
+    return queryset.first()
+
+
+
+class BatchedConnectionField(DjangoFilterConnectionField):
+    """
+    DjangoFilterConnectionField that accepts lists from the loaders and
+    registers every node it returns, so nested edges are batched too.
+    """
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        if isinstance(iterable, list):
+            return iterable
+        return super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager, queryset_resolver,
+                            max_limit, enforce_first_or_last, root, info, **args):
+        if is_async():
+            return cls.aconnection_resolver(
+                resolver, connection, default_manager, queryset_resolver,
+                max_limit, enforce_first_or_last, root, info, **args
+            )
+        result = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        get_loaders(info).register((edge.node for edge in result.edges), info)
+        return result
+
+    @classmethod
+    async def aconnection_resolver(cls, resolver, connection, default_manager, queryset_resolver,
+                                   max_limit, enforce_first_or_last, root, info, **args):
+        # Await the resolver (e.g. Loaders.aload), then page its value as usual
+        iterable = resolver(root, info, **args)
+        if isawaitable(iterable):
+            iterable = await iterable
+        result = super().connection_resolver(
+            lambda root, info, **args: iterable, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        if isawaitable(result):
+            result = await result
+        get_loaders(info).register((edge.node for edge in result.edges), info)
+        return result
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        if is_async() and isinstance(iterable, QuerySet):
+            return cls.aresolve_connection(connection, args, iterable, max_limit=max_limit)
+        return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
+
+    @classmethod
+    async def aresolve_connection(cls, connection, args, iterable, max_limit=None):
+        # Offset paging (COUNT then slice) has no async ORM path; run it on the request's DB thread
+        return await sync_to_async(super().resolve_connection)(connection, args, iterable, max_limit=max_limit)
@@ -0,0 +1,83 @@
+import json
+import time
+import asyncio
+import statistics
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from alx_backend_graphql.asgi import application
+
+
+
+QUERY = """
+query {
+    allProducts(first: 20) { edges { node { name price stock } } }
+    allOrders(first: 20) { edges { node { totalAmount customer { email } } } }
+    totalCustomers
+    totalOrders
+}
+"""
+
+
+
+async def post(path, body):
+    # One HTTP request straight through the ASGI application, no server or sockets
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 50000), "server": ("localhost", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # The handler listens for a disconnect until the response is sent
+        await asyncio.Future()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+async def load(path, clients, requests_per_client):
+    body = json.dumps({"query": QUERY}).encode()
+    latencies = []
+
+    async def client():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            status = await post(path, body)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert status == 200, status
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - start, latencies
+
+
+
+class Command(BaseCommand):
+    help = "Load-test the sync and async GraphQL views through the ASGI application with many concurrent clients"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, nargs="+", default=[100, 500, 1000])
+        parser.add_argument("--requests", type=int, default=2, help="Requests per client")
+
+    def handle(self, *args, **options):
+        # Measure execution, not the response cache
+        with override_settings(CRM_RESPONSE_CACHE=None):
+            for clients in options["clients"]:
+                for label, path in (("sync", "/graphql"), ("async", "/graphql/async")):
+                    elapsed, latencies = asyncio.run(load(path, clients, options["requests"]))
+                    latencies.sort()
+                    self.stdout.write(
+                        f"{label:<6} {clients:>5} clients  {len(latencies) / elapsed:8.1f} req/s  "
+                        f"p50 {statistics.median(latencies):8.1f} ms  "
+                        f"p99 {latencies[int(len(latencies) * 0.99) - 1]:8.1f} ms"
+                    )
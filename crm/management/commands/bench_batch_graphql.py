@@ -0,0 +1,113 @@
+import json
+import time
+import uuid
+import statistics
+import urllib.request
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from crm.models import Customer
+
+
+
+# One integration sync cycle: small lookups and a few writes
+READS = [
+    '{ allCustomers(first: 5, email: "customer1") { edges { node { name email } } } }',
+    "{ allProducts(first: 5, lowStock: true) { edges { node { name stock } } } }",
+    "{ allOrders(first: 5) { edges { node { totalAmount customer { email } } } } }",
+    "{ totalOrders }",
+]
+
+CREATE_CUSTOMER = """
+mutation($input: CustomerInput!) { createCustomer(input: $input) { customer { id } errors { field } } }
+"""
+
+# Created customers are deleted after the run
+EMAIL_PREFIX = "bench-batch-"
+
+# Every WRITE_EVERY-th operation of a cycle is a createCustomer
+WRITE_EVERY = 5
+
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def operations(count):
+    ops = []
+    for i in range(count):
+        if i % WRITE_EVERY == WRITE_EVERY - 1:
+            email = f"{EMAIL_PREFIX}{uuid.uuid4().hex[:12]}@example.com"
+            ops.append({"query": CREATE_CUSTOMER, "variables": {"input": {"name": "Bench", "email": email}}})
+        else:
+            ops.append({"query": READS[i % len(READS)]})
+    return ops
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare one sync cycle of GraphQL operations sent as separate requests with the same "
+        "operations sent as one batch (a JSON array), plain and ?atomic=1"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operations", type=int, nargs="+", default=[10, 25, 50], help="Operations per cycle")
+        parser.add_argument("--repeat", type=int, default=20, help="Cycles per mode")
+        parser.add_argument("--url", help="POST to a running server (e.g. http://localhost:8000/graphql) "
+                                          "instead of the in-process WSGI handler")
+
+    def handle(self, *args, **options):
+        post = self.http_post(options["url"]) if options["url"] else self.client_post()
+        modes = {
+            "separate": lambda ops: [post("", op) for op in ops],
+            "batch": lambda ops: [post("", ops)],
+            "atomic": lambda ops: [post("?atomic=1", ops)],
+        }
+        try:
+            # Measure execution, not the response cache
+            with override_settings(CRM_RESPONSE_CACHE=None):
+                for count in options["operations"]:
+                    baseline = None
+                    for mode, run in modes.items():
+                        latencies = []
+                        for _ in range(options["repeat"]):
+                            ops = operations(count)
+                            start = time.perf_counter()
+                            statuses = run(ops)
+                            latencies.append((time.perf_counter() - start) * 1000)
+                            if any(status != 200 for status in statuses):
+                                raise CommandError(f"{mode}: HTTP {statuses}")
+                        latencies.sort()
+                        p50 = statistics.median(latencies)
+                        baseline = baseline or p50
+                        self.stdout.write(
+                            f"{mode:<9} {count:>3} ops  {len(statuses):>3} requests  "
+                            f"p50 {p50:8.1f} ms  p99 {percentile(latencies, 0.99):8.1f} ms  "
+                            f"{count / p50 * 1000:8.0f} ops/s  {baseline / p50:5.1f}x"
+                        )
+        finally:
+            Customer.objects.filter(email__startswith=EMAIL_PREFIX).delete()
+
+    @staticmethod
+    def client_post():
+        # Through the whole WSGI handler and middleware; each request opens and closes its connection
+        client = Client()
+
+        def post(query_string, body):
+            return client.post("/graphql" + query_string, body, content_type="application/json").status_code
+
+        return post
+
+    @staticmethod
+    def http_post(url):
+        def post(query_string, body):
+            request = urllib.request.Request(
+                url + query_string, json.dumps(body).encode(), {"Content-Type": "application/json"}
+            )
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+
+        return post
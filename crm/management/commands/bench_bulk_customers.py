@@ -0,0 +1,33 @@
+
+
+import time
+from types import SimpleNamespace
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+from django.test.utils import CaptureQueriesContext
+from crm.bulk import bulk_create_customers
+
+
+
+class Command(BaseCommand):
+    help = "Time bulk_create_customers at several batch sizes (changes are rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+
+    def handle(self, *args, **options):
+        for size in options["sizes"]:
+            inputs = [
+                SimpleNamespace(name=f"Bench {i}", email=f"bench{i}@example.com", phone="123-456-7890")
+                for i in range(size)
+            ]
+            with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                created, errors = bulk_create_customers(inputs)
+                elapsed = time.perf_counter() - start
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f"{size:>7} rows: {elapsed:.2f}s, {len(created) / elapsed:,.0f} rows/s, "
+                f"{len(queries)} queries, {len(errors)} errors"
+            )
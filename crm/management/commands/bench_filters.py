@@ -0,0 +1,47 @@
+
+
+import time
+import statistics
+from datetime import timedelta
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the query plan and latency of each CustomerFilter/ProductFilter/OrderFilter "
+        "predicate against the current database. Run it before and after "
+        "'migrate crm 0003' to compare plans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--no-plans", action="store_true", help="Only print latencies")
+
+    def cases(self):
+        week_ago = (timezone.now() - timedelta(days=7)).date()
+        return [
+            ("orders by date range", OrderFilter({"order_date__gte": week_ago}).qs.order_by("order_date", "id")),
+            ("orders by total", OrderFilter({"total_amount__gte": 500}).qs),
+            ("products low_stock", ProductFilter({"low_stock": True}).qs.order_by("id")),
+            ("products by price", ProductFilter({"price__gte": 10, "price__lte": 20}).qs),
+            ("products by stock", ProductFilter({"stock__lte": 5}).qs),
+            ("customers by phone prefix", CustomerFilter({"phone_pattern": "+1"}).qs),
+        ]
+
+    def handle(self, *args, **options):
+        for label, queryset in self.cases():
+            page = queryset[:50]
+            timings = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                list(page)
+                queryset.count()
+                timings.append((time.perf_counter() - start) * 1000)
+
+            self.stdout.write(f"{label}: median {statistics.median(timings):.1f} ms, "
+                              f"max {max(timings):.1f} ms (first page + count)")
+            if not options["no_plans"]:
+                self.stdout.write("    " + page.explain().replace("\n", "\n    "))
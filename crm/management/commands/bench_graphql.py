@@ -0,0 +1,173 @@
+import json
+import time
+import statistics
+from datetime import timedelta
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from crm.models import Customer, Product, Order
+from crm.views import CachedGraphQLView
+
+
+
+# Tracked results of the last accepted run, compared against with --compare
+BASELINE_FILE = Path(__file__).resolve().parents[2] / "benchmarks" / "baseline.json"
+
+CONNECTION_QUERY = """
+query {
+    allCustomers(first: 20) { edges { node { name
+        orders(first: 5) { edges { node { totalAmount products(first: 5) { edges { node { name price } } } } } }
+    } } }
+}
+"""
+
+BULK_CUSTOMERS = """
+mutation($inputs: [CustomerInput]!) { bulkCreateCustomers(inputs: $inputs) { success errors { field } } }
+"""
+
+BULK_ORDERS = """
+mutation($inputs: [OrderInput]!) { bulkCreateOrders(inputs: $inputs) { success errors { field } } }
+"""
+
+CREATE_ORDER = """
+mutation($input: OrderInput!) { createOrder(input: $input) { success order { id totalAmount } } }
+"""
+
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay representative GraphQL operations (filters, connections, reports, bulk mutations) "
+        "through the view and report p50/p99 latency and SQL query counts. Mutations are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--only", nargs="+", help="Run only these operations")
+        parser.add_argument("--save", nargs="?", const=str(BASELINE_FILE), help="Write the results as the baseline")
+        parser.add_argument("--compare", nargs="?", const=str(BASELINE_FILE), help="Compare with a saved baseline")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Allowed p50 slowdown against the baseline before --compare fails")
+
+    def operations(self):
+        month_ago = (timezone.now() - timedelta(days=30)).date().isoformat()
+        today = timezone.localdate().isoformat()
+        customer_ids = list(Customer.objects.order_by("pk").values_list("pk", flat=True)[:50])
+        product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True)[:20])
+        if not customer_ids or not product_ids:
+            raise CommandError("Seed the database first, e.g. manage.py seed_crm")
+
+        def order_inputs(n):
+            return [
+                {"customerId": customer_ids[i % len(customer_ids)],
+                 "productIds": [product_ids[(i + k) % len(product_ids)] for k in range(3)]}
+                for i in range(n)
+            ]
+
+        # name -> (query, variables(iteration), mutation?)
+        return {
+            "filter: orders by total": (
+                "{ allOrders(first: 50, totalAmount_Gte: 500) { totalCount edges { node { id totalAmount } } } }",
+                lambda i: None, False),
+            "filter: orders this month": (
+                f'{{ allOrders(first: 50, orderDate_Gte: "{month_ago}") {{ edges {{ node {{ id orderDate }} }} }} }}',
+                lambda i: None, False),
+            "filter: customer search": (
+                '{ allCustomers(first: 20, name: "smith") { edges { node { name email } } } }',
+                lambda i: None, False),
+            "filter: low stock": (
+                "{ allProducts(first: 50, lowStock: true) { totalCount edges { node { name stock } } } }",
+                lambda i: None, False),
+            "connection: nested": (CONNECTION_QUERY, lambda i: None, False),
+            "connection: last page": (
+                "{ allOrders(last: 50) { edges { cursor node { id customer { name } } } } }",
+                lambda i: None, False),
+            "report": (
+                f'{{ totalCustomers totalOrders totalRevenue monthRevenue: totalRevenue(orderDate_Gte: "{month_ago}") }}',
+                lambda i: None, False),
+            "report: salesByDay 30 days": (
+                f'{{ salesByDay(from: "{month_ago}", to: "{today}") {{ day orders customers revenue }} }}',
+                lambda i: None, False),
+            "report: topProducts 30 days": (
+                f'{{ topProducts(n: 10, from: "{month_ago}", to: "{today}") {{ product {{ name }} orders revenue }} }}',
+                lambda i: None, False),
+            "mutation: bulkCreateCustomers x100": (
+                BULK_CUSTOMERS,
+                lambda i: {"inputs": [{"name": f"Bench {n}", "email": f"bench.{i}.{n}@example.com"} for n in range(100)]},
+                True),
+            "mutation: bulkCreateOrders x50": (BULK_ORDERS, lambda i: {"inputs": order_inputs(50)}, True),
+            "mutation: createOrder": (CREATE_ORDER, lambda i: {"input": order_inputs(1)[0]}, True),
+        }
+
+    def run(self, view, factory, query, variables, mutation):
+        body = json.dumps({"query": query, "variables": variables})
+        request = factory.post("/graphql", body, content_type="application/json")
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            start = time.perf_counter()
+            response = view(request)
+            elapsed = (time.perf_counter() - start) * 1000
+            if mutation:
+                transaction.set_rollback(True)
+        result = json.loads(response.content)
+        if response.status_code != 200 or result.get("errors"):
+            raise CommandError(f"{query.split()[0]} failed: {response.content[:300]!r}")
+        return elapsed, len(queries.captured_queries)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        view = CachedGraphQLView.as_view()
+        operations = self.operations()
+        if options["only"]:
+            operations = {name: operations[name] for name in options["only"]}
+
+        results = {}
+        # Measure execution: no response cache, no tracing
+        with override_settings(CRM_RESPONSE_CACHE=None, CRM_TRACE_SAMPLE_RATE=0):
+            for name, (query, variables, mutation) in operations.items():
+                self.run(view, factory, query, variables(-1), mutation)  # warm up
+                timings, counts = [], set()
+                for i in range(options["repeat"]):
+                    elapsed, count = self.run(view, factory, query, variables(i), mutation)
+                    timings.append(elapsed)
+                    counts.add(count)
+                timings.sort()
+                results[name] = {
+                    "p50_ms": round(statistics.median(timings), 2),
+                    "p99_ms": round(percentile(timings, 0.99), 2),
+                    "queries": max(counts),
+                }
+                self.stdout.write(f"{name:<36} p50 {results[name]['p50_ms']:8.2f} ms  "
+                                  f"p99 {results[name]['p99_ms']:8.2f} ms  {results[name]['queries']:>3} queries")
+
+        dataset = {model.__name__.lower() + "s": model.objects.count() for model in (Customer, Product, Order)}
+        if options["compare"]:
+            self.compare(json.loads(Path(options["compare"]).read_text()), results, options["tolerance"])
+        if options["save"]:
+            path = Path(options["save"])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({"dataset": dataset, "repeat": options["repeat"], "operations": results},
+                                       indent=2) + "\n")
+            self.stdout.write(f"Baseline written to {path}")
+
+    def compare(self, baseline, results, tolerance):
+        failures = []
+        for name, result in results.items():
+            before = baseline["operations"].get(name)
+            if before is None:
+                continue
+            change = result["p50_ms"] / before["p50_ms"] - 1
+            self.stdout.write(f"{name:<36} p50 {change:+7.1%}  queries {before['queries']} -> {result['queries']}")
+            if change > tolerance:
+                failures.append(f"{name}: p50 {before['p50_ms']} -> {result['p50_ms']} ms")
+            if result["queries"] > before["queries"]:
+                failures.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+        if failures:
+            raise CommandError("Regressions against the baseline:\n" + "\n".join(failures))
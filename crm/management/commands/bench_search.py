@@ -0,0 +1,43 @@
+
+
+import time
+import statistics
+from django.core.management.base import BaseCommand
+from crm.models import Customer
+from crm.search import SearchBackend, SQLiteFTSBackend, NgramBackend, fts_available
+
+
+
+class Command(BaseCommand):
+    help = "Compare the crm.search backends on Customer name/email substring searches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--terms", nargs="+", default=["name:smith", "name:ann", "email:@example", "name:zzqx"])
+        parser.add_argument("--ngram", action="store_true", help="Also build and time the in-process n-gram index")
+
+    def handle(self, *args, **options):
+        backends = [("icontains", SearchBackend())]
+        if fts_available():
+            backends.append(("fts5", SQLiteFTSBackend()))
+        if options["ngram"]:
+            backend = NgramBackend()
+            start = time.perf_counter()
+            for field in ("name", "email"):
+                backend._index(Customer, field)
+            self.stdout.write(f"n-gram index built in {time.perf_counter() - start:.1f}s")
+            backends.append(("ngram", backend))
+
+        self.stdout.write(f"{Customer.objects.count():,} customers")
+        for term in options["terms"]:
+            field, value = term.split(":", 1)
+            for label, backend in backends:
+                queryset = backend.filter(Customer.objects.all(), field, value)
+                timings = []
+                for _ in range(options["repeat"]):
+                    start = time.perf_counter()
+                    hits = queryset.count()
+                    list(queryset.order_by("pk")[:50])
+                    timings.append((time.perf_counter() - start) * 1000)
+                self.stdout.write(f"{term:<16} {label:<10} {hits:>9,} hits  "
+                                  f"median {statistics.median(timings):8.1f} ms (count + first page)")
@@ -0,0 +1,125 @@
+import os
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+import statistics
+import multiprocessing
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def _setup(path, tuned):
+    # Runs first in every worker process: settings read CRM_SQLITE_TUNED on import
+    os.environ["CRM_SQLITE_TUNED"] = "1" if tuned else "0"
+    import django
+    django.setup()
+    from django.conf import settings
+    settings.DATABASES["default"]["NAME"] = path
+
+
+def _work(args):
+    seconds, write_ratio, seed = args
+    from django.db import close_old_connections
+    from django.db.utils import OperationalError
+    from crm.bulk import ingest_orders
+    from crm.models import Customer, Product, Order
+
+    rng = random.Random(seed)
+    customer_ids = list(Customer.objects.values_list("pk", flat=True)[:1000])
+    product_ids = list(Product.objects.values_list("pk", flat=True)[:1000])
+    close_old_connections()
+
+    reads = writes = locked = 0
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        # One simulated request: the connection is closed at the end unless CONN_MAX_AGE keeps it
+        start = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                ingest_orders([(rng.choice(customer_ids), rng.sample(product_ids, min(3, len(product_ids))))])
+                writes += 1
+            else:
+                list(Order.objects.filter(customer_id=rng.choice(customer_ids))
+                     .order_by("-order_date").values("pk", "total_amount")[:20])
+                reads += 1
+        except OperationalError:
+            locked += 1
+        finally:
+            close_old_connections()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return reads, writes, locked, latencies
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent read/write workers in separate processes against copies of the SQLite "
+        "database, with and without CRM_SQLITE_TUNED, and report throughput per process count"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+        parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each run")
+        parser.add_argument("--write-ratio", type=float, default=0.2, help="Share of requests that create an order")
+        parser.add_argument("--modes", nargs="+", choices=["default", "tuned"], default=["default", "tuned"])
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("bench_sqlite needs the sqlite3 backend")
+        from crm.models import Customer, Product
+        if not Customer.objects.exists() or not Product.objects.exists():
+            raise CommandError("Seed the database first, e.g. manage.py seed_crm")
+        source = str(connection.settings_dict["NAME"])
+        connection.close()
+
+        workdir = tempfile.mkdtemp(prefix="bench_sqlite_")
+        try:
+            baseline = {}
+            for mode in options["modes"]:
+                for processes in options["processes"]:
+                    path = self.copy(source, os.path.join(workdir, f"{mode}-{processes}.sqlite3"))
+                    result = self.run(path, mode == "tuned", processes, options)
+                    base = baseline.setdefault(processes, result["ops"])
+                    self.stdout.write(
+                        f"{mode:<8} {processes:>2} procs  {result['ops']:8.0f} req/s "
+                        f"({result['reads']:6.0f} reads/s {result['writes']:6.0f} writes/s)  "
+                        f"p50 {result['p50']:6.2f} ms  p99 {result['p99']:7.2f} ms  "
+                        f"{result['locked']:>4} locked  {(result['ops'] / base - 1) * 100:+6.1f}% vs {options['modes'][0]}"
+                    )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    @staticmethod
+    def copy(source, path):
+        # Online backup, then back to the rollback journal so every mode starts from the same file
+        with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+            dst.execute("PRAGMA journal_mode = DELETE")
+        return path
+
+    def run(self, path, tuned, processes, options):
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(processes, initializer=_setup, initargs=(path, tuned)) as pool:
+            jobs = [(options["seconds"], options["write_ratio"], n) for n in range(processes)]
+            results = pool.map(_work, jobs)
+
+        seconds = options["seconds"]
+        latencies = sorted(latency for *_, worker in results for latency in worker)
+        reads = sum(result[0] for result in results)
+        writes = sum(result[1] for result in results)
+        return {
+            "ops": (reads + writes) / seconds,
+            "reads": reads / seconds,
+            "writes": writes / seconds,
+            "locked": sum(result[2] for result in results),
+            "p50": statistics.median(latencies) if latencies else 0,
+            "p99": percentile(latencies, 0.99) if latencies else 0,
+        }
@@ -0,0 +1,53 @@
+import json
+import time
+import statistics
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from crm.views import CachedGraphQLView
+from crm.tracing import metrics
+
+
+
+QUERY = """
+query {
+    allOrders(first: 50) { totalCount edges { node { totalAmount customer { name } products { edges { node { name } } } } } }
+    totalRevenue
+}
+"""
+
+
+
+class Command(BaseCommand):
+    help = "Measure the per-request overhead of the tracing middleware at several sample rates"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--rates", type=float, nargs="+", default=[0.0, 0.1, 1.0])
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        body = json.dumps({"query": QUERY})
+        runs = [("no middleware", CachedGraphQLView.as_view(middleware=[]), 0.0)]
+        runs += [(f"sample {rate:g}", CachedGraphQLView.as_view(), rate) for rate in options["rates"]]
+
+        baseline = None
+        # Measure execution, not the response cache
+        with override_settings(CRM_RESPONSE_CACHE=None):
+            for label, view, rate in runs:
+                with override_settings(CRM_TRACE_SAMPLE_RATE=rate):
+                    view(factory.post("/graphql", body, content_type="application/json"))  # warm up
+                    latencies = []
+                    for _ in range(options["requests"]):
+                        request = factory.post("/graphql", body, content_type="application/json")
+                        start = time.perf_counter()
+                        response = view(request)
+                        latencies.append((time.perf_counter() - start) * 1000)
+                        assert response.status_code == 200, response.content
+                mean = statistics.mean(latencies)
+                baseline = baseline or mean
+                self.stdout.write(
+                    f"{label:<14} mean {mean:7.2f} ms  p50 {statistics.median(latencies):7.2f} ms  "
+                    f"overhead {(mean / baseline - 1) * 100:+6.1f}%"
+                )
+        self.stdout.write(f"{metrics.snapshot()['traces']} operations traced")
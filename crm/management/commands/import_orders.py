@@ -0,0 +1,69 @@
+import csv
+import sys
+import itertools
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from crm.bulk import BULK_BATCH_SIZE, bulk_create_orders
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Import orders from a CSV file with customer_id, product_ids (separated by ';' or spaces) "
+        "and an optional ISO order_date column, through the bulk order-ingestion path"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with a header row, or - for stdin")
+        parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["path"] == "-":
+            self.load(sys.stdin, options["batch_size"])
+            return
+        with open(options["path"], newline="") as f:
+            self.load(f, options["batch_size"])
+
+    def load(self, f, batch_size):
+        reader = csv.DictReader(f)
+        missing = {"customer_id", "product_ids"} - set(reader.fieldnames or ())
+        if missing:
+            raise CommandError(f"Missing CSV columns: {', '.join(sorted(missing))}")
+
+        created = 0
+        failed = 0
+        # Data rows start on line 2, after the header; every chunk commits on its own
+        for start in itertools.count(0, batch_size):
+            rows = list(itertools.islice(reader, batch_size))
+            if not rows:
+                break
+            inputs, lines, errors = [], [], []
+            for line, row in enumerate(rows, start + 2):
+                try:
+                    inputs.append(self.parse(row))
+                    lines.append(line)
+                except ValueError as e:
+                    errors.append((line, "order_date", str(e)))
+            orders, rejected = bulk_create_orders(inputs, batch_size)
+            errors += [(lines[idx], field, message) for idx, field, message in rejected]
+            created += len(orders)
+            failed += len(errors)
+            for line, field, message in sorted(errors):
+                self.stderr.write(f"line {line}: {field}: {message}")
+
+        self.stdout.write(f"Imported {created} orders, {failed} rows rejected.")
+
+    def parse(self, row):
+        order_date = (row.get("order_date") or "").strip() or None
+        if order_date:
+            parsed = parse_datetime(order_date)
+            if parsed is None:
+                raise ValueError(f"Invalid date {order_date!r}")
+            order_date = parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+        return SimpleNamespace(
+            customer_id=(row["customer_id"] or "").strip(),
+            product_ids=(row["product_ids"] or "").replace(";", " ").split(),
+            order_date=order_date,
+        )
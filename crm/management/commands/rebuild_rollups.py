@@ -0,0 +1,39 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from crm.rollups import REBUILD_CHUNK_DAYS, rebuild
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily sales rollups (per product, per customer) from the orders, "
+        "one transaction per chunk of days. Defaults to the whole order history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--to", dest="end", help="Last day to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--chunk-days", type=int, default=REBUILD_CHUNK_DAYS)
+
+    def handle(self, *args, **options):
+        start, end = (self.date(options[name]) for name in ("start", "end"))
+        if start and end and start > end:
+            raise CommandError("--from is after --to")
+        if options["chunk_days"] < 1:
+            raise CommandError("--chunk-days must be at least 1")
+
+        began = time.perf_counter()
+        days = rebuild(start, end, options["chunk_days"])
+        self.stdout.write(f"Rebuilt {days} days of sales rollups in {time.perf_counter() - began:.1f}s.")
+
+    def date(self, value):
+        if value is None:
+            return None
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+        return day
@@ -0,0 +1,44 @@
+
+
+from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError
+from crm.models import Order
+from crm.response_cache import invalidate
+from crm.aggregates import reconcile
+from crm.rollups import rebuild
+
+
+
+class Command(BaseCommand):
+    help = "Recompute Order.total_amount from Order.products in chunks, or report drift with --check"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--check", action="store_true", help="Only report orders whose total has drifted")
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            drifted = Order.objects.drifted()
+            count = drifted.count()
+            if count:
+                sample = list(drifted.order_by("pk").values_list("pk", flat=True)[:20])
+                raise CommandError(f"{count} orders have a drifted total_amount, e.g. {sample}")
+            self.stdout.write("All order totals are consistent.")
+            return
+
+        updated = 0
+        last_pk = 0
+        while True:
+            ids = list(Order.objects.filter(pk__gt=last_pk).order_by("pk")
+                       .values_list("pk", flat=True)[:options["chunk_size"]])
+            if not ids:
+                break
+            last_pk = ids[-1]
+            with transaction.atomic():
+                updated += Order.objects.filter(pk__in=ids).recompute_totals()
+
+        # The UPDATEs bypass post_save, so refresh the revenue counter, the sales rollups and cached responses explicitly
+        reconcile()
+        rebuild()
+        invalidate(Order)
+        self.stdout.write(f"Recomputed {updated} order totals.")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from crm.aggregates import drifted, reconcile
+from crm.response_cache import invalidate
+from crm.models import Customer, Order
+
+
+
+class Command(BaseCommand):
+    help = "Recompute the report counters (customers, orders, revenue) from the base tables, or report drift with --check"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Only report counters that have drifted")
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            drift = drifted()
+            if drift:
+                raise CommandError("Drifted counters: " + ", ".join(
+                    f"{name} stored={stored} actual={actual}" for name, (stored, actual) in drift.items()
+                ))
+            self.stdout.write("All counters are consistent.")
+            return
+
+        drift = reconcile()
+        for name, (stored, actual) in drift.items():
+            self.stdout.write(f"{name}: {stored} -> {actual}")
+        if drift:
+            invalidate(Customer, Order)
+        self.stdout.write(f"Reconciled {len(drift)} counters.")
@@ -0,0 +1,83 @@
+# Index-backed substring search for crm.search (FTS5 on SQLite, pg_trgm on PostgreSQL)
+
+from django.db import migrations
+
+
+# Kept literal so the migration does not depend on crm.search changing later
+SEARCH_FIELDS = {
+    "crm_customer": ["name", "email"],
+    "crm_product": ["name"],
+}
+
+
+def sqlite_has_trigram_fts(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5'), sqlite_version()")
+        fts5, version = cursor.fetchone()
+    return bool(fts5) and tuple(int(part) for part in version.split(".")[:2]) >= (3, 34)
+
+
+def create_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    execute = schema_editor.execute
+
+    if connection.vendor == "sqlite" and sqlite_has_trigram_fts(connection):
+        for table, columns in SEARCH_FIELDS.items():
+            cols = ", ".join(columns)
+            new = ", ".join(f"new.{column}" for column in columns)
+            old = ", ".join(f"old.{column}" for column in columns)
+            execute(
+                f"CREATE VIRTUAL TABLE {table}_fts USING fts5({cols}, content='{table}', "
+                f"content_rowid='id', tokenize='trigram')"
+            )
+            execute(
+                f"CREATE TRIGGER {table}_fts_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {table}_fts(rowid, {cols}) VALUES (new.id, {new}); END"
+            )
+            execute(
+                f"CREATE TRIGGER {table}_fts_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {table}_fts({table}_fts, rowid, {cols}) VALUES ('delete', old.id, {old}); END"
+            )
+            execute(
+                f"CREATE TRIGGER {table}_fts_au AFTER UPDATE ON {table} BEGIN "
+                f"INSERT INTO {table}_fts({table}_fts, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+                f"INSERT INTO {table}_fts(rowid, {cols}) VALUES (new.id, {new}); END"
+            )
+            execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+    elif connection.vendor == "postgresql":
+        execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table, columns in SEARCH_FIELDS.items():
+            for column in columns:
+                # Matches the UPPER(col::text) LIKE UPPER(...) that icontains compiles to
+                execute(
+                    f"CREATE INDEX {table}_{column}_trgm ON {table} "
+                    f"USING gin ((UPPER({column}::text)) gin_trgm_ops)"
+                )
+
+
+def drop_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    execute = schema_editor.execute
+
+    if connection.vendor == "sqlite":
+        for table in SEARCH_FIELDS:
+            for suffix in ("ai", "ad", "au"):
+                execute(f"DROP TRIGGER IF EXISTS {table}_fts_{suffix}")
+            execute(f"DROP TABLE IF EXISTS {table}_fts")
+
+    elif connection.vendor == "postgresql":
+        for table, columns in SEARCH_FIELDS.items():
+            for column in columns:
+                execute(f"DROP INDEX IF EXISTS {table}_{column}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_add_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:16
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_counters(apps, schema_editor):
+    # Start from the current totals; crm.signals keeps them up to date afterwards
+    Counter = apps.get_model("crm", "Counter")
+    Customer = apps.get_model("crm", "Customer")
+    Order = apps.get_model("crm", "Order")
+    # The database being migrated, not wherever the router would send these
+    db = schema_editor.connection.alias
+    orders = Order.objects.using(db).aggregate(count=Count("pk"), revenue=Sum("total_amount"))
+    Counter.objects.using(db).bulk_create([
+        Counter(name="customers", value=Customer.objects.using(db).count()),
+        Counter(name="orders", value=orders["count"]),
+        Counter(name="revenue", value=orders["revenue"] or 0),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    # Start from the existing orders; crm.rollups keeps the tables current afterwards
+    Order = apps.get_model("crm", "Order")
+    DailyProductSales = apps.get_model("crm", "DailyProductSales")
+    DailyCustomerSales = apps.get_model("crm", "DailyCustomerSales")
+    db = schema_editor.connection.alias
+    products = (
+        Order.products.through.objects.using(db).annotate(day=TruncDate("order__order_date"))
+        .values("day", "product_id").annotate(count=Count("pk"), total=Sum("product__price")).order_by()
+    )
+    DailyProductSales.objects.using(db).bulk_create((
+        DailyProductSales(day=row["day"], product_id=row["product_id"], orders=row["count"], revenue=row["total"])
+        for row in products.iterator()
+    ), batch_size=1000)
+    customers = (
+        Order.objects.using(db).annotate(day=TruncDate("order_date"))
+        .values("day", "customer_id").annotate(count=Count("pk"), total=Sum("total_amount")).order_by()
+    )
+    DailyCustomerSales.objects.using(db).bulk_create((
+        DailyCustomerSales(day=row["day"], customer_id=row["customer_id"], orders=row["count"], revenue=row["total"])
+        for row in customers.iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_order_date_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCustomerSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='crm.customer')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'customer'), name='crm_daily_customer_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='crm.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'product'), name='crm_daily_product_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.2 on 2026-10-18 22:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_prices(apps, schema_editor):
+    # Existing lines are priced at the products' current prices, what their totals were computed from
+    OrderProduct = apps.get_model("crm", "OrderProduct")
+    Product = apps.get_model("crm", "Product")
+    OrderProduct.objects.using(schema_editor.connection.alias).update(
+        price=Subquery(Product.objects.filter(pk=OuterRef("product_id")).values("price")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_sales_rollups'),
+    ]
+
+    operations = [
+        # Order.products keeps its table; only the model state gains an explicit through model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='OrderProduct',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.order')),
+                        ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.product')),
+                    ],
+                    options={
+                        'db_table': 'crm_order_products',
+                        'unique_together': {('order', 'product')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='products',
+                    field=models.ManyToManyField(related_name='orders', through='crm.OrderProduct', to='crm.product'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(fill_prices, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,11 @@
 
 
 # Create your models here.
+from decimal import Decimal
 from django.db import models
+from django.utils import timezone
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator, RegexValidator
 
 
@@ -18,6 +22,12 @@ class Customer(models.Model):
         )]
     ) 
 
+    class Meta:
+        indexes = [
+            # phone_pattern filter is a prefix match (phone__startswith)
+            models.Index(fields=["phone"], name="crm_customer_phone_idx", opclasses=["varchar_pattern_ops"]),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -28,22 +38,139 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
     stock = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["price"], name="crm_product_price_idx"),
+            models.Index(fields=["stock"], name="crm_product_stock_idx"),
+            # low_stock filter and UpdateLowStockProducts only ever look at stock < 10
+            models.Index(fields=["id"], condition=Q(stock__lt=10), name="crm_product_low_stock_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name} (${self.price})"
 
 
 
+class OrderQuerySet(models.QuerySet):
+    @staticmethod
+    def computed_total():
+        # Sum of the order's line prices, computed by the database
+        total = OrderProduct.objects.filter(order_id=OuterRef("pk")).values("order_id").annotate(
+            total=Sum("price")
+        ).values("total")
+        return Coalesce(
+            Subquery(total), Value(Decimal("0")), output_field=models.DecimalField(max_digits=10, decimal_places=2)
+        )
+
+    def recompute_totals(self):
+        # One UPDATE for the whole queryset, no per-order Python work
+        return self.update(total_amount=self.computed_total())
+
+    def drifted(self):
+        # Orders whose stored total_amount no longer matches their products
+        # (a tolerance absorbs SQLite's floating-point decimal arithmetic)
+        return self.annotate(drift=F("total_amount") - self.computed_total()).filter(
+            Q(drift__gt=Decimal("0.005")) | Q(drift__lt=Decimal("-0.005"))
+        )
+
+
+
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="orders")
-    products = models.ManyToManyField(Product, related_name="orders")
+    products = models.ManyToManyField(Product, related_name="orders", through="OrderProduct")
+    # Denormalized sum of the OrderProduct prices, kept current by crm.signals
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    order_date = models.DateTimeField(auto_now_add=True)
-    
-    def save(self, *args, **kwargs):
-        # Calculate total amount before saving
-        if not self.pk:  # Only on creation
-            self.total_amount = sum(p.price for p in self.products.all())
-        super().save(*args, **kwargs)
+    # Not auto_now_add, so imports and seeding can store the original date with bulk_create
+    order_date = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # order_date range filters and (order_date, id) keyset paging
+            models.Index(fields=["order_date", "id"], name="crm_order_date_id_idx"),
+            models.Index(fields=["total_amount"], name="crm_order_total_idx"),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} by {self.customer.name}"
+
+
+
+class OrderProduct(models.Model):
+    """
+    A product on an order, at its price when it was added.
+
+    ``Order.total_amount`` and the product sales rollup are sums of these
+    prices, so changing a product's price leaves existing orders as they were.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # Copied from Product.price by crm.bulk on insert, and by crm.signals after products.add()
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+
+    class Meta:
+        # The table Django created for the plain ManyToManyField
+        db_table = "crm_order_products"
+        unique_together = [("order", "product")]
+
+    def __str__(self):
+        return f"Order #{self.order_id}: product {self.product_id} at {self.price}"
+
+
+
+class Counter(models.Model):
+    """
+    Running totals behind the report aggregates (customers, orders, revenue).
+
+    Kept current by crm.signals and crm.bulk, so reading a total is a primary
+    key lookup; ``manage.py reconcile_counters`` recomputes them from scratch.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+
+class DailyProductSales(models.Model):
+    """
+    Orders containing a product and their revenue from it, per day.
+
+    One of the sales rollups behind ``salesByDay``/``topProducts``: kept current
+    by crm.rollups on every order write, and rebuilt for a date range with
+    ``manage.py rebuild_rollups``. ``revenue`` sums the OrderProduct prices,
+    the prices the orders were written at, like ``Order.total_amount``; so a
+    product's revenue here and ``salesByDay`` revenue agree after price changes.
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # Upsert target, and the index for day range scans
+            models.UniqueConstraint(fields=["day", "product"], name="crm_daily_product_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} product {self.product_id}: {self.orders} orders, {self.revenue}"
+
+
+
+class DailyCustomerSales(models.Model):
+    """Orders placed by a customer and the sum of their ``total_amount``, per day (see DailyProductSales)."""
+    day = models.DateField()
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="+")
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "customer"], name="crm_daily_customer_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} customer {self.customer_id}: {self.orders} orders, {self.revenue}"
@@ -0,0 +1,102 @@
+
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+from .loaders import PAGING_ARGS
+
+
+
+def optimize(queryset, info):
+    """
+    Narrow ``queryset`` to what the GraphQL selection set in ``info`` actually reads.
+
+    Scalar fields go into ``only()``, foreign keys into ``select_related`` and
+    many-valued relations into ``Prefetch`` objects that are optimized the same
+    way, so nested connections stay constant-query. Connections are unwrapped
+    through ``edges { node { ... } }``.
+    """
+    nodes = _node_selections(info.field_nodes, info.fragments)
+    only, select, prefetch = _plan(queryset.model, nodes, info.fragments)
+    # Ordering columns are read back for keyset cursors
+    only.update(key.lstrip("-") for key in queryset.query.order_by if isinstance(key, str) and "__" not in key)
+    return _apply(queryset, only, select, prefetch)
+
+
+def _apply(queryset, only, select, prefetch):
+    # An empty select_related() would follow every FK
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.only(*only)
+
+
+def _fields(field_nodes, fragments):
+    # Flatten the child fields of field_nodes, expanding fragments
+    for field_node in field_nodes:
+        if field_node.selection_set is None:
+            continue
+        for selection in field_node.selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield selection
+            elif isinstance(selection, InlineFragmentNode):
+                yield from _fields([selection], fragments)
+            elif isinstance(selection, FragmentSpreadNode):
+                yield from _fields([fragments[selection.name.value]], fragments)
+
+
+def _node_selections(field_nodes, fragments):
+    # A connection wraps its objects in edges { node }; a plain list does not
+    children = list(_fields(field_nodes, fragments))
+    edges = [child for child in children if child.name.value == "edges"]
+    if not edges:
+        return field_nodes
+    return [child for child in _fields(edges, fragments) if child.name.value == "node"]
+
+
+def _is_filtered(field_node):
+    # Filtered edges are resolved against the database, so prefetching them is wasted
+    return any(to_snake_case(arg.name.value) not in PAGING_ARGS for arg in field_node.arguments)
+
+
+def _plan(model, field_nodes, fragments, prefix=""):
+    only = {prefix + model._meta.pk.name}
+    select = []
+    prefetch = []
+
+    for child in _fields(field_nodes, fragments):
+        name = to_snake_case(child.name.value)
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+
+        if field.many_to_one:
+            # Follow the FK in the same query and plan its fields under the prefix
+            related_only, related_select, related_prefetch = _plan(
+                field.related_model, [child], fragments, prefix=f"{prefix}{name}__"
+            )
+            only.add(prefix + name)
+            only.update(related_only)
+            select.append(prefix + name)
+            select.extend(related_select)
+            prefetch.extend(related_prefetch)
+
+        elif field.many_to_many or field.one_to_many:
+            if _is_filtered(child):
+                continue
+            nodes = _node_selections([child], fragments)
+            related_only, related_select, related_prefetch = _plan(field.related_model, nodes, fragments)
+            if field.one_to_many:
+                # The reverse FK is needed to attach the rows to their parents
+                related_only.add(field.field.name)
+            queryset = _apply(field.related_model._default_manager.all(),
+                              related_only, related_select, related_prefetch)
+            prefetch.append(Prefetch(prefix + name, queryset=queryset))
+
+        elif field.concrete:
+            only.add(prefix + name)
+
+    return only, select, prefetch
@@ -0,0 +1,204 @@
+
+
+import json
+import datetime
+import base64
+import graphene
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from django.core.serializers.json import DjangoJSONEncoder
+from graphene.relay import PageInfo
+from graphql import GraphQLError
+from .cost import FIELD_COSTS
+from .loaders import BatchedConnectionField, is_async
+
+
+
+KEYSET_PREFIX = "keyset:"
+
+# totalCount runs a COUNT(*) of its own
+FIELD_COSTS[(None, "totalCount")] = 1
+
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds datetimes to milliseconds, which would skip or repeat rows
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CountableConnection(graphene.relay.Connection):
+    """Connection with an optional totalCount; the COUNT(*) only runs when it is selected."""
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(root, info):
+        if isinstance(root.iterable, QuerySet):
+            return root.iterable.acount() if is_async() else root.iterable.count()
+        return len(root.iterable)
+
+
+
+def encode_cursor(values):
+    return base64.b64encode((KEYSET_PREFIX + json.dumps(values, cls=CursorEncoder)).encode()).decode()
+
+
+def invalid_cursor():
+    return GraphQLError("Invalid cursor", extensions={"code": "INVALID_CURSOR"})
+
+
+def decode_cursor(cursor):
+    # None for anything that is not a keyset cursor (e.g. a legacy offset cursor)
+    try:
+        text = base64.b64decode(cursor.encode()).decode()
+    except (ValueError, UnicodeError):
+        return None
+    if not text.startswith(KEYSET_PREFIX):
+        return None
+    try:
+        values = json.loads(text[len(KEYSET_PREFIX):])
+    except ValueError:
+        raise invalid_cursor() from None
+    if not isinstance(values, list):
+        raise invalid_cursor()
+    return values
+
+
+def cursor_values(model, keys, cursor):
+    # The cursor's values as the Python types of the ordering fields, None for a non-keyset cursor
+    values = decode_cursor(cursor)
+    if values is None:
+        return None
+    if len(values) != len(keys):
+        # A cursor of another ordering, e.g. an allCustomers cursor passed to allOrders
+        raise invalid_cursor()
+    fields = [model._meta.pk if key.lstrip("-") == "pk" else model._meta.get_field(key.lstrip("-")) for key in keys]
+    try:
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (TypeError, ValueError, ValidationError):
+        raise invalid_cursor() from None
+
+
+def ordering_keys(queryset):
+    # The queryset's ordering plus pk as a unique tie-breaker, e.g. ["order_date", "pk"]
+    keys = [key for key in queryset.query.order_by if isinstance(key, str)]
+    if len(keys) != len(queryset.query.order_by) or any("__" in key or "?" in key for key in keys):
+        return None
+    names = [key.lstrip("-") for key in keys]
+    pk_name = queryset.model._meta.pk.name
+    if "pk" not in names and pk_name not in names:
+        keys.append("pk")
+    return keys
+
+
+def seek(keys, values, forward):
+    """Q for rows strictly after (or before) ``values`` in ``keys`` order."""
+    condition = Q()
+    for i, key in reversed(list(enumerate(keys))):
+        name = key.lstrip("-")
+        op = "gt" if forward != key.startswith("-") else "lt"
+        step = Q(**{f"{name}__{op}": values[i]})
+        condition = step if i == len(keys) - 1 else step | (Q(**{name: values[i]}) & condition)
+    return condition
+
+
+
+class KeysetConnectionField(BatchedConnectionField):
+    """
+    Relay connection paged by the queryset's ordering columns instead of OFFSET.
+
+    Cursors encode the ordering values of their row (``(order_date, id)`` or
+    ``(id)``), so every page is an index range scan of ``first``/``last`` + 1
+    rows and page 10,000 costs the same as page 1. No COUNT(*) runs unless
+    ``totalCount`` is selected. Offset cursors and the ``offset`` argument fall
+    back to the regular offset pagination.
+    """
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        page = cls.keyset_page(args, iterable, max_limit)
+        if page is None:
+            return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
+        if is_async():
+            return cls.aresolve_page(connection, page, iterable)
+        return cls.build_connection(connection, page, list(page["queryset"]), iterable)
+
+    @classmethod
+    async def aresolve_page(cls, connection, page, iterable):
+        rows = [row async for row in page["queryset"]]
+        return cls.build_connection(connection, page, rows, iterable)
+
+    @staticmethod
+    def keyset_page(args, iterable, max_limit):
+        # The query for one page (fetching one extra row to detect more pages),
+        # or None when the request needs offset pagination instead
+        after, before = args.get("after"), args.get("before")
+        keys = ordering_keys(iterable) if isinstance(iterable, QuerySet) else None
+        if keys is None:
+            return None
+        after_values = cursor_values(iterable.model, keys, after) if after else None
+        before_values = cursor_values(iterable.model, keys, before) if before else None
+        if args.get("offset") or (after and after_values is None) or (before and before_values is None):
+            return None
+
+        first, last = args.get("first"), args.get("last")
+        for name, value in (("first", first), ("last", last)):
+            if value is not None and value < 0:
+                # As graphql-relay reports it for offset pagination
+                raise GraphQLError(f"Argument '{name}' must be a non-negative integer.")
+        if first is None and last is None:
+            first = max_limit
+
+        queryset = iterable
+        if after_values is not None:
+            queryset = queryset.filter(seek(keys, after_values, forward=True))
+        if before_values is not None:
+            queryset = queryset.filter(seek(keys, before_values, forward=False))
+
+        backward = last is not None and first is None
+        if backward:
+            # Walk backwards from `before`, then restore the requested order
+            reverse = [key[1:] if key.startswith("-") else f"-{key}" for key in keys]
+            queryset = queryset.order_by(*reverse)[:last + 1]
+        else:
+            queryset = queryset.order_by(*keys)
+            if first is not None:
+                queryset = queryset[:first + 1]
+        return {"queryset": queryset, "keys": keys, "backward": backward,
+                "first": first, "last": last, "after": after, "before": before}
+
+    @staticmethod
+    def build_connection(connection, page, rows, iterable):
+        first, last = page["first"], page["last"]
+        if page["backward"]:
+            has_previous_page, has_next_page = len(rows) > last, page["before"] is not None
+            rows = rows[:last][::-1]
+        else:
+            has_next_page = first is not None and len(rows) > first
+            has_previous_page = page["after"] is not None
+            rows = rows if first is None else rows[:first]
+            if last is not None:
+                # first and last together: Relay takes the tail of the first page
+                rows = rows[-last:] if last else []
+
+        fields = [key.lstrip("-") for key in page["keys"]]
+        edges = [
+            connection.Edge(node=row, cursor=encode_cursor([getattr(row, field) for field in fields]))
+            for row in rows
+        ]
+        result = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous_page,
+                has_next_page=has_next_page,
+            ),
+        )
+        result.iterable = iterable
+        return result
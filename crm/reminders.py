@@ -0,0 +1,134 @@
+
+
+import os
+import json
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import connections
+from django.utils import timezone
+from .models import Order
+
+
+
+logger = logging.getLogger(__name__)
+
+# Orders read per keyset page
+PAGE_SIZE = 1000
+
+# Reminders handed to a worker at a time
+BATCH_SIZE = 100
+
+# Worker threads, and batches allowed in flight before the reader waits
+MAX_WORKERS = 4
+MAX_PENDING = 8
+
+CHECKPOINT_FILE = "/tmp/order_reminders_checkpoint.json"
+
+
+
+def iter_pages(since, after_id=0, page_size=PAGE_SIZE):
+    """
+    Yield lists of ``(order_id, customer_email)`` for orders placed since ``since``.
+
+    Pages are keyset ranges on the primary key (``id > last_id ORDER BY id``),
+    so memory stays at one page and every page is an index range scan.
+    """
+    last_id = after_id
+    while True:
+        page = list(
+            Order.objects.filter(order_date__gte=since, pk__gt=last_id)
+            .order_by("pk")
+            .values_list("pk", "customer__email")[:page_size]
+        )
+        if not page:
+            return
+        yield page
+        last_id = page[-1][0]
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)["last_order_id"]
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def save_checkpoint(last_order_id, path=CHECKPOINT_FILE):
+    # Write then rename, so a crash never leaves a half-written checkpoint
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"last_order_id": last_order_id}, f)
+    os.replace(tmp, path)
+
+
+def log_reminders(batch):
+    """Default sender: one log line per customer."""
+    for email, order_id in batch:
+        logger.info("Reminder: Order %s for %s", order_id, email)
+
+
+def _send(send, batch):
+    try:
+        send(batch)
+    finally:
+        # Worker threads open their own DB connections if the sender queries; close them even
+        # when CONN_MAX_AGE would keep them (close_old_connections() does not)
+        connections.close_all()
+
+
+def send_reminders(send=log_reminders, days=7, checkpoint=CHECKPOINT_FILE, page_size=PAGE_SIZE,
+                   batch_size=BATCH_SIZE, max_workers=MAX_WORKERS, max_pending=MAX_PENDING):
+    """
+    Send one reminder per customer email for the orders of the last ``days`` days.
+
+    Orders are streamed page by page after the checkpointed order id. Each
+    email is reminded once per run, of its first order (lowest id) after the
+    checkpoint, whatever the page and batch sizes; the reminders are handed to
+    ``send`` in batches of ``(email, order_id)`` on a bounded thread pool. The checkpoint moves
+    forward only once every batch up to that order has been sent, so a rerun
+    resumes after the last fully sent order instead of reprocessing the window.
+    Returns ``(orders_read, reminders_sent)``.
+    """
+    since = timezone.now() - timedelta(days=days)
+    last_id = load_checkpoint(checkpoint) if checkpoint else 0
+    reminded = set()
+    orders_read = reminders_sent = 0
+    pending = deque()
+
+    def complete_oldest():
+        future, batch_last_id = pending.popleft()
+        future.result()
+        if checkpoint:
+            save_checkpoint(batch_last_id, checkpoint)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        batch = []
+        for page in iter_pages(since, last_id, page_size):
+            orders_read += len(page)
+            for order_id, email in page:
+                if email in reminded:
+                    continue
+                reminded.add(email)
+                batch.append((email, order_id))
+
+                if len(batch) >= batch_size:
+                    pending.append((pool.submit(_send, send, batch), order_id))
+                    reminders_sent += len(batch)
+                    batch = []
+                    # Bounded: the reader waits instead of queueing the whole window
+                    while len(pending) >= max_pending:
+                        complete_oldest()
+            last_id = page[-1][0]
+
+        if batch:
+            pending.append((pool.submit(_send, send, batch), last_id))
+            reminders_sent += len(batch)
+        while pending:
+            complete_oldest()
+        if checkpoint and orders_read:
+            save_checkpoint(last_id, checkpoint)
+
+    return orders_read, reminders_sent
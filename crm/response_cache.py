@@ -0,0 +1,231 @@
+
+
+import json
+import hashlib
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from graphql import (
+    ExecutionResult, OperationType, TypeInfo, TypeInfoVisitor, Visitor,
+    get_named_type, get_operation_ast, is_abstract_type, print_ast, visit,
+)
+
+
+
+# Cache alias holding responses and tag versions; None turns the response cache off
+RESPONSE_CACHE = None
+
+# Seconds a cached response lives if no write invalidates it first
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Tags for root fields that do not return model types, e.g. {("Query", "totalRevenue"): [Order]}
+FIELD_TAGS = {}
+
+
+
+def cache_alias():
+    return getattr(settings, "CRM_RESPONSE_CACHE", RESPONSE_CACHE)
+
+
+def tag_for(model):
+    return model._meta.label
+
+
+
+def invalidate(*models):
+    """
+    Evict every cached response that read any of ``models``.
+
+    Tags are bumped now, so no later read is served the old data, and again
+    when the surrounding transaction commits, so a response cached by a
+    concurrent reader between the write and the commit is dropped too.
+    """
+    tags = {tag_for(model) for model in models}
+    ResponseCache.bump(tags)
+    transaction.on_commit(lambda: ResponseCache.bump(tags))
+
+
+
+class ResponseCache:
+    """
+    Cache of read-only GraphQL results in the Django cache framework.
+
+    Entries are keyed on the normalized document (its printed AST), the
+    operation name, the variables and the user, and are tagged with the labels
+    of the models the operation reads (e.g. ``crm.Product``). Each tag has a
+    version token in the cache; an entry remembers the tokens it was stored
+    under and is stale as soon as one of them changes, so invalidating a tag is
+    a single cache write however many entries carry it.
+
+    Operations are only cached if every root field maps to models: mutations,
+    subscriptions and unknown root fields always execute.
+
+    Off unless ``CRM_RESPONSE_CACHE`` names a cache alias. That cache must be
+    shared by every process that writes (web workers, Celery workers, cron
+    jobs, management commands), e.g. Redis or Memcached: with a per-process
+    cache such as LocMemCache their invalidations never reach the web
+    workers, which keep serving stale results until the entries expire.
+    """
+
+    key_prefix = "crm:response:"
+    tag_prefix = "crm:tag:"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cache():
+        return caches[cache_alias()]
+
+    @classmethod
+    def bump(cls, tags):
+        if cache_alias() is None:
+            return
+        cls.cache().set_many({cls.tag_prefix + tag: uuid.uuid4().hex for tag in tags}, None)
+
+    def fetch(self, request, schema, cached, operation_name, variables, execute):
+        """Return the cached result of the operation, or run ``execute()`` and cache it."""
+        keys = self.keys(self.user_key(request), schema, cached, operation_name, variables)
+        if keys is None:
+            return execute()
+        key, tag_keys = keys
+
+        cache = self.cache()
+        entry = cache.get(key)
+        if entry is not None:
+            versions, data = entry
+            if cache.get_many(tag_keys) == versions:
+                self.hits += 1
+                return ExecutionResult(data=data)
+        self.misses += 1
+
+        # Read the tag versions before executing, so a write during execution
+        # leaves the stored entry stale instead of caching pre-write data
+        for tag_key in tag_keys:
+            cache.add(tag_key, uuid.uuid4().hex, None)
+        versions = cache.get_many(tag_keys)
+
+        result = execute()
+        if not result.errors:
+            cache.set(key, (versions, result.data), self.timeout())
+        return result
+
+    async def afetch(self, request, schema, cached, operation_name, variables, execute):
+        """``fetch`` for the async view; ``execute()`` returns an awaitable."""
+        keys = self.keys(await self.auser_key(request), schema, cached, operation_name, variables)
+        if keys is None:
+            return await execute()
+        key, tag_keys = keys
+
+        cache = self.cache()
+        entry = await cache.aget(key)
+        if entry is not None:
+            versions, data = entry
+            if await cache.aget_many(tag_keys) == versions:
+                self.hits += 1
+                return ExecutionResult(data=data)
+        self.misses += 1
+
+        for tag_key in tag_keys:
+            await cache.aadd(tag_key, uuid.uuid4().hex, None)
+        versions = await cache.aget_many(tag_keys)
+
+        result = await execute()
+        if not result.errors:
+            await cache.aset(key, (versions, result.data), self.timeout())
+        return result
+
+    def keys(self, user_key, schema, cached, operation_name, variables):
+        # (entry key, tag keys) for a cacheable operation, else None
+        if cache_alias() is None:
+            return None
+        plan = self.plan(schema, cached, operation_name)
+        if plan is None:
+            return None
+        normalized, tags = plan
+        key = self.key_prefix + hashlib.sha256(json.dumps(
+            [normalized, operation_name, variables or {}, user_key],
+            sort_keys=True, default=str,
+        ).encode()).hexdigest()
+        return key, [self.tag_prefix + tag for tag in sorted(tags)]
+
+    @staticmethod
+    def timeout():
+        return getattr(settings, "CRM_RESPONSE_CACHE_TIMEOUT", RESPONSE_CACHE_TIMEOUT)
+
+    @staticmethod
+    def user_key(request):
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return user.pk
+        return None
+
+    @staticmethod
+    async def auser_key(request):
+        # request.user would hit the session store synchronously
+        if not hasattr(request, "auser"):
+            return None
+        user = await request.auser()
+        return user.pk if user.is_authenticated else None
+
+    def plan(self, schema, cached, operation_name):
+        # (normalized document, tags) for a cacheable operation, memoized on the cached document
+        try:
+            return cached.operations[operation_name]
+        except KeyError:
+            pass
+        tags = operation_tags(schema, cached.document, operation_name)
+        plan = None if tags is None else (print_ast(cached.document), tags)
+        cached.operations[operation_name] = plan
+        return plan
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+
+def operation_tags(schema, document, operation_name):
+    """Labels of the models a query operation reads, or None if it must not be cached."""
+    operation = get_operation_ast(document, operation_name)
+    if operation is None or operation.operation != OperationType.QUERY:
+        return None
+
+    type_info = TypeInfo(schema)
+    tags = set()
+    unknown = []
+
+    class TagVisitor(Visitor):
+        def enter_field(self, node, *args):
+            parent, field = type_info.get_parent_type(), type_info.get_field_def()
+            if field is None:
+                return
+            models = _models(schema, get_named_type(field.type))
+            if parent is schema.query_type:
+                models |= set(FIELD_TAGS.get((parent.name, node.name.value), ()))
+                if not models and not node.name.value.startswith("__"):
+                    unknown.append(node.name.value)
+            if node.arguments:
+                # Filters may join to the rows a model points at (e.g. OrderFilter.customer_name)
+                models |= {f.related_model for model in models for f in model._meta.get_fields()
+                           if f.is_relation and f.concrete}
+            tags.update(tag_for(model) for model in models)
+
+    visit(document, TypeInfoVisitor(type_info, TagVisitor()))
+    return None if unknown else tags
+
+
+def _models(schema, named_type):
+    types = schema.get_possible_types(named_type) if is_abstract_type(named_type) else [named_type]
+    models = set()
+    for graphql_type in types:
+        meta = getattr(getattr(graphql_type, "graphene_type", None), "_meta", None)
+        # Connections stand for the model of their nodes
+        node = getattr(meta, "node", None)
+        if node is not None:
+            meta = node._meta
+        model = getattr(meta, "model", None)
+        if model is not None:
+            models.add(model)
+    return models
@@ -0,0 +1,189 @@
+
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from graphene_django.settings import graphene_settings
+from .models import Product, Order, OrderProduct, DailyProductSales, DailyCustomerSales
+from .cost import FIELD_COSTS
+from .response_cache import FIELD_TAGS, invalidate
+
+
+
+# Days rebuilt per transaction by ``rebuild``
+REBUILD_CHUNK_DAYS = 31
+
+# Rollup columns that accumulate; the others are the (day, product|customer) key
+ROLLUP_TOTALS = ("orders", "revenue")
+
+FIELD_TAGS.update({
+    ("Query", "salesByDay"): [Order],
+    ("Query", "topProducts"): [Order, Product],
+})
+
+# One GROUP BY over the rollup rows in the date range (plus the product lookup)
+FIELD_COSTS.update({
+    ("Query", "salesByDay"): 1,
+    ("Query", "topProducts"): 1,
+})
+
+
+
+def _product_rows(orders, sign):
+    # (day, product_id, orders, revenue) per product and day of ``orders``, at the prices the
+    # orders were written at (OrderProduct.price), times ``sign``
+    return (
+        OrderProduct.objects.filter(order__in=orders)
+        .annotate(day=TruncDate("order__order_date")).values("day", "product_id")
+        .annotate(orders=Count("pk") * Value(sign), revenue=Sum("price") * Value(Decimal(sign)))
+        .order_by()
+    )
+
+
+def _customer_rows(orders, sign):
+    # (day, customer_id, orders, revenue) per customer and day of ``orders``, times ``sign``
+    return (
+        orders.annotate(day=TruncDate("order_date")).values("day", "customer_id")
+        .annotate(orders=Count("pk") * Value(sign), revenue=Sum("total_amount") * Value(Decimal(sign)))
+        .order_by()
+    )
+
+
+def _upsert(model, rows):
+    """
+    ``INSERT INTO <rollup> SELECT <rows> ON CONFLICT DO UPDATE`` adding the counts to existing rows.
+
+    The grouped SELECT runs in the database, so a whole batch of orders costs
+    one statement per rollup whatever its size.
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    # SELECT order: the values() fields, then the annotations
+    names = [*rows.query.values_select, *rows.query.annotation_select]
+    columns = [qn(model._meta.get_field(name).column) for name in names]
+    keys = [column for name, column in zip(names, columns) if name not in ROLLUP_TOTALS]
+    totals = [column for name, column in zip(names, columns) if name in ROLLUP_TOTALS]
+    select, params = rows.query.sql_with_params()
+
+    if connection.vendor == "mysql":
+        conflict = "ON DUPLICATE KEY UPDATE " + ", ".join(f"{c} = {c} + VALUES({c})" for c in totals)
+    else:
+        # SQLite 3.24+ and PostgreSQL; the grouped SELECT always has a WHERE, as SQLite's parser needs
+        conflict = f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET " + ", ".join(
+            f"{c} = {table}.{c} + excluded.{c}" for c in totals
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) {select} {conflict}", params)
+
+
+def record(orders, sign=1):
+    """
+    Add (``sign=1``) or remove (``sign=-1``) an Order queryset's contribution to both rollups.
+
+    Two statements however many orders. Changing an order means removing it
+    with its old state and adding it back with the new one (see crm.signals).
+    """
+    _upsert(DailyProductSales, _product_rows(orders, sign))
+    _upsert(DailyCustomerSales, _customer_rows(orders, sign))
+
+
+def _day_start(day):
+    # Rollup days are dates in the current time zone, as TruncDate computes them
+    start = datetime.combine(day, time.min)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+
+def rebuild(start=None, end=None, chunk_days=REBUILD_CHUNK_DAYS):
+    """
+    Recompute both rollups for the days ``start`` to ``end`` (inclusive) from the base tables.
+
+    Works in ``chunk_days`` ranges, each one transaction: delete the rollup
+    rows of those days, then aggregate the orders placed on them with one
+    ``INSERT ... SELECT`` per rollup. The range defaults to the first and last
+    order. Returns the number of days rebuilt.
+    """
+    if start is None or end is None:
+        dates = Order.objects.aggregate(first=Min("order_date"), last=Max("order_date"))
+        if dates["first"] is None:
+            return 0
+        start = start or timezone.localdate(dates["first"])
+        end = end or timezone.localdate(dates["last"])
+
+    day = start
+    while day <= end:
+        last = min(day + timedelta(days=chunk_days - 1), end)
+        orders = Order.objects.filter(
+            order_date__gte=_day_start(day), order_date__lt=_day_start(last + timedelta(days=1))
+        )
+        with transaction.atomic():
+            for model in (DailyProductSales, DailyCustomerSales):
+                model.objects.filter(day__range=(day, last)).delete()
+            record(orders)
+        day = last + timedelta(days=1)
+
+    invalidate(Order)
+    return (end - start).days + 1 if end >= start else 0
+
+
+
+def _limit(n):
+    # Same cap as a connection page, which the cost analysis assumes for lists
+    return max(0, min(n, graphene_settings.RELAY_CONNECTION_MAX_LIMIT))
+
+
+def _daily(rows):
+    return [
+        {"day": row["day"], "orders": row["order_count"], "customers": row["customer_count"],
+         "revenue": Decimal(row["revenue_sum"]).quantize(Decimal("0.01"))}
+        for row in rows
+    ]
+
+
+def _ranked(rows, products):
+    return [
+        {"product": products[row["product_id"]], "orders": row["order_count"],
+         "revenue": Decimal(row["revenue_sum"]).quantize(Decimal("0.01"))}
+        for row in rows if row["product_id"] in products
+    ]
+
+
+def _sales_by_day(start, end):
+    return (
+        DailyCustomerSales.objects.filter(day__range=(start, end), orders__gt=0).values("day")
+        .annotate(order_count=Sum("orders"), customer_count=Count("pk"), revenue_sum=Sum("revenue"))
+        .order_by("day")
+    )
+
+
+def _top_products(n, start, end):
+    return (
+        DailyProductSales.objects.filter(day__range=(start, end), orders__gt=0).values("product_id")
+        .annotate(order_count=Sum("orders"), revenue_sum=Sum("revenue"))
+        .order_by("-revenue_sum", "product_id")[:_limit(n)]
+    )
+
+
+def sales_by_day(start, end):
+    """``[{day, orders, customers, revenue}]`` for each day from ``start`` to ``end`` with orders, from the customer rollup."""
+    return _daily(_sales_by_day(start, end))
+
+
+def top_products(n, start, end):
+    """The ``n`` products with the most revenue from ``start`` to ``end``: ``[{product, orders, revenue}]``."""
+    rows = list(_top_products(n, start, end))
+    return _ranked(rows, Product.objects.in_bulk([row["product_id"] for row in rows]))
+
+
+
+# Async counterparts for the async GraphQL view (Django's async ORM)
+async def asales_by_day(start, end):
+    return _daily([row async for row in _sales_by_day(start, end)])
+
+
+async def atop_products(n, start, end):
+    rows = [row async for row in _top_products(n, start, end)]
+    return _ranked(rows, await Product.objects.ain_bulk([row["product_id"] for row in rows]))
@@ -0,0 +1,99 @@
+
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from graphql import OperationType
+
+
+
+# Alias GraphQL query operations read from, e.g. "replica"; None keeps every read on the primary
+READ_REPLICA = None
+
+# Seconds a client keeps reading from the primary after one of its mutations
+READ_YOUR_WRITES_SECONDS = 5
+
+# Cookie carrying the time until which a client is pinned to the primary
+PIN_COOKIE = "crm_primary_until"
+
+# Database reads are routed to in the current context; set per GraphQL operation
+_read_alias = ContextVar("crm_read_alias", default=None)
+
+
+
+def read_replica():
+    return getattr(settings, "CRM_READ_REPLICA", READ_REPLICA)
+
+
+def read_your_writes_seconds():
+    return getattr(settings, "CRM_READ_YOUR_WRITES_SECONDS", READ_YOUR_WRITES_SECONDS)
+
+
+@contextmanager
+def reading_from(alias):
+    """Route ORM reads made in this context (thread or task) to ``alias``; None leaves them on the primary."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+
+class ReplicaRouter:
+    """
+    Database router sending reads to a replica only inside ``reading_from(alias)``.
+
+    The GraphQL views open that scope for query operations; mutations,
+    management commands, tasks and the admin never do, so they read and write
+    the primary. Writes always go to the primary, even for instances loaded
+    from the replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, read_replica()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+
+def note_write(request):
+    """Pin the rest of ``request`` and, through a cookie, the client's next requests to the primary."""
+    request.primary_pinned = True
+
+
+def is_pinned(request):
+    """True when a replica is configured but ``request`` has to read its own writes from the primary."""
+    if read_replica() is None:
+        return False
+    if getattr(request, "primary_pinned", False):
+        return True
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_database(request, operation_ast):
+    """Alias a GraphQL operation reads from: the replica for queries of unpinned clients, else None."""
+    if operation_ast is None or operation_ast.operation != OperationType.QUERY or is_pinned(request):
+        return None
+    return read_replica()
+
+
+def pin_response(request, response):
+    # Sets the read-your-writes cookie when the request ran a mutation
+    seconds = read_your_writes_seconds()
+    if getattr(request, "primary_pinned", False) and read_replica() is not None and seconds:
+        response.set_cookie(PIN_COOKIE, f"{time.time() + seconds:.3f}", max_age=seconds, httponly=True, samesite="Lax")
+    return response
@@ -8,26 +8,46 @@ from .models import Customer, Product, Order
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 from .filters import CustomerFilter, ProductFilter, OrderFilter
-from graphene_django import DjangoObjectType, DjangoFilterConnectionField
+from graphene_django import DjangoObjectType
+from graphene_django.filter.utils import get_filtering_args_from_filterset
 from crm.models import Product
+from .loaders import BatchedConnectionField, is_async, load_list, load_node, load_related
+from .optimizer import optimize
+from .pagination import CountableConnection, KeysetConnectionField
+from .bulk import bulk_create_customers, bulk_create_products, bulk_create_orders, first_error, restock_low_stock
+from . import aggregates, rollups
 
 
 # --- GraphQL Types ---
+# Relations resolve through the per-request loaders in crm/loaders.py
 class CustomerType(DjangoObjectType):
+    orders = BatchedConnectionField(lambda: OrderNode, required=True)
+
     class Meta:
         model = Customer
         fields = "__all__"
 
+    resolve_orders = load_related("orders")
+
 class ProductType(DjangoObjectType):
+    orders = BatchedConnectionField(lambda: OrderNode, required=True)
+
     class Meta:
         model = Product
         fields = "__all__"
 
+    resolve_orders = load_related("orders")
+
 class OrderType(DjangoObjectType):
+    products = BatchedConnectionField(lambda: ProductNode, required=True)
+
     class Meta:
         model = Order
         fields = "__all__"
 
+    resolve_customer = load_related("customer")
+    resolve_products = load_related("products")
+
         
 
 # --- Input Types for bulk creation ---
@@ -57,6 +77,13 @@ class MutationResult(graphene.Union):
     class Meta:
         types = (CustomerType, ProductType, OrderType, ErrorType)
 
+def row_errors(errors):
+    # (row_index, field, message) tuples from crm.bulk -> ErrorType list
+    return [
+        ErrorType(field=f"{field} (row {idx+1})", messages=[message])
+        for idx, field, message in errors
+    ]
+
 
 
 # --- Mutations ---
@@ -121,47 +148,12 @@ class BulkCreateCustomers(graphene.Mutation):
     @staticmethod
     @transaction.atomic
     def mutate(root, info, inputs):
-        customers = []
-        errors = []
-        success = True
-        
-        for idx, input in enumerate(inputs):
-            try:
-                # Validate phone format if provided
-                if input.phone:
-                    phone_regex = r'^\+?\d{3}[-.\s]?\d{3}[-.\s]?\d{4}$'
-                    if not re.match(phone_regex, input.phone):
-                        raise ValidationError("Invalid phone format")
-                
-                validate_email(input.email)
-                
-                customer = Customer(
-                    name=input.name,
-                    email=input.email,
-                    phone=input.phone or ""
-                )
-                customer.full_clean()
-                customer.save()
-                customers.append(customer)
-                
-            except Exception as e:
-                error_field = "email" if "email" in str(e).lower() else "phone" if "phone" in str(e).lower() else "row"
-                error_msg = str(e)
-                if isinstance(e, ValidationError):
-                    error_msg = list(e.message_dict.values())[0][0]
-                
-                errors.append(
-                    ErrorType(
-                        field=f"{error_field} (row {idx+1})",
-                        messages=[error_msg]
-                    )
-                )
-                success = False
-        
+        customers, errors = bulk_create_customers(inputs)
+
         return BulkCreateCustomers(
             customers=customers,
-            errors=errors,
-            success=success
+            errors=row_errors(errors),
+            success=not errors
         )
 
 class CreateProduct(graphene.Mutation):
@@ -200,6 +192,25 @@ class CreateProduct(graphene.Mutation):
                 success=False
             )
 
+class BulkCreateProducts(graphene.Mutation):
+    class Arguments:
+        inputs = graphene.List(ProductInput, required=True)
+
+    products = graphene.List(ProductType)
+    errors = graphene.List(ErrorType)
+    success = graphene.Boolean()
+
+    @staticmethod
+    def mutate(root, info, inputs):
+        # Each chunk commits on its own, so no outer transaction here
+        products, errors = bulk_create_products(inputs)
+
+        return BulkCreateProducts(
+            products=products,
+            errors=row_errors(errors),
+            success=not errors
+        )
+
 class CreateOrder(graphene.Mutation):
     class Arguments:
         input = OrderInput(required=True)
@@ -212,30 +223,15 @@ class CreateOrder(graphene.Mutation):
     @transaction.atomic
     def mutate(root, info, input):
         try:
-            # Validate customer exists
-            try:
-                customer = Customer.objects.get(pk=input.customer_id)
-            except Customer.DoesNotExist:
-                raise ValidationError("Customer does not exist")
-            
-            # Validate products exist and get them
-            products = []
-            for product_id in input.product_ids:
-                try:
-                    product = Product.objects.get(pk=product_id)
-                    products.append(product)
-                except Product.DoesNotExist:
-                    raise ValidationError(f"Product with ID {product_id} does not exist")
-            
-            if not products:
-                raise ValidationError("At least one product must be specified")
-            
-            # Create order
-            order = Order.objects.create(customer=customer)
-            order.products.set(products)
-            order.save()  # Triggers total_amount calculation
-            
-            return CreateOrder(order=order, success=True)
+            # The bulk path for one row (crm.bulk.ingest_orders): customer and product
+            # lookups, a price SELECT, the order and OrderProduct inserts, a counter
+            # update and two rollup upserts, however many products the order has
+            orders, errors = bulk_create_orders([input])
+            if errors:
+                _, field, message = errors[0]
+                return CreateOrder(errors=ErrorType(field=field, messages=[message]), success=False)
+
+            return CreateOrder(order=orders[0], success=True)
             
         except Exception as e:
             return CreateOrder(
@@ -246,21 +242,45 @@ class CreateOrder(graphene.Mutation):
                 success=False
             )
             
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments:
+        inputs = graphene.List(OrderInput, required=True)
+
+    orders = graphene.List(OrderType)
+    errors = graphene.List(ErrorType)
+    success = graphene.Boolean()
+
+    @staticmethod
+    def mutate(root, info, inputs):
+        # Each chunk commits on its own, so no outer transaction here
+        orders, errors = bulk_create_orders(inputs)
+
+        return BulkCreateOrders(
+            orders=orders,
+            errors=row_errors(errors),
+            success=not errors
+        )
+
 class UpdateLowStockProducts(graphene.Mutation):
     class Arguments:
-        pass  # no arguments needed for this example
+        threshold = graphene.Int(default_value=10)
+        increment = graphene.Int(default_value=10)
 
     updated_products = graphene.List(ProductType)
     message = graphene.String()
+    errors = graphene.List(ErrorType)
 
-    def mutate(self, info):
-        low_stock_products = Product.objects.filter(stock__lt=10)
-        updated = []
-
-        for product in low_stock_products:
-            product.stock += 10  # simulate restocking
-            product.save()
-            updated.append(product)
+    def mutate(self, info, threshold, increment):
+        # Set-based restock: one UPDATE ... SET stock = stock + N per keyset batch
+        try:
+            updated = restock_low_stock(threshold=threshold, increment=increment)
+        except ValidationError as e:
+            field, message = first_error(e)
+            return UpdateLowStockProducts(
+                updated_products=[],
+                message="No products were updated.",
+                errors=[ErrorType(field=field, messages=[message])]
+            )
 
         return UpdateLowStockProducts(
             updated_products=updated,
@@ -269,82 +289,145 @@ class UpdateLowStockProducts(graphene.Mutation):
 
 
 
-"""
-# --- Root Query and Mutation ---
-class Query(graphene.ObjectType):
-    customers = graphene.List(CustomerType)
-    products = graphene.List(ProductType)
-    orders = graphene.List(OrderType)
-
-    def resolve_customers(root, info):
-        return Customer.objects.all()
-
-    def resolve_products(root, info):
-        return Product.objects.all()
-
-    def resolve_orders(root, info):
-        return Order.objects.select_related('customer').prefetch_related('products').all()
-"""
-
-
 class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
+    bulk_create_products = BulkCreateProducts.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
 
 
 
 # Define Node Types with interfaces for Relay and filtering
 class CustomerNode(DjangoObjectType):
+    orders = BatchedConnectionField(lambda: OrderNode, required=True)
+
     class Meta:
         model = Customer
         filterset_class = CustomerFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
+
+    get_node = classmethod(load_node)
+    resolve_orders = load_related("orders")
 
 class ProductNode(DjangoObjectType):
+    orders = BatchedConnectionField(lambda: OrderNode, required=True)
+
     class Meta:
         model = Product
         filterset_class = ProductFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
+
+    get_node = classmethod(load_node)
+    resolve_orders = load_related("orders")
 
 class OrderNode(DjangoObjectType):
+    products = BatchedConnectionField(ProductNode, required=True)
+
     class Meta:
         model = Order
         filterset_class = OrderFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
+
+    get_node = classmethod(load_node)
+    resolve_customer = load_related("customer")
+    resolve_products = load_related("products")
+
+
+
+# Sales analytics rows, read from the daily rollups in crm/rollups.py
+class DailySalesType(graphene.ObjectType):
+    day = graphene.Date(required=True)
+    orders = graphene.Int(required=True)
+    customers = graphene.Int(required=True)
+    revenue = graphene.Decimal(required=True)
+
+class ProductSalesType(graphene.ObjectType):
+    product = graphene.Field(ProductNode, required=True)
+    orders = graphene.Int(required=True)
+    revenue = graphene.Decimal(required=True)
+
+
+
+# Plain root lists return every row; the cost analysis can only estimate them
+UNBOUNDED_LIST = "Unbounded: returns every row. Use all{} instead, which pages."
 
 
 
 # --- Root Query and Mutation ---
 class Query(graphene.ObjectType):
-    customers = graphene.List(CustomerType)
+    customers = graphene.List(CustomerType, deprecation_reason=UNBOUNDED_LIST.format("Customers"))
     customer = graphene.relay.Node.Field(CustomerNode)
-    all_customers = DjangoFilterConnectionField(CustomerNode)
+    all_customers = KeysetConnectionField(CustomerNode)
 
-    products = graphene.List(ProductType)
+    products = graphene.List(ProductType, deprecation_reason=UNBOUNDED_LIST.format("Products"))
     product = graphene.relay.Node.Field(ProductNode)
-    all_products = DjangoFilterConnectionField(ProductNode)
+    all_products = KeysetConnectionField(ProductNode)
 
-    orders = graphene.List(OrderType)
+    orders = graphene.List(OrderType, deprecation_reason=UNBOUNDED_LIST.format("Orders"))
     order = graphene.relay.Node.Field(OrderNode)
-    all_orders = DjangoFilterConnectionField(OrderNode)
+    all_orders = KeysetConnectionField(OrderNode)
+
+    # Report aggregates (crm/aggregates.py): counters when unfiltered, one COUNT/SUM otherwise
+    total_customers = graphene.Int(required=True, **get_filtering_args_from_filterset(CustomerFilter, CustomerNode))
+    total_orders = graphene.Int(required=True, **get_filtering_args_from_filterset(OrderFilter, OrderNode))
+    total_revenue = graphene.Decimal(required=True, **get_filtering_args_from_filterset(OrderFilter, OrderNode))
+
+    # Sales analytics: one GROUP BY over the rollup rows of the date range, however many orders exist
+    sales_by_day = graphene.List(
+        graphene.NonNull(DailySalesType), required=True,
+        from_=graphene.Date(required=True, name="from"), to=graphene.Date(required=True),
+    )
+    top_products = graphene.List(
+        graphene.NonNull(ProductSalesType), required=True,
+        n=graphene.Int(default_value=10), from_=graphene.Date(required=True, name="from"), to=graphene.Date(required=True),
+    )
 
     def resolve_customers(root, info):
-        return Customer.objects.all()
+        return load_list(optimize(Customer.objects.all(), info), info)
 
     def resolve_products(root, info):
-        return Product.objects.all()
+        return load_list(optimize(Product.objects.all(), info), info)
 
     def resolve_orders(root, info):
-        return Order.objects.select_related('customer').prefetch_related('products').all()
+        return load_list(optimize(Order.objects.all(), info), info)
     
     def resolve_all_customers(self, info, **kwargs):
-        return CustomerFilter(kwargs).qs
+        return optimize(CustomerFilter(kwargs).qs.order_by("id"), info)
 
     def resolve_all_products(self, info, **kwargs):
-        return ProductFilter(kwargs).qs
+        return optimize(ProductFilter(kwargs).qs.order_by("id"), info)
 
     def resolve_all_orders(self, info, **kwargs):
-        return OrderFilter(kwargs).qs
\ No newline at end of file
+        # (order_date, id) matches the crm_order_date_id_idx index used for keyset paging
+        return optimize(OrderFilter(kwargs).qs.order_by("order_date", "id"), info)
+
+    def resolve_total_customers(self, info, **kwargs):
+        if is_async():
+            return aggregates.atotal_customers(**kwargs)
+        return aggregates.total_customers(**kwargs)
+
+    def resolve_total_orders(self, info, **kwargs):
+        if is_async():
+            return aggregates.atotal_orders(**kwargs)
+        return aggregates.total_orders(**kwargs)
+
+    def resolve_total_revenue(self, info, **kwargs):
+        if is_async():
+            return aggregates.atotal_revenue(**kwargs)
+        return aggregates.total_revenue(**kwargs)
+
+    def resolve_sales_by_day(self, info, from_, to):
+        if is_async():
+            return rollups.asales_by_day(from_, to)
+        return rollups.sales_by_day(from_, to)
+
+    def resolve_top_products(self, info, n, from_, to):
+        if is_async():
+            return rollups.atop_products(n, from_, to)
+        return rollups.top_products(n, from_, to)
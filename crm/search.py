@@ -0,0 +1,201 @@
+
+
+from functools import lru_cache
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save, post_delete
+from django.utils.module_loading import import_string
+from .models import Customer, Product
+
+
+
+# Text columns served by the search backends; the migration indexes exactly these
+SEARCH_FIELDS = {
+    Customer: ["name", "email"],
+    Product: ["name"],
+}
+
+
+
+class SearchBackend:
+    """Plain ``icontains``; the fallback when no index-backed backend applies."""
+
+    def filter(self, queryset, field_name, value):
+        return queryset.filter(**{f"{field_name}__icontains": value})
+
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """
+    Substring search through the FTS5 trigram tables created by migration 0004.
+
+    The trigram tokenizer needs at least three characters, so shorter terms
+    fall back to ``icontains``.
+    """
+
+    min_length = 3
+
+    def filter(self, queryset, field_name, value):
+        if len(value) < self.min_length:
+            return super().filter(queryset, field_name, value)
+
+        qn = connection.ops.quote_name
+        table = qn(fts_table(queryset.model))
+        column = qn(queryset.model._meta.get_field(field_name).column)
+        # Quote the term so FTS5 treats it as one literal string
+        term = '"' + value.replace('"', '""') + '"'
+        return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {table} WHERE {column} MATCH %s", [term]))
+
+
+
+class PostgresTrigramBackend(SearchBackend):
+    """
+    ``icontains`` on PostgreSQL compiles to ``UPPER(col) LIKE UPPER('%x%')``, which the
+    ``gin_trgm_ops`` expression indexes from migration 0004 serve directly.
+    """
+
+
+
+class NgramBackend(SearchBackend):
+    """
+    In-process trigram index for databases without a native one.
+
+    The index is built on first use and kept current by post_save/post_delete,
+    plus ``index_rows``/``reset_indexes`` for the bulk writes that send no
+    signals, so it only sees writes made by this process; use it for
+    single-process deployments or read-mostly data. Large hit sets fall back
+    to ``icontains``.
+    """
+
+    n = 3
+    max_hits = 10000
+
+    def __init__(self):
+        self._indexes = {}
+
+    def filter(self, queryset, field_name, value):
+        if len(value) < self.n:
+            return super().filter(queryset, field_name, value)
+        pks = self._index(queryset.model, field_name).search(value.lower())
+        if len(pks) > self.max_hits:
+            return super().filter(queryset, field_name, value)
+        return queryset.filter(pk__in=pks)
+
+    def _index(self, model, field_name):
+        key = (model, field_name)
+        if key not in self._indexes:
+            self._indexes[key] = NgramIndex(model, field_name, self.n)
+        return self._indexes[key]
+
+    def add(self, model, instances):
+        # Only indexes already built; the others read the rows when first used
+        instances = list(instances)
+        for (indexed, field_name), index in self._indexes.items():
+            if indexed is model:
+                for instance in instances:
+                    index.add(instance.pk, getattr(instance, field_name))
+
+    def reset(self, *models):
+        for key in [key for key in self._indexes if key[0] in models]:
+            self._indexes.pop(key).disconnect()
+
+
+
+class NgramIndex:
+    def __init__(self, model, field_name, n):
+        self.model = model
+        self.field_name = field_name
+        self.n = n
+        self.texts = {}
+        self.grams = {}
+        for pk, text in model._default_manager.values_list("pk", field_name).iterator(chunk_size=10000):
+            self.add(pk, text)
+        post_save.connect(self._on_save, sender=model, weak=False)
+        post_delete.connect(self._on_delete, sender=model, weak=False)
+
+    def _ngrams(self, text):
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def add(self, pk, text):
+        self.remove(pk)
+        text = (text or "").lower()
+        self.texts[pk] = text
+        for gram in self._ngrams(text):
+            self.grams.setdefault(gram, set()).add(pk)
+
+    def remove(self, pk):
+        text = self.texts.pop(pk, None)
+        if text is not None:
+            for gram in self._ngrams(text):
+                self.grams[gram].discard(pk)
+
+    def search(self, term):
+        # Intersect the posting sets, smallest first, then confirm the substring
+        postings = sorted((self.grams.get(gram, set()) for gram in self._ngrams(term)), key=len)
+        candidates = set.intersection(*postings) if postings else set()
+        return [pk for pk in candidates if term in self.texts[pk]]
+
+    def disconnect(self):
+        post_save.disconnect(self._on_save, sender=self.model)
+        post_delete.disconnect(self._on_delete, sender=self.model)
+
+    def _on_save(self, sender, instance, **kwargs):
+        self.add(instance.pk, getattr(instance, self.field_name))
+
+    def _on_delete(self, sender, instance, **kwargs):
+        self.remove(instance.pk)
+
+
+
+def fts_table(model):
+    return f"{model._meta.db_table}_fts"
+
+
+def fts_available():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (%s)"
+            % ", ".join(["%s"] * len(SEARCH_FIELDS)),
+            [fts_table(model) for model in SEARCH_FIELDS],
+        )
+        return cursor.fetchone()[0] == len(SEARCH_FIELDS)
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """
+    The backend named by ``settings.CRM_SEARCH_BACKEND`` (a dotted path), or the
+    best one for the default database: FTS5 on SQLite, pg_trgm on PostgreSQL.
+    """
+    path = getattr(settings, "CRM_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == "sqlite" and fts_available():
+        return SQLiteFTSBackend()
+    if connection.vendor == "postgresql":
+        return PostgresTrigramBackend()
+    return SearchBackend()
+
+
+def index_rows(model, instances):
+    """
+    Add rows written without post_save (``bulk_create``) to the in-process n-gram indexes.
+
+    The other backends index in the database, so this is a no-op for them.
+    """
+    backend = get_search_backend()
+    if isinstance(backend, NgramBackend):
+        backend.add(model, instances)
+
+
+def reset_indexes(*models):
+    """Drop the in-process n-gram indexes of ``models`` after bulk writes too large to add row by row."""
+    backend = get_search_backend()
+    if isinstance(backend, NgramBackend):
+        backend.reset(*models)
+
+
+def search(queryset, field_name, value):
+    """Filter ``queryset`` to rows whose ``field_name`` contains ``value``, case-insensitively."""
+    return get_search_backend().filter(queryset, field_name, value)
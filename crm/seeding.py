@@ -0,0 +1,155 @@
+
+
+import random
+import itertools
+from array import array
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from .models import Customer, Product, Order
+from .aggregates import reconcile
+from .bulk import ingest_orders
+from .response_cache import invalidate
+from .search import reset_indexes
+
+
+
+# Rows per INSERT; the through table gets up to products_per_order times as many
+SEED_BATCH_SIZE = 5000
+
+FIRST_NAMES = [
+    "James", "Mary", "Ahmed", "Fatima", "Wei", "Yuki", "Carlos", "Ana", "Ivan", "Olga",
+    "Kwame", "Amina", "Liam", "Emma", "Noah", "Sofia", "Ravi", "Priya", "Omar", "Leila",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Okafor", "Haddad", "Chen", "Tanaka", "Garcia", "Silva", "Petrov", "Novak",
+    "Mensah", "Bello", "Brown", "Muller", "Rossi", "Kim", "Patel", "Singh", "Nguyen", "Cohen",
+]
+PRODUCT_WORDS = [
+    "Laptop", "Phone", "Monitor", "Keyboard", "Mouse", "Headset", "Camera", "Tablet", "Speaker", "Router",
+    "Charger", "Cable", "Dock", "Printer", "Drive", "Watch", "Lamp", "Desk", "Chair", "Bag",
+]
+
+
+
+class Distribution:
+    """
+    Picks ids with a Zipf-like skew: the item of rank ``r`` has weight ``1 / r ** skew``.
+
+    ``skew=0`` is uniform; around 1 a few customers place most orders and a few
+    products sell most, as in real shops. Ranks are shuffled with the seeded
+    RNG, so the popular ids are spread over the table.
+    """
+
+    def __init__(self, ids, skew, rng):
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(len(self.ids))))
+
+    def sample(self, rng, k=1):
+        return rng.choices(self.ids, cum_weights=self.cum_weights, k=k)
+
+
+
+def chunks(total, size):
+    # (start, count) ranges covering range(total)
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def seed_customers(count, rng, batch_size=SEED_BATCH_SIZE):
+    """Insert ``count`` customers with unique synthetic emails and return their ids as an ``array``."""
+    ids = array("q")
+    # Continue the email numbering so repeated runs do not collide
+    offset = Customer.objects.count()
+    for start, size in chunks(count, batch_size):
+        rows = []
+        for n in range(offset + start, offset + start + size):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            rows.append(Customer(
+                name=f"{first} {last}",
+                email=f"{first.lower()}.{last.lower()}.{n}@example.com",
+                phone=f"{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+            ))
+        with transaction.atomic():
+            ids.extend(customer.pk for customer in Customer.objects.bulk_create(rows))
+    return ids
+
+
+def seed_products(count, rng, batch_size=SEED_BATCH_SIZE):
+    """Insert ``count`` products and return their ids as an ``array``."""
+    ids = array("q")
+    for start, size in chunks(count, batch_size):
+        rows = [
+            Product(
+                name=f"{rng.choice(PRODUCT_WORDS)} {n + 1}",
+                # Log-uniform prices, 1.00 to 2000.00
+                price=Decimal(f"{2000 ** rng.random():.2f}"),
+                stock=rng.randint(0, 100),
+            )
+            for n in range(start, start + size)
+        ]
+        with transaction.atomic():
+            ids.extend(product.pk for product in Product.objects.bulk_create(rows))
+    return ids
+
+
+def seed_orders(count, customer_ids, product_ids, rng, products_per_order=(1, 5), skew=1.0, days=365,
+                batch_size=SEED_BATCH_SIZE):
+    """
+    Insert ``count`` orders with their ``Order.products`` rows and totals.
+
+    Customers and products are drawn from ``Distribution(skew)``, each order
+    gets ``products_per_order`` (min, max) distinct products and an
+    ``order_date`` within the last ``days`` days. Rows are written by
+    ``crm.bulk.ingest_orders``. Returns the number of through rows written.
+    """
+    customers = Distribution(customer_ids, skew, rng)
+    products = Distribution(product_ids, skew, rng)
+    now = timezone.now()
+    low, high = products_per_order
+    high = min(high, len(product_ids))
+    links = 0
+
+    for _, size in chunks(count, batch_size):
+        rows = []
+        for customer_id in customers.sample(rng, size):
+            wanted = rng.randint(min(low, high), high)
+            picked = set()
+            while len(picked) < wanted:
+                picked.update(products.sample(rng, wanted - len(picked)))
+            rows.append((customer_id, picked, now - timedelta(seconds=rng.randrange(days * 86400))))
+        ingest_orders(rows, batch_size)
+        links += sum(len(picked) for _, picked, _ in rows)
+    return links
+
+
+def seed(customers=0, products=0, orders=0, seed=0, products_per_order=(1, 5), skew=1.0, days=365,
+         batch_size=SEED_BATCH_SIZE):
+    """
+    Generate a synthetic dataset with ``bulk_create``, deterministic for a given ``seed``.
+
+    Orders are drawn from the customers and products created in the same run,
+    or from all existing rows when that run creates none. The counters and
+    cached responses are refreshed, and in-process search indexes dropped, once
+    at the end, since bulk inserts send no signals. Returns ``{"customers": n, "products": n, "orders": n, "order_products": n}``.
+    """
+    rng = random.Random(seed)
+    customer_ids = seed_customers(customers, rng, batch_size)
+    product_ids = seed_products(products, rng, batch_size)
+
+    links = 0
+    if orders:
+        if not customer_ids:
+            customer_ids = array("q", Customer.objects.order_by("pk").values_list("pk", flat=True))
+        if not product_ids:
+            product_ids = array("q", Product.objects.order_by("pk").values_list("pk", flat=True))
+        if not customer_ids or not product_ids:
+            raise ValueError("Orders need at least one customer and one product")
+        links = seed_orders(orders, customer_ids, product_ids, rng, products_per_order, skew, days, batch_size)
+
+    reconcile()
+    invalidate(Customer, Product, Order)
+    reset_indexes(Customer, Product)
+    return {"customers": customers, "products": products, "orders": orders, "order_products": links}
@@ -0,0 +1,153 @@
+
+
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .models import Customer, Product, Order, OrderProduct
+from .aggregates import bump
+from . import rollups
+from .response_cache import invalidate
+
+
+
+@receiver(m2m_changed, sender=OrderProduct)
+def price_added_products(sender, instance, action, reverse, pk_set, **kwargs):
+    """Copy the current Product.price onto lines added by products.add()/set(); later price changes leave them."""
+    if action != "post_add" or not pk_set:
+        return
+    lines = OrderProduct.objects.filter(price__isnull=True)
+    lines = lines.filter(product=instance, order__in=pk_set) if reverse else lines.filter(order=instance, product__in=pk_set)
+    lines.update(price=Subquery(Product.objects.filter(pk=OuterRef("product_id")).values("price")[:1]))
+
+
+@receiver(m2m_changed, sender=OrderProduct)
+def update_order_totals(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Order.total_amount in step with the order's lines using a DB-side Sum."""
+    if reverse:
+        # product.orders.add/remove/clear(): instance is a Product
+        if action == "pre_clear":
+            instance._cleared_order_ids = list(instance.orders.values_list("pk", flat=True))
+            return
+        if action == "post_clear":
+            order_ids = instance.__dict__.pop("_cleared_order_ids", [])
+        elif action in ("post_add", "post_remove"):
+            order_ids = pk_set
+        else:
+            return
+        _recompute(Order.objects.filter(pk__in=order_ids))
+        return
+
+    if action in ("post_add", "post_remove", "post_clear"):
+        _recompute(Order.objects.filter(pk=instance.pk))
+        instance.refresh_from_db(fields=["total_amount"])
+
+
+def _recompute(orders):
+    # The revenue counter moves by however much the recomputed totals differ
+    before = orders.aggregate(total=Sum("total_amount"))["total"] or 0
+    orders.recompute_totals()
+    after = orders.aggregate(total=Sum("total_amount"))["total"] or 0
+    bump(revenue=after - before)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_orders(sender, instance, **kwargs):
+    # Deleting a product cascades to its order links without m2m_changed: take its orders out of
+    # the rollups while the links still exist, and recompute them once they are gone
+    order_ids = instance._deleted_order_ids = list(instance.orders.values_list("pk", flat=True))
+    if order_ids:
+        rollups.record(Order.objects.filter(pk__in=order_ids), -1)
+
+
+@receiver(post_delete, sender=Product)
+def recompute_product_orders(sender, instance, **kwargs):
+    order_ids = instance.__dict__.pop("_deleted_order_ids", [])
+    if order_ids:
+        orders = Order.objects.filter(pk__in=order_ids)
+        _recompute(orders)
+        rollups.record(orders)
+        invalidate(Order)
+
+
+
+# Running totals for crm.aggregates (bulk writes bump them in crm.bulk)
+@receiver(post_save, sender=Customer)
+def count_customer(sender, instance, created, **kwargs):
+    if created:
+        bump(customers=1)
+
+
+@receiver(post_delete, sender=Customer)
+def uncount_customer(sender, instance, **kwargs):
+    bump(customers=-1)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_total(sender, instance, **kwargs):
+    # An update moves revenue by the change in total_amount, so read the stored value first
+    if not instance._state.adding:
+        instance._stored_total = Order.objects.filter(pk=instance.pk).values_list("total_amount", flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+def count_order(sender, instance, created, **kwargs):
+    if created:
+        bump(orders=1, revenue=instance.total_amount)
+        return
+    stored = instance.__dict__.pop("_stored_total", None)
+    if stored is not None:
+        bump(revenue=instance.total_amount - stored)
+
+
+@receiver(post_delete, sender=Order)
+def uncount_order(sender, instance, **kwargs):
+    bump(orders=-1, revenue=-instance.total_amount)
+
+
+
+# Sales rollups (crm.rollups): an order's contribution is removed with its old
+# state and added back with the new one; bulk writes record it in crm.bulk.
+# These run after the handlers above, so post_* sees the recomputed total.
+@receiver(pre_save, sender=Order)
+@receiver(pre_delete, sender=Order)
+def unrecord_order(sender, instance, **kwargs):
+    if not instance._state.adding:
+        rollups.record(Order.objects.filter(pk=instance.pk), -1)
+
+
+@receiver(post_save, sender=Order)
+def record_order(sender, instance, **kwargs):
+    rollups.record(Order.objects.filter(pk=instance.pk))
+
+
+@receiver(m2m_changed, sender=OrderProduct)
+def rerecord_order_products(sender, instance, action, reverse, pk_set, **kwargs):
+    stage, _, change = action.partition("_")
+    if reverse and change == "clear":
+        # product.orders.clear(): remember the orders before their links are gone
+        if stage == "pre":
+            order_ids = instance._rollup_order_ids = list(instance.orders.values_list("pk", flat=True))
+        else:
+            order_ids = instance.__dict__.pop("_rollup_order_ids", [])
+    else:
+        order_ids = pk_set if reverse else [instance.pk]
+    if order_ids:
+        rollups.record(Order.objects.filter(pk__in=order_ids), -1 if stage == "pre" else 1)
+
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def invalidate_responses(sender, **kwargs):
+    """Evict cached GraphQL responses that read the saved or deleted model."""
+    invalidate(sender)
+
+
+@receiver(m2m_changed, sender=OrderProduct)
+def invalidate_order_products(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate(Order, Product)
@@ -0,0 +1,100 @@
+
+
+import time
+import random
+import functools
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.utils import OperationalError
+from django.dispatch import receiver
+
+
+
+# PRAGMAs run on every new SQLite connection when CRM_SQLITE_TUNED is on;
+# CRM_SQLITE_PRAGMAS overrides single values
+SQLITE_PRAGMAS = {
+    # Readers and the writer no longer block each other
+    "journal_mode": "WAL",
+    # fsync at checkpoints only: with WAL a power cut may lose the last commits, never the file
+    "synchronous": "NORMAL",
+    # Milliseconds a writer waits for the lock before "database is locked"
+    "busy_timeout": 5000,
+    # Read pages through a memory map instead of read() calls
+    "mmap_size": 256 * 1024 * 1024,
+    # Page cache per connection; negative values are KiB
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+    # Truncate the WAL file back to this size after a checkpoint
+    "journal_size_limit": 64 * 1024 * 1024,
+}
+
+# Extra attempts after "database is locked", with jittered exponential backoff from LOCKED_BACKOFF seconds
+LOCKED_RETRIES = 5
+LOCKED_BACKOFF = 0.05
+
+
+
+def tuned():
+    return getattr(settings, "CRM_SQLITE_TUNED", False)
+
+
+def pragmas():
+    return {**SQLITE_PRAGMAS, **getattr(settings, "CRM_SQLITE_PRAGMAS", {})}
+
+
+@receiver(connection_created)
+def tune_connection(sender, connection, **kwargs):
+    """Apply ``pragmas()`` to a new SQLite connection and retry its autocommit statements on lock errors."""
+    if connection.vendor != "sqlite" or not tuned():
+        return
+    for name, value in pragmas().items():
+        connection.connection.execute(f"PRAGMA {name} = {value}")
+    if retry_statement not in connection.execute_wrappers:
+        # First, i.e. outermost: connection.execute_wrapper() blocks already entered (crm.tracing)
+        # pop the last wrapper when they exit
+        connection.execute_wrappers.insert(0, retry_statement)
+
+
+
+def is_locked(error):
+    return isinstance(error, OperationalError) and "locked" in str(error)
+
+
+def backoff(attempt):
+    time.sleep(LOCKED_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def retry_statement(execute, sql, params, many, context):
+    # Execute wrapper: a locked statement in autocommit mode did nothing and can run again.
+    # Inside a transaction the whole transaction has to be retried (see retry_on_locked).
+    for attempt in range(LOCKED_RETRIES + 1):
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if not is_locked(e) or context["connection"].in_atomic_block or attempt == LOCKED_RETRIES:
+                raise
+        backoff(attempt)
+
+
+def retry_on_locked(func):
+    """
+    Run ``func`` again when it fails with "database is locked", if it was called outside a transaction.
+
+    For functions that own their transaction: the failed attempt was rolled
+    back whole, so running it again is safe. Called inside an outer ``atomic``
+    block, the error goes to whoever owns that transaction.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outermost = not connection.in_atomic_block
+        for attempt in range(LOCKED_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not (outermost and is_locked(e)) or attempt == LOCKED_RETRIES:
+                    raise
+            backoff(attempt)
+
+    return wrapper
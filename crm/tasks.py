@@ -1,14 +1,11 @@
-
-
-import requests
 from celery import shared_task
 from datetime import datetime
-
-GRAPHQL_ENDPOINT = "http://localhost:8000/graphql/"
+from .executor import execute
 
 
 @shared_task
 def generate_crm_report():
+    # Runs in-process unless CRM_GRAPHQL_URL points the worker at a remote server
     query = """
     query {
         totalCustomers
@@ -16,11 +13,7 @@ def generate_crm_report():
         totalRevenue
     }
     """
-    response = requests.post(
-        GRAPHQL_ENDPOINT,
-        json={"query": query}
-    )
-    data = response.json().get("data", {})
+    data = execute(query)
 
     customers = data.get("totalCustomers", 0)
     orders = data.get("totalOrders", 0)
@@ -1,3 +1,1307 @@
-from django.test import TestCase
+import base64
+import gzip
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.db.utils import OperationalError
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from unittest import mock
+from asgiref.sync import async_to_sync
+from datetime import timedelta
+from types import SimpleNamespace
+from django.utils import timezone
+
+from alx_backend_graphql.schema import schema
+from .models import Customer, Product, Order, DailyProductSales, DailyCustomerSales
+from .bulk import bulk_create_customers, restock_low_stock
+from . import bulk as bulk_module
+from . import search as search_backends
+from .pagination import encode_cursor
+from .documents import DocumentCache, query_hash
+from .views import CachedGraphQLView
+from .response_cache import operation_tags
+from .executor import GraphQLExecutionError, HttpExecutor, LocalExecutor
+from .tasks import generate_crm_report
+from .reminders import send_reminders
+from .export import stream
+from . import export as export_module
+from .tracing import Trace, metrics
+from .routers import PIN_COOKIE
+from . import sqlite as sqlite_tuning
+from .seeding import seed as seed_dataset
+from . import aggregates
+from graphql import parse
+from graphene_django.settings import graphene_settings
+from graphql_relay import to_global_id
 
 # Create your tests here.
+
+
+def seed(count):
+    customers = Customer.objects.bulk_create(
+        Customer(name=f"Customer {i}", email=f"customer{i}@example.com") for i in range(count)
+    )
+    products = Product.objects.bulk_create(
+        Product(name=f"Product {i}", price=i + 1, stock=i) for i in range(count)
+    )
+    orders = Order.objects.bulk_create(Order(customer=customer) for customer in customers)
+    Order.products.through.objects.bulk_create(
+        Order.products.through(order_id=order.pk, product_id=product.pk, price=product.price)
+        for order in orders
+        for product in products[:3]
+    )
+
+
+class SchemaTestCase(TestCase):
+    def execute(self, query):
+        result = schema.execute(query, context_value=RequestFactory().post("/graphql"))
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def assertConstantQueries(self, query, num):
+        for count in (5, 50):
+            Order.objects.all().delete()
+            Customer.objects.all().delete()
+            Product.objects.all().delete()
+            seed(count)
+            with self.assertNumQueries(num):
+                self.execute(query)
+
+
+class LoaderQueryCountTests(SchemaTestCase):
+    def test_orders_list(self):
+        # orders joined with customers, products
+        self.assertConstantQueries("""
+            query {
+                orders {
+                    customer { email }
+                    products { edges { node { name } } }
+                }
+            }
+        """, 2)
+
+    def test_customers_nested_orders(self):
+        # customers, orders, products, orders of those products
+        self.assertConstantQueries("""
+            query {
+                customers {
+                    orders {
+                        edges { node { products { edges { node { name orders { edges { node { id } } } } } } } }
+                    }
+                }
+            }
+        """, 4)
+
+    def test_all_orders_connection(self):
+        # page joined with customers, products
+        self.assertConstantQueries("""
+            query {
+                allOrders {
+                    edges { node { customer { email } products { edges { node { name } } } } }
+                }
+            }
+        """, 2)
+
+    def test_filtered_edge_falls_back_to_database(self):
+        seed(2)
+        data = self.execute("""
+            query {
+                orders { products(name: "Product 1") { edges { node { name } } } }
+            }
+        """)
+        names = [edge["node"]["name"] for edge in data["orders"][0]["products"]["edges"]]
+        self.assertEqual(names, ["Product 1"])
+
+
+class OptimizerTests(SchemaTestCase):
+    def test_only_selected_columns_are_loaded(self):
+        seed(3)
+        with CaptureQueriesContext(connection) as queries:
+            self.execute("""
+                query {
+                    allCustomers { edges { node { name orders { edges { node { totalAmount } } } } } }
+                }
+            """)
+        page, orders = queries.captured_queries
+        self.assertNotIn('"crm_customer"."email"', page["sql"])
+        self.assertNotIn('"crm_order"."order_date"', orders["sql"])
+        self.assertIn('"crm_order"."customer_id"', orders["sql"])
+
+    def test_fragments_are_followed(self):
+        # page joined with customers
+        self.assertConstantQueries("""
+            query {
+                allOrders { edges { node { ...OrderFields } } }
+            }
+            fragment OrderFields on OrderNode {
+                totalAmount
+                ... on OrderNode { customer { email } }
+            }
+        """, 1)
+
+
+class BulkCreateCustomersTests(SchemaTestCase):
+    mutation = """
+        mutation($inputs: [CustomerInput]!) {
+            bulkCreateCustomers(inputs: $inputs) {
+                customers { email }
+                errors { field messages }
+                success
+            }
+        }
+    """
+
+    def bulk_create(self, inputs):
+        result = schema.execute(self.mutation, variable_values={"inputs": inputs},
+                                context_value=RequestFactory().post("/graphql"))
+        self.assertIsNone(result.errors)
+        return result.data["bulkCreateCustomers"]
+
+    def test_reports_row_errors_and_inserts_valid_rows(self):
+        Customer.objects.create(name="Taken", email="taken@example.com")
+        data = self.bulk_create([
+            {"name": "Ok", "email": "ok@example.com", "phone": "123-456-7890"},
+            {"name": "Bad phone", "email": "phone@example.com", "phone": "12"},
+            {"name": "Taken", "email": "taken@example.com"},
+            {"name": "Twice", "email": "ok@example.com"},
+            {"name": "Bad email", "email": "not-an-email"},
+        ])
+        self.assertFalse(data["success"])
+        self.assertEqual(data["customers"], [{"email": "ok@example.com"}])
+        self.assertEqual(
+            [error["field"] for error in data["errors"]],
+            ["phone (row 2)", "email (row 3)", "email (row 4)", "email (row 5)"],
+        )
+        self.assertEqual(Customer.objects.count(), 2)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for count in (10, 50):
+            inputs = [{"name": f"C{i}", "email": f"c{count}-{i}@example.com"} for i in range(count)]
+            # email__in lookup, insert and counter update, plus two savepoint pairs
+            with self.assertNumQueries(7):
+                data = self.bulk_create(inputs)
+            self.assertTrue(data["success"])
+            self.assertEqual(len(data["customers"]), count)
+
+
+class BulkImportTests(SchemaTestCase):
+    def test_bulk_create_products(self):
+        data = self.execute("""
+            mutation {
+                bulkCreateProducts(inputs: [
+                    {name: "Laptop", price: "999.99", stock: 5},
+                    {name: "Free", price: "0"},
+                    {name: "Mouse", price: "19.99"}
+                ]) {
+                    products { name stock }
+                    errors { field messages }
+                    success
+                }
+            }
+        """)["bulkCreateProducts"]
+        self.assertFalse(data["success"])
+        self.assertEqual(data["products"], [{"name": "Laptop", "stock": 5}, {"name": "Mouse", "stock": 0}])
+        self.assertEqual(data["errors"][0]["field"], "price (row 2)")
+
+    def test_bulk_create_orders_writes_products_and_totals(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        laptop = Product.objects.create(name="Laptop", price="999.99")
+        mouse = Product.objects.create(name="Mouse", price="19.99")
+        data = self.execute(f"""
+            mutation {{
+                bulkCreateOrders(inputs: [
+                    {{customerId: "{customer.pk}", productIds: ["{laptop.pk}", "{mouse.pk}", "{mouse.pk}"]}},
+                    {{customerId: "0", productIds: ["{laptop.pk}"]}},
+                    {{customerId: "{customer.pk}", productIds: ["0"]}},
+                    {{customerId: "{customer.pk}", productIds: ["{mouse.pk}"]}}
+                ]) {{
+                    orders {{ totalAmount products {{ edges {{ node {{ name }} }} }} }}
+                    errors {{ field messages }}
+                }}
+            }}
+        """)["bulkCreateOrders"]
+        self.assertEqual([order["totalAmount"] for order in data["orders"]], ["1019.98", "19.99"])
+        self.assertEqual(len(data["orders"][0]["products"]["edges"]), 2)
+        self.assertEqual([error["field"] for error in data["errors"]], ["customer_id (row 2)", "product_ids (row 3)"])
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_import_orders_csv(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        laptop = Product.objects.create(name="Laptop", price="999.99")
+        mouse = Product.objects.create(name="Mouse", price="19.99")
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write("customer_id,product_ids,order_date\n")
+            f.write(f"{customer.pk},{laptop.pk};{mouse.pk},2024-01-15T10:00:00\n")
+            f.write(f"0,{laptop.pk},\n")
+            f.write(f"{customer.pk},{mouse.pk},yesterday\n")
+            f.write(f"{customer.pk},{mouse.pk} {mouse.pk},\n")
+        self.addCleanup(os.remove, f.name)
+
+        out, err = StringIO(), StringIO()
+        call_command("import_orders", f.name, "--batch-size", "2", stdout=out, stderr=err)
+        self.assertIn("Imported 2 orders, 2 rows rejected.", out.getvalue())
+        self.assertEqual(err.getvalue().splitlines(), [
+            "line 3: customer_id: Customer does not exist",
+            "line 4: order_date: Invalid date 'yesterday'",
+        ])
+        first, second = Order.objects.order_by("pk")
+        self.assertEqual((first.total_amount, first.order_date.year), (Decimal("1019.98"), 2024))
+        self.assertEqual(second.total_amount, Decimal("19.99"))
+        self.assertEqual(aggregates.drifted(), {})
+
+
+class CreateOrderTests(SchemaTestCase):
+    mutation = """
+        mutation($customerId: ID!, $productIds: [ID]!) {
+            createOrder(input: {customerId: $customerId, productIds: $productIds}) {
+                order { id totalAmount }
+                errors { field messages }
+                success
+            }
+        }
+    """
+
+    def create_order(self, customer_id, product_ids):
+        result = schema.execute(self.mutation, context_value=RequestFactory().post("/graphql"),
+                                variable_values={"customerId": customer_id, "productIds": product_ids})
+        self.assertIsNone(result.errors)
+        return result.data["createOrder"]
+
+    def test_query_count_does_not_depend_on_products(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        products = Product.objects.bulk_create(Product(name=f"P{i}", price=1) for i in range(20))
+        for count in (1, 20):
+            # savepoint pairs, customer, products, prices, order insert, through insert, counter
+            # update, two rollup upserts
+            with self.assertNumQueries(12):
+                data = self.create_order(customer.pk, [p.pk for p in products[:count]])
+            self.assertTrue(data["success"])
+            self.assertEqual(data["order"]["totalAmount"], f"{count}.00")
+
+    def test_unknown_product(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        data = self.create_order(customer.pk, ["999"])
+        self.assertFalse(data["success"])
+        self.assertEqual(data["errors"], {"field": "product_ids", "messages": ["Product with ID 999 does not exist"]})
+
+
+class RestockTests(SchemaTestCase):
+    def test_restocks_only_products_below_threshold(self):
+        Product.objects.bulk_create([
+            Product(name="Low", price="1.50", stock=2),
+            Product(name="Edge", price=1, stock=5),
+            Product(name="Full", price=1, stock=50),
+        ])
+        data = self.execute("""
+            mutation {
+                updateLowStockProducts(threshold: 6, increment: 3) {
+                    updatedProducts { name price stock }
+                    message
+                }
+            }
+        """)["updateLowStockProducts"]
+        self.assertEqual(data["updatedProducts"], [
+            {"name": "Low", "price": "1.50", "stock": 5},
+            {"name": "Edge", "price": "1.00", "stock": 8},
+        ])
+        self.assertEqual(data["message"], "2 products were updated successfully.")
+        self.assertEqual(Product.objects.get(name="Full").stock, 50)
+
+    def test_keyset_batches(self):
+        Product.objects.bulk_create(Product(name=f"P{i}", price=1, stock=i % 3) for i in range(7))
+        # Three batches of at most 3 ids plus the final empty page; savepoint pair each
+        with self.assertNumQueries(3 * 4 + 1):
+            updated = restock_low_stock(batch_size=3)
+        self.assertEqual([p.stock for p in updated], [10, 11, 12, 10, 11, 12, 10])
+
+    def test_without_update_returning(self):
+        Product.objects.bulk_create(Product(name=f"P{i}", price=1, stock=i) for i in range(12))
+        with mock.patch("crm.bulk._can_update_returning", return_value=False):
+            updated = restock_low_stock(batch_size=4)
+        self.assertEqual([p.stock for p in updated], [i + 10 for i in range(10)])
+
+    def test_without_update_returning_skips_rows_restocked_meanwhile(self):
+        low = Product.objects.create(name="Low", price=1, stock=2)
+        # Selected as low, then restocked by someone else before the batch's UPDATE
+        restocked = Product.objects.create(name="Restocked", price=1, stock=20)
+        updated = bulk_module._restock_locked([low.pk, restocked.pk], threshold=10, increment=10)
+        self.assertEqual([(p.name, p.stock) for p in updated], [("Low", 12)])
+        self.assertEqual(Product.objects.get(pk=restocked.pk).stock, 20)
+
+    def test_rejects_non_positive_arguments(self):
+        Product.objects.create(name="Low", price=1, stock=2)
+        for arguments, field in (("increment: -5", "increment"), ("threshold: 0", "threshold")):
+            data = self.execute(f"""
+                mutation {{
+                    updateLowStockProducts({arguments}) {{ updatedProducts {{ name }} errors {{ field messages }} }}
+                }}
+            """)["updateLowStockProducts"]
+            self.assertEqual(data["updatedProducts"], [])
+            self.assertEqual(data["errors"], [{"field": field, "messages": ["Must be a positive integer"]}])
+        self.assertEqual(Product.objects.get().stock, 2)
+
+
+class OrderTotalTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price="999.99")
+        self.mouse = Product.objects.create(name="Mouse", price="19.99")
+
+    def test_total_follows_products(self):
+        order = Order.objects.create(customer=self.customer)
+        order.products.set([self.laptop, self.mouse])
+        self.assertEqual(order.total_amount, Decimal("1019.98"))
+
+        order.products.remove(self.laptop)
+        self.assertEqual(order.total_amount, Decimal("19.99"))
+
+        self.mouse.orders.clear()
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal("0"))
+
+        self.laptop.orders.add(order)
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal("999.99"))
+
+    def test_deleting_a_product_updates_its_orders(self):
+        order = Order.objects.create(customer=self.customer)
+        order.products.set([self.laptop, self.mouse])
+        self.mouse.delete()
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal("999.99"))
+        self.assertEqual(Order.objects.drifted().count(), 0)
+        self.assertEqual(aggregates.drifted(), {})
+        self.assertEqual(
+            list(DailyCustomerSales.objects.values_list("orders", "revenue")), [(1, Decimal("999.99"))]
+        )
+        self.assertEqual(
+            list(DailyProductSales.objects.values_list("product_id", "orders", "revenue")),
+            [(self.laptop.pk, 1, Decimal("999.99"))],
+        )
+
+    def test_check_and_recompute_command(self):
+        order = Order.objects.create(customer=self.customer)
+        order.products.set([self.laptop, self.mouse])
+        Order.objects.filter(pk=order.pk).update(total_amount=1)
+
+        with self.assertRaises(CommandError):
+            call_command("recompute_order_totals", "--check", stdout=StringIO())
+        call_command("recompute_order_totals", "--chunk-size", "1", stdout=StringIO())
+        call_command("recompute_order_totals", "--check", stdout=StringIO())
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal("1019.98"))
+
+
+class SearchTests(SchemaTestCase):
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice Smith", email="alice@example.com")
+        self.bob = Customer.objects.create(name='Bob "The Builder" Jones', email="bob@builders.org")
+        Customer.objects.create(name="Carol", email="carol@example.com")
+
+    def names(self, backend, field, value):
+        return sorted(backend.filter(Customer.objects.all(), field, value).values_list("name", flat=True))
+
+    def test_backends_agree_with_icontains(self):
+        self.bob.name = "Bob Jones"
+        self.bob.save()
+        Customer.objects.filter(name="Carol").delete()
+        Customer.objects.create(name="Mallory Smithers", email="mallory@example.com")
+
+        backends = [search_backends.SQLiteFTSBackend(), search_backends.NgramBackend()]
+        for field, value in [("name", "smith"), ("name", "SMITH"), ("email", "@example"),
+                             ("name", "jo"), ("name", "builder"), ("name", 'r" b'), ("email", "zzz")]:
+            expected = self.names(search_backends.SearchBackend(), field, value)
+            for backend in backends:
+                self.assertEqual(self.names(backend, field, value), expected, (backend, field, value))
+
+    def test_ngram_index_sees_bulk_writes(self):
+        backend = search_backends.NgramBackend()
+        self.addCleanup(backend.reset, Customer)
+        with mock.patch.object(search_backends, "get_search_backend", return_value=backend):
+            self.assertEqual(self.names(backend, "name", "zelda"), [])
+            created, _ = bulk_create_customers([SimpleNamespace(name="Zelda Hart", email="zelda@example.com", phone="")])
+            self.assertEqual(len(created), 1)
+            self.assertEqual(self.names(backend, "name", "zelda"), ["Zelda Hart"])
+
+            seed_dataset(customers=3, seed=1)
+            seeded = Customer.objects.order_by("-pk").first()
+            self.assertEqual(self.names(backend, "email", seeded.email), [seeded.name])
+
+    def test_filters_route_through_search(self):
+        self.assertIsInstance(search_backends.get_search_backend(), search_backends.SQLiteFTSBackend)
+        data = self.execute('query { allCustomers(name: "smith") { edges { node { name } } } }')
+        self.assertEqual(data["allCustomers"]["edges"], [{"node": {"name": "Alice Smith"}}])
+
+    def test_product_name_filter_has_no_duplicate_orders(self):
+        order = Order.objects.create(customer=self.alice)
+        order.products.set([
+            Product.objects.create(name="Gaming Laptop", price=1),
+            Product.objects.create(name="Office Laptop", price=1),
+        ])
+        data = self.execute('query { allOrders(productName: "laptop") { edges { node { id } } } }')
+        self.assertEqual(len(data["allOrders"]["edges"]), 1)
+
+
+class KeysetPaginationTests(SchemaTestCase):
+    query = """
+        query($first: Int, $after: String, $last: Int, $before: String) {
+            allOrders(first: $first, after: $after, last: $last, before: $before) {
+                edges { node { id } }
+                pageInfo { startCursor endCursor hasNextPage hasPreviousPage }
+            }
+        }
+    """
+
+    def page(self, **variables):
+        result = schema.execute(self.query, variable_values=variables,
+                                context_value=RequestFactory().post("/graphql"))
+        self.assertIsNone(result.errors)
+        return result.data["allOrders"]
+
+    def test_walks_forward_and_backward(self):
+        seed(7)
+        expected = [to_global_id("OrderNode", pk) for pk in Order.objects.order_by("order_date", "id").values_list("pk", flat=True)]
+
+        seen, after = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = self.page(first=3, after=after)
+            seen += [edge["node"]["id"] for edge in page["edges"]]
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            after = page["pageInfo"]["endCursor"]
+        self.assertEqual(seen, expected)
+
+        page = self.page(last=2, before=after)
+        self.assertEqual([edge["node"]["id"] for edge in page["edges"]], expected[3:5])
+        self.assertTrue(page["pageInfo"]["hasPreviousPage"])
+        self.assertTrue(page["pageInfo"]["hasNextPage"])
+
+    def test_deep_page_does_not_offset(self):
+        seed(5)
+        last = Order.objects.order_by("order_date", "id").last()
+        cursor = encode_cursor([last.order_date, last.pk])
+        with CaptureQueriesContext(connection) as queries:
+            page = self.page(first=2, after=cursor)
+        self.assertEqual(page["edges"], [])
+        self.assertNotIn("OFFSET", queries.captured_queries[0]["sql"])
+
+    def test_total_count_only_when_selected(self):
+        seed(4)
+        with self.assertNumQueries(2):
+            data = self.execute("query { allOrders(first: 1) { totalCount edges { node { id } } } }")
+        self.assertEqual(data["allOrders"]["totalCount"], 4)
+
+    def test_invalid_cursors_are_rejected(self):
+        seed(2)
+        malformed = base64.b64encode(b"keyset:[not json").decode()
+        customer_cursor = encode_cursor([Customer.objects.first().pk])
+        wrong_types = encode_cursor(["x", "y"])
+        for cursor in (malformed, customer_cursor, wrong_types):
+            result = schema.execute(self.query, variable_values={"first": 1, "after": cursor},
+                                    context_value=RequestFactory().post("/graphql"))
+            self.assertEqual([error.message for error in result.errors], ["Invalid cursor"])
+            self.assertIsNone(result.data["allOrders"])
+
+    def test_negative_page_sizes_are_rejected(self):
+        seed(2)
+        for name in ("first", "last"):
+            result = schema.execute(self.query, variable_values={name: -1},
+                                    context_value=RequestFactory().post("/graphql"))
+            self.assertEqual([error.message for error in result.errors],
+                             [f"Argument '{name}' must be a non-negative integer."])
+
+    def test_offset_cursors_still_work(self):
+        seed(4)
+        data = self.execute("query { allOrders(first: 1, offset: 2) { edges { node { id } } } }")
+        self.assertEqual(len(data["allOrders"]["edges"]), 1)
+
+
+class GraphQLViewTests(TestCase):
+    query = "query { products { name } }"
+
+    def setUp(self):
+        CachedGraphQLView.document_cache.clear()
+        CachedGraphQLView.persisted_queries.hits = CachedGraphQLView.persisted_queries.misses = 0
+        cache.clear()
+        Product.objects.create(name="Laptop", price=1)
+
+    def post(self, **body):
+        response = self.client.post("/graphql", body, content_type="application/json")
+        return response.json()
+
+    def test_documents_are_parsed_once(self):
+        for _ in range(3):
+            self.assertEqual(self.post(query=self.query)["data"], {"products": [{"name": "Laptop"}]})
+        stats = self.client.get("/graphql/stats").json()["documents"]
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (2, 1, 1))
+
+    def test_validation_errors_are_cached(self):
+        for _ in range(2):
+            self.assertIn("errors", self.post(query="query { products { nope } }"))
+        self.assertEqual(CachedGraphQLView.document_cache.hits, 1)
+
+    def test_lru_eviction(self):
+        documents = DocumentCache(maxsize=2)
+        graphql_schema = schema.graphql_schema
+        for query in ["{ products { name } }", "{ customers { name } }", "{ products { name } }", "{ orders { id } }"]:
+            documents.get(graphql_schema, query)
+        self.assertEqual(documents.stats()["size"], 2)
+        documents.get(graphql_schema, "{ products { name } }")
+        documents.get(graphql_schema, "{ customers { name } }")
+        self.assertEqual((documents.hits, documents.misses), (2, 4))
+
+    def test_automatic_persisted_queries(self):
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": query_hash(self.query)}}
+
+        error = self.post(extensions=extensions)["errors"][0]
+        self.assertEqual(error["message"], "PersistedQueryNotFound")
+        self.assertEqual(error["extensions"]["code"], "PERSISTED_QUERY_NOT_FOUND")
+
+        self.assertIn("data", self.post(query=self.query, extensions=extensions))
+        self.assertEqual(self.post(extensions=extensions)["data"], {"products": [{"name": "Laptop"}]})
+        self.assertEqual(CachedGraphQLView.persisted_queries.stats(), {"hits": 1, "misses": 1})
+
+        response = self.client.get("/graphql", {"extensions": json.dumps(extensions)}, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["data"], {"products": [{"name": "Laptop"}]})
+
+    def test_hash_must_match_query(self):
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}}
+        self.assertEqual(self.post(query=self.query, extensions=extensions)["errors"][0]["message"],
+                         "provided sha does not match query")
+
+
+class QueryCostTests(TestCase):
+    query = "query { allCustomers(first: 20) { edges { node { orders(first: 10) { edges { node { id } } } } } } }"
+
+    def setUp(self):
+        CachedGraphQLView.document_cache.clear()
+        cache.clear()
+
+    def post(self, query, variables=None):
+        return self.client.post("/graphql", {"query": query, "variables": variables}, content_type="application/json")
+
+    def cost(self, query):
+        return LocalExecutor.documents.get(schema.graphql_schema, query).costs[None].cost
+
+    def test_cost_is_returned_in_extensions(self):
+        body = self.post(self.query).json()
+        self.assertEqual(body["extensions"]["cost"], {"requestedQueryCost": 241, "maximumAvailable": 50000, "depth": 7})
+
+    def test_variables_and_fragments(self):
+        self.assertEqual(self.cost(self.query), 241)
+        self.assertEqual(self.cost("""
+            query($n: Int = 10) { allCustomers(first: 20) { edges { node { ...Orders } } } }
+            fragment Orders on CustomerNode { orders(first: $n) { edges { node { id } } } }
+        """), 241)
+        # Unbounded arguments count as a full page
+        self.assertEqual(self.cost("query($n: Int) { allOrders(first: $n) { totalCount edges { node { id } } } }"), 102)
+
+    def test_over_budget_queries_are_rejected_before_execution(self):
+        nested = "query { allCustomers { edges { node { orders { edges { node { products { edges { node { name } } } } } } } } } }"
+        with self.assertNumQueries(0):
+            response = self.post(nested)
+        self.assertEqual(response.status_code, 400)
+        error = response.json()["errors"][0]
+        self.assertEqual(error["extensions"]["code"], "QUERY_TOO_COMPLEX")
+        self.assertGreater(error["extensions"]["cost"]["requestedQueryCost"], 50000)
+
+    def test_plain_lists_are_deprecated_not_truncated(self):
+        seed(3)
+        with mock.patch.object(graphene_settings, "RELAY_CONNECTION_MAX_LIMIT", 2):
+            body = self.post("{ orders { customer { email } } }").json()
+            self.assertEqual(body["extensions"]["cost"]["requestedQueryCost"], 2 * (1 + 1))
+        self.assertEqual(len(body["data"]["orders"]), 3)
+        fields = schema.graphql_schema.query_type.fields
+        for name in ("customers", "products", "orders"):
+            self.assertIn("Unbounded", fields[name].deprecation_reason)
+
+        # Nested under a plain list, each connection multiplies the priced list size
+        nested = "{ orders { customer { email } products { edges { node { orders { edges { node { id } } } } } } } }"
+        with self.assertNumQueries(0):
+            response = self.post(nested)
+        self.assertEqual(response.json()["errors"][0]["extensions"]["code"], "QUERY_TOO_COMPLEX")
+
+    def test_depth_limit(self):
+        with self.settings(CRM_QUERY_MAX_DEPTH=5):
+            error = self.post(self.query).json()["errors"][0]
+        self.assertEqual(error["extensions"]["code"], "QUERY_TOO_DEEP")
+
+
+# The test process is the only writer, so its local-memory cache can stand in for a shared one
+@override_settings(CRM_RESPONSE_CACHE="default")
+class ResponseCacheTests(TestCase):
+    query = "query { allProducts(lowStock: true) { edges { node { name stock } } } }"
+
+    def setUp(self):
+        cache.clear()
+        self.responses = CachedGraphQLView.response_cache
+        self.responses.hits = self.responses.misses = 0
+        Product.objects.create(name="Laptop", price=1, stock=5)
+
+    def post(self, query):
+        return self.client.post("/graphql", {"query": query}, content_type="application/json").json()
+
+    def test_repeated_query_is_served_from_cache(self):
+        first = self.post(self.query)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post(self.query), first)
+        self.assertEqual((self.responses.hits, self.responses.misses), (1, 1))
+
+    def test_cache_key_ignores_formatting(self):
+        self.post(self.query)
+        self.post("query {\n  allProducts(lowStock: true) {\n    edges { node { name stock } }\n  }\n}")
+        self.assertEqual(self.responses.hits, 1)
+
+    def test_mutations_invalidate_their_models(self):
+        self.post(self.query)
+        self.post("query { allCustomers { edges { node { name } } } }")
+
+        data = self.post("mutation { updateLowStockProducts { message } }")
+        self.assertEqual(data["data"]["updateLowStockProducts"]["message"], "1 products were updated successfully.")
+        self.assertEqual(self.post(self.query)["data"]["allProducts"]["edges"], [])
+        self.post("query { allCustomers { edges { node { name } } } }")
+        # Only the product query had to run again
+        self.assertEqual((self.responses.hits, self.responses.misses), (1, 3))
+
+    def test_signals_invalidate(self):
+        self.post(self.query)
+        Product.objects.create(name="Mouse", price=1, stock=1)
+        names = [edge["node"]["name"] for edge in self.post(self.query)["data"]["allProducts"]["edges"]]
+        self.assertEqual(names, ["Laptop", "Mouse"])
+        self.assertEqual(self.responses.hits, 0)
+
+    def test_mutations_are_not_cached(self):
+        mutation = 'mutation { createProduct(input: {name: "Pen", price: 1}) { success } }'
+        self.post(mutation)
+        self.post(mutation)
+        self.assertEqual(Product.objects.filter(name="Pen").count(), 2)
+        self.assertEqual((self.responses.hits, self.responses.misses), (0, 0))
+
+    def test_tags(self):
+        def tags(query):
+            return operation_tags(schema.graphql_schema, parse(query), None)
+
+        self.assertEqual(tags("{ products { name } }"), {"crm.Product"})
+        self.assertEqual(tags("{ orders { customer { name } } }"), {"crm.Order", "crm.Customer"})
+        self.assertEqual(tags('{ allOrders(customerName: "x") { edges { node { id } } } }'),
+                         {"crm.Order", "crm.Customer", "crm.Product"})
+        self.assertIsNone(tags("mutation { updateLowStockProducts { message } }"))
+
+
+class AggregateTests(SchemaTestCase):
+    query = "query { totalCustomers totalOrders totalRevenue }"
+
+    def totals(self):
+        data = self.execute(self.query)
+        return data["totalCustomers"], data["totalOrders"], Decimal(data["totalRevenue"])
+
+    def test_counters_follow_writes(self):
+        seed(3)  # bulk_create bypasses the totals and counters
+        Order.objects.recompute_totals()
+        call_command("reconcile_counters", stdout=StringIO())
+        self.assertEqual(self.totals(), (3, 3, Decimal("18")))
+
+        customer = Customer.objects.create(name="Dana", email="dana@example.com")
+        product = Product.objects.create(name="Desk", price=Decimal("100.50"))
+        order = Order.objects.create(customer=customer)
+        order.products.add(product)
+        self.assertEqual(self.totals(), (4, 4, Decimal("118.50")))
+
+        product.orders.clear()
+        Customer.objects.filter(name="Customer 0").delete()
+        self.assertEqual(self.totals(), (3, 3, Decimal("12")))
+
+        data = self.execute("""mutation { bulkCreateOrders(inputs: [
+            {customerId: "%s", productIds: ["%s"]}, {customerId: "%s", productIds: ["%s"]}
+        ]) { success } }""" % (customer.pk, product.pk, customer.pk, product.pk))
+        self.assertTrue(data["bulkCreateOrders"]["success"])
+        self.assertEqual(self.totals(), (3, 5, Decimal("213")))
+        call_command("reconcile_counters", "--check", stdout=StringIO())
+
+    def test_unfiltered_totals_read_the_counters(self):
+        with self.assertNumQueries(3):
+            self.execute(self.query)
+
+    def test_filtered_totals(self):
+        seed(3)
+        Order.objects.filter(pk=Order.objects.order_by("pk")[0].pk).update(total_amount=Decimal("100"))
+        data = self.execute("query { totalOrders(totalAmount_Gte: 10) totalRevenue(totalAmount_Gte: 10) "
+                            "totalCustomers(name: \"Customer 1\") }")
+        self.assertEqual((data["totalOrders"], Decimal(data["totalRevenue"]), data["totalCustomers"]),
+                         (1, Decimal("100"), 1))
+
+    def test_check_reports_drift(self):
+        seed(2)
+        with self.assertRaisesMessage(CommandError, "customers stored=0.00 actual=2.00"):
+            call_command("reconcile_counters", "--check", stdout=StringIO())
+
+
+class ExecutorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Customer.objects.create(name="Alice", email="alice@example.com")
+
+    def test_report_runs_in_process(self):
+        with mock.patch("requests.Session.post") as post, mock.patch("builtins.open", mock.mock_open()):
+            report = generate_crm_report()
+        post.assert_not_called()
+        self.assertEqual(report, {"customers": 1, "orders": 0, "revenue": "0.00"})
+
+    def test_local_errors_raise(self):
+        with self.assertRaisesMessage(GraphQLExecutionError, "Cannot query field 'nope'"):
+            LocalExecutor().execute("query { nope }")
+
+    def test_http_sends_persisted_query_hash_first(self):
+        def post(url, json, timeout):
+            response = self.client.post("/graphql", json, content_type="application/json")
+            bodies.append(json)
+            return response
+
+        bodies = []
+        executor = HttpExecutor("http://crm.internal/graphql")
+        with mock.patch.object(executor.session, "post", side_effect=post):
+            for _ in range(2):
+                self.assertEqual(executor.execute("query { totalCustomers }"), {"totalCustomers": 1})
+        # Unknown hash, retry with the text, then the hash alone is enough
+        self.assertEqual(["query" in body for body in bodies], [False, True, False])
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        self.orders = [Order.objects.create(customer=customer) for customer in (alice, bob, alice, bob, alice)]
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), "checkpoint.json")
+
+    def run_reminders(self, **kwargs):
+        batches = []
+        options = {"checkpoint": self.checkpoint, "page_size": 2, "batch_size": 1, "max_workers": 2,
+                   "max_pending": 1, **kwargs}
+        result = send_reminders(send=batches.append, **options)
+        return result, sorted(reminder for batch in batches for reminder in batch)
+
+    def test_one_reminder_per_email(self):
+        ids = [order.pk for order in self.orders]
+        (read, sent), reminders = self.run_reminders()
+        self.assertEqual((read, sent), (5, 2))
+        self.assertEqual(reminders, [("alice@example.com", ids[0]), ("bob@example.com", ids[1])])
+
+    def test_orders_spanning_a_batch_boundary(self):
+        ids = [order.pk for order in self.orders]
+        # Alice's later orders fall in her first reminder's batch or in later ones, depending on the size
+        for batch_size in (1, 3, 10):
+            self.assertEqual(self.run_reminders(batch_size=batch_size, checkpoint=None)[1],
+                             [("alice@example.com", ids[0]), ("bob@example.com", ids[1])])
+
+    def test_reruns_resume_after_checkpoint(self):
+        self.run_reminders()
+        self.assertEqual(self.run_reminders(), ((0, 0), []))
+
+        order = Order.objects.create(customer=self.orders[0].customer)
+        self.assertEqual(self.run_reminders(), ((1, 1), [("alice@example.com", order.pk)]))
+
+    def test_workers_close_their_connections(self):
+        # Even with CONN_MAX_AGE set, as in the tuned SQLite mode
+        with mock.patch("crm.reminders.connections") as worker_connections:
+            self.run_reminders()
+        self.assertEqual(worker_connections.close_all.call_count, 2)
+
+    def test_old_orders_are_skipped(self):
+        Order.objects.update(order_date=timezone.now() - timedelta(days=8))
+        self.assertEqual(self.run_reminders(), ((0, 0), []))
+
+
+class AsyncGraphQLViewTests(TestCase):
+    query = """
+        query($id: ID!) {
+            customers { email orders(first: 10) { edges { node { products(first: 10) { edges { node { name } } } } } } }
+            allOrders(first: 2) { totalCount edges { cursor node { id customer { name } products { edges { node { price } } } } } }
+            customer(id: $id) { name }
+            totalOrders
+            totalRevenue(totalAmount_Gte: 0)
+        }
+    """
+
+    def setUp(self):
+        cache.clear()
+        seed(3)
+        self.variables = {"id": to_global_id("CustomerNode", Customer.objects.first().pk)}
+
+    def post(self, path, query, variables=None):
+        return self.client.post(path, {"query": query, "variables": variables}, content_type="application/json")
+
+    async def apost(self, query, variables=None):
+        return await self.async_client.post("/graphql/async", {"query": query, "variables": variables},
+                                            content_type="application/json")
+
+    def test_matches_sync_view(self):
+        with self.settings(CRM_RESPONSE_CACHE=None):
+            expected = self.post("/graphql", self.query, self.variables).json()
+            search_backends.get_search_backend()
+            with CaptureQueriesContext(connection) as queries:
+                response = async_to_sync(self.apost)(self.query, self.variables)
+        self.assertEqual(response.json(), expected)
+        self.assertNotIn("errors", expected)
+        # Batched like the sync view: customers, orders, products; page with customers, products;
+        # node, two aggregates, count
+        self.assertEqual(len(queries.captured_queries), 9)
+
+    async def test_mutations_run_synchronously(self):
+        response = await self.apost('mutation { createProduct(input: {name: "Pen", price: 2}) { success } }')
+        self.assertEqual(response.json()["data"], {"createProduct": {"success": True}})
+        self.assertTrue(await Product.objects.filter(name="Pen").aexists())
+
+    def test_failed_mutations_roll_back_like_the_sync_view(self):
+        customer, product = Customer.objects.first(), Product.objects.first()
+        mutation = 'mutation { bulkCreateOrders(inputs: [{customerId: "%s", productIds: ["%s"]}]) { success } }' % (
+            customer.pk, product.pk)
+        orders = Order.objects.count()
+        # The orders are written, then the mutation fails
+        with mock.patch.dict(connection.settings_dict, {"ATOMIC_REQUESTS": True}), \
+                mock.patch("crm.schema.row_errors", side_effect=RuntimeError("boom")):
+            for path in ("/graphql", "/graphql/async"):
+                body = self.post(path, mutation).json()
+                self.assertEqual(body["errors"][0]["message"], "boom")
+                self.assertEqual(Order.objects.count(), orders)
+
+    async def test_offset_and_filtered_connections(self):
+        response = await self.apost("""query {
+            allProducts(offset: 1, first: 1) { edges { node { name } } }
+            allCustomers(first: 1) { edges { node { orders(totalAmount_Gte: 0) { edges { node { id } } } } } }
+        }""")
+        data = response.json()["data"]
+        self.assertEqual(data["allProducts"]["edges"], [{"node": {"name": "Product 1"}}])
+        self.assertEqual(len(data["allCustomers"]["edges"][0]["node"]["orders"]["edges"]), 1)
+
+
+class TracingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.clear()
+        seed(3)
+        self.customer_id = to_global_id("CustomerNode", Customer.objects.first().pk)
+
+    def post(self, path, query):
+        with self.settings(CRM_TRACE_SAMPLE_RATE=1, CRM_RESPONSE_CACHE=None):
+            return self.client.post(path, {"query": query}, content_type="application/json").json()
+
+    def test_resolver_timings_and_sql_counts(self):
+        with CaptureQueriesContext(connection) as queries:
+            extensions = self.post("/graphql", "{ allOrders(first: 2) { edges { node { customer { name } } } } }")["extensions"]
+        tracing = extensions["tracing"]
+        self.assertEqual(tracing["version"], 1)
+        resolvers = {tuple(resolver["path"]): resolver for resolver in tracing["execution"]["resolvers"]}
+        self.assertEqual(resolvers[("allOrders",)]["parentType"], "Query")
+        self.assertEqual(resolvers[("allOrders", "edges", 0, "node", "customer")]["returnType"], "CustomerNode!")
+        self.assertEqual(sum(resolver["sqlQueries"] for resolver in resolvers.values()), extensions["sql"]["count"])
+        self.assertEqual(extensions["sql"]["count"], len(queries.captured_queries))
+        self.assertEqual(extensions["sql"]["duplicates"], [])
+
+    def test_duplicate_queries_are_reported(self):
+        query = "{ %s }" % " ".join(f'{alias}: customer(id: "{self.customer_id}") {{ name }}' for alias in "abc")
+        with self.assertLogs("crm.tracing", "WARNING") as logs:
+            duplicate, = self.post("/graphql", query)["extensions"]["sql"]["duplicates"]
+        self.assertEqual((duplicate["count"], duplicate["fields"]), (3, ["a", "b", "c"]))
+        # SQL text goes to the log only
+        self.assertNotIn("sql", duplicate)
+        self.assertIn(f'N+1 [{duplicate["digest"]}]: 3 runs of \'SELECT', logs.output[0])
+
+        field = self.client.get("/graphql/metrics").json()["fields"]["Query.customer"]
+        self.assertEqual((field["count"], field["sql_queries"], field["n_plus_one"]), (3, 3, 1))
+        self.assertEqual(sum(field["buckets"]), 3)
+
+    def test_stats_and_metrics_are_local(self):
+        for path in ("/graphql/metrics", "/graphql/stats"):
+            self.assertEqual(self.client.get(path).status_code, 200)
+            self.assertEqual(self.client.get(path, REMOTE_ADDR="203.0.113.7").status_code, 403)
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.get(path, REMOTE_ADDR="203.0.113.7").status_code, 200)
+
+    def test_async_view(self):
+        resolvers = self.post("/graphql/async", "{ totalOrders allProducts(first: 1) { edges { node { name } } } }")[
+            "extensions"]["tracing"]["execution"]["resolvers"]
+        sql = {resolver["path"][0]: resolver["sqlQueries"] for resolver in resolvers if len(resolver["path"]) == 1}
+        self.assertEqual(sql, {"totalOrders": 1, "allProducts": 1})
+
+    def test_unsampled_operations_are_not_traced(self):
+        response = self.client.post("/graphql", {"query": "{ totalOrders }"}, content_type="application/json").json()
+        self.assertNotIn("tracing", response["extensions"])
+        self.assertEqual(metrics.snapshot()["traces"], 0)
+
+
+class SeedingTests(TestCase):
+    def dataset(self):
+        return list(Order.objects.order_by("pk").values_list("customer__email", "total_amount"))
+
+    def test_bulk_seed_is_consistent(self):
+        # 8 statements per batch of orders (savepoint pair, prices, orders, through rows, counters,
+        # two rollup upserts), plus the reconcile
+        with self.assertNumQueries(33):
+            counts = seed_dataset(customers=20, products=10, orders=50, seed=1, batch_size=25)
+        self.assertEqual((Customer.objects.count(), Product.objects.count(), Order.objects.count()), (20, 10, 50))
+        self.assertEqual(counts["order_products"], Order.products.through.objects.count())
+        self.assertFalse(Order.objects.drifted().exists())
+        self.assertEqual(aggregates.drifted(), {})
+        for order in Order.objects.prefetch_related("products"):
+            self.assertTrue(1 <= len(order.products.all()) <= 5)
+        self.assertLess(Order.objects.earliest("order_date").order_date, timezone.now() - timedelta(days=7))
+
+    def test_same_seed_same_rows(self):
+        seed_dataset(customers=20, products=10, orders=50, seed=7)
+        first = self.dataset()
+        for model in (Order, Customer, Product):
+            model.objects.all().delete()
+        seed_dataset(customers=20, products=10, orders=50, seed=7)
+        self.assertEqual(self.dataset(), first)
+        seed_dataset(orders=10, seed=8)
+        self.assertEqual(Order.objects.count(), 60)
+
+
+class RollupTests(SchemaTestCase):
+    def rollups(self):
+        # Incremental maintenance leaves zeroed rows behind where a rebuild leaves none
+        return [
+            sorted(model.objects.filter(orders__gt=0).values_list("day", key, "orders", "revenue"))
+            for model, key in ((DailyProductSales, "product_id"), (DailyCustomerSales, "customer_id"))
+        ]
+
+    def test_writes_keep_rollups_in_step_with_a_rebuild(self):
+        seed_dataset(customers=10, products=8, orders=60, seed=3, days=20)
+        customer = Customer.objects.create(name="Dana", email="dana@example.com")
+        desk = Product.objects.create(name="Desk", price="100.50")
+        lamp = Product.objects.create(name="Lamp", price="9.99")
+        order = Order.objects.create(customer=customer)
+        order.products.add(desk, lamp)
+        order.products.remove(lamp)
+        order.order_date -= timedelta(days=3)
+        order.save()
+        lamp.orders.add(*Order.objects.order_by("pk")[:5])
+        desk.orders.clear()
+        Order.objects.order_by("pk").last().delete()
+        Customer.objects.filter(pk__in=Order.objects.values("customer_id")[:1]).delete()
+
+        incremental = self.rollups()
+        self.assertTrue(all(incremental))
+        out = StringIO()
+        call_command("rebuild_rollups", "--chunk-days", "7", stdout=out)
+        self.assertIn("days of sales rollups", out.getvalue())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_orders_keep_the_price_they_were_written_at(self):
+        customer = Customer.objects.create(name="Dana", email="dana@example.com")
+        desk = Product.objects.create(name="Desk", price="100.00")
+        order = Order.objects.create(customer=customer)
+        order.products.add(desk)
+        # A price change is one UPDATE of the product, whatever its order history
+        desk.price = Decimal("150.00")
+        with self.assertNumQueries(1):
+            desk.save()
+        later = Order.objects.create(customer=customer)
+        later.products.add(desk)
+        self.assertEqual(Order.objects.get(pk=order.pk).total_amount, Decimal("100.00"))
+        self.assertEqual(later.total_amount, Decimal("150.00"))
+
+        today = timezone.localdate()
+        data = self.execute('{ salesByDay(from: "%s", to: "%s") { revenue } topProducts(n: 1, from: "%s", to: "%s") { revenue } }'
+                            % (today, today, today, today))
+        self.assertEqual(data["salesByDay"][0]["revenue"], "250.00")
+        self.assertEqual(data["topProducts"][0]["revenue"], "250.00")
+
+        order.delete()
+        later.delete()
+        self.assertEqual(list(DailyProductSales.objects.values_list("orders", "revenue")), [(0, Decimal("0"))])
+
+    def test_analytics_fields_read_only_the_rollups(self):
+        seed_dataset(customers=10, products=8, orders=60, seed=3, days=20)
+        today = timezone.localdate()
+        start = today - timedelta(days=30)
+        query = """{ salesByDay(from: "%s", to: "%s") { day orders customers revenue }
+                     topProducts(n: 3, from: "%s", to: "%s") { product { name } orders revenue } }""" % (
+            start, today, start, today)
+        # One GROUP BY each, plus the product lookup
+        with self.assertNumQueries(3):
+            data = self.execute(query)
+
+        days = data["salesByDay"]
+        self.assertEqual(sum(day["orders"] for day in days), 60)
+        self.assertEqual(sum(Decimal(day["revenue"]) for day in days), aggregates.total_revenue())
+        self.assertEqual([day["day"] for day in days], sorted(day["day"] for day in days))
+
+        top = data["topProducts"]
+        self.assertEqual(len(top), 3)
+        best = max(Product.objects.all(), key=lambda product: product.price * product.orders.count())
+        self.assertEqual(top[0]["product"]["name"], best.name)
+        self.assertEqual(top[0]["orders"], best.orders.count())
+        self.assertGreaterEqual(Decimal(top[0]["revenue"]), Decimal(top[-1]["revenue"]))
+
+        data = self.execute('{ salesByDay(from: "%s", to: "%s") { day } }' % (start, start))
+        self.assertEqual(data["salesByDay"], [])
+
+
+@override_settings(CRM_READ_REPLICA="replica", CRM_RESPONSE_CACHE=None)
+class ReadReplicaTests(TestCase):
+    # Two separate test databases; the replica holds different rows, so results show where a read went
+    databases = {"default", "replica"}
+    query = "{ customers { name } }"
+
+    def setUp(self):
+        Customer.objects.using("default").create(name="On primary", email="primary@example.com")
+        Customer.objects.using("replica").create(name="On replica", email="replica@example.com")
+
+    def names(self, path="/graphql"):
+        response = self.client.post(path, {"query": self.query}, content_type="application/json")
+        return [customer["name"] for customer in response.json()["data"]["customers"]]
+
+    def test_queries_read_the_replica(self):
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            self.assertEqual(self.names(), ["On replica"])
+        self.assertEqual(len(replica), 1)
+        self.assertEqual(async_to_sync(self.async_client.post)(
+            "/graphql/async", {"query": self.query}, content_type="application/json"
+        ).json()["data"]["customers"], [{"name": "On replica"}])
+        # Outside a GraphQL query operation everything stays on the primary
+        self.assertEqual(list(Customer.objects.values_list("name", flat=True)), ["On primary"])
+        with self.settings(CRM_READ_REPLICA=None):
+            self.assertEqual(self.names(), ["On primary"])
+
+    def test_mutations_write_the_primary_and_pin_the_client(self):
+        response = self.client.post("/graphql", {
+            "query": 'mutation { createCustomer(input: {name: "New", email: "new@example.com"}) { customer { name } } }'
+        }, content_type="application/json")
+        self.assertEqual(response.json()["data"]["createCustomer"]["customer"], {"name": "New"})
+        self.assertFalse(Customer.objects.using("replica").filter(name="New").exists())
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 5)
+
+        # The test client sends the cookie back: read-your-writes from the primary
+        self.assertEqual(self.names(), ["On primary", "New"])
+        self.client.cookies[PIN_COOKIE] = "1"  # expired
+        self.assertEqual(self.names(), ["On replica"])
+
+    def test_writes_ignore_the_replica_an_instance_came_from(self):
+        customer = Customer.objects.using("replica").get()
+        customer.pk = None
+        customer.save()
+        self.assertEqual(Customer.objects.using("default").count(), 2)
+        self.assertEqual(Customer.objects.using("replica").count(), 1)
+
+
+class TunedSQLiteTests(TestCase):
+    def open(self, path):
+        # A connection of its own to a database file, so connection_created fires for it
+        database = type(connections["default"])(dict(connection.settings_dict, NAME=path), alias="tuned")
+        database.ensure_connection()
+        self.addCleanup(database.close)
+        return database
+
+    def pragma(self, database, name):
+        with database.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_on_new_connections(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        plain = self.open(os.path.join(directory.name, "plain.sqlite3"))
+        self.assertEqual(self.pragma(plain, "journal_mode"), "delete")
+
+        with self.settings(CRM_SQLITE_TUNED=True, CRM_SQLITE_PRAGMAS={"busy_timeout": 1000}):
+            tuned = self.open(os.path.join(directory.name, "tuned.sqlite3"))
+        self.assertEqual(self.pragma(tuned, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(tuned, "synchronous"), 1)  # NORMAL
+        self.assertEqual(self.pragma(tuned, "busy_timeout"), 1000)
+        self.assertEqual(self.pragma(tuned, "cache_size"), sqlite_tuning.SQLITE_PRAGMAS["cache_size"])
+        self.assertEqual(tuned.execute_wrappers, [sqlite_tuning.retry_statement])
+
+    def test_retry_survives_a_trace_that_opened_the_connection(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = type(connections["default"])(
+            dict(connection.settings_dict, NAME=os.path.join(directory.name, "traced.sqlite3")), alias="traced"
+        )
+        self.addCleanup(database.close)
+        with mock.patch.dict(connections.settings, {"traced": database.settings_dict}), \
+                mock.patch.object(type(self), "databases", {"default", "traced"}):
+            connections["traced"] = database
+            self.addCleanup(connections.__delitem__, "traced")
+            with self.settings(CRM_SQLITE_TUNED=True), Trace() as trace:
+                # The wrapper is pushed before the connection exists
+                self.pragma(database, "journal_mode")
+                self.assertEqual(database.execute_wrappers, [sqlite_tuning.retry_statement, trace.record_query])
+        self.assertEqual(database.execute_wrappers, [sqlite_tuning.retry_statement])
+        self.assertEqual(len(trace.queries), 1)
+
+    @mock.patch.object(sqlite_tuning, "LOCKED_BACKOFF", 0)
+    def test_locked_database_is_retried_outside_transactions(self):
+        calls = []
+
+        def flaky(*args):
+            calls.append(args)
+            if len(calls) < 3:
+                raise OperationalError("database is locked")
+            return "ok"
+
+        context = {"connection": connection}
+        with mock.patch.object(connection, "in_atomic_block", False):
+            self.assertEqual(sqlite_tuning.retry_statement(flaky, "UPDATE", None, False, context), "ok")
+            self.assertEqual(len(calls), 3)
+            calls.clear()
+            self.assertEqual(sqlite_tuning.retry_on_locked(flaky)(), "ok")
+            self.assertEqual(len(calls), 3)
+
+        # Inside a transaction only its owner can retry it
+        calls.clear()
+        with transaction.atomic(), self.assertRaisesMessage(OperationalError, "locked"):
+            sqlite_tuning.retry_on_locked(flaky)()
+        self.assertEqual(len(calls), 1)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        seed(5)
+        Order.objects.recompute_totals()
+
+    def get(self, path, headers=None):
+        response = self.client.get(path, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content), response
+
+    @override_settings(CRM_EXPORT_CHUNK_SIZE=2)
+    def test_csv_round_trips_through_import_orders(self):
+        body, response = self.get("/export/orders.csv?total_amount__gte=6")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        lines = body.decode().splitlines()
+        self.assertEqual(lines[0], "id,customer_id,order_date,total_amount,product_ids")
+        self.assertEqual(len(lines), 6)
+        product_ids = ";".join(map(str, Product.objects.order_by("pk").values_list("pk", flat=True)[:3]))
+        self.assertTrue(all(line.endswith(f",6.00,{product_ids}") for line in lines[1:]))
+
+        with tempfile.NamedTemporaryFile("wb", suffix=".csv", delete=False) as f:
+            f.write(body)
+        self.addCleanup(os.remove, f.name)
+        call_command("import_orders", f.name, stdout=StringIO())
+        self.assertEqual(Order.objects.filter(total_amount=6).count(), 10)
+
+        body, _ = self.get("/export/orders.csv?total_amount__gte=7")
+        self.assertEqual(body.decode().splitlines(), ["id,customer_id,order_date,total_amount,product_ids"])
+
+    def test_ndjson_with_gzip(self):
+        body, response = self.get("/export/customers.ndjson?email=customer3", {"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        customer = Customer.objects.get(email="customer3@example.com")
+        self.assertEqual(
+            [json.loads(line) for line in gzip.decompress(body).splitlines()],
+            [{"id": customer.pk, "name": "Customer 3", "email": "customer3@example.com", "phone": ""}],
+        )
+
+    def test_asgi_streams_piece_by_piece(self):
+        expected, _ = self.get("/export/orders.ndjson")
+
+        async def get():
+            response = await self.async_client.get("/export/orders.ndjson")
+            return response, [piece async for piece in response.streaming_content]
+
+        with self.settings(CRM_EXPORT_CHUNK_SIZE=2):
+            response, pieces = async_to_sync(get)()
+        self.assertTrue(response.is_async)
+        self.assertEqual(len(pieces), 3)
+        self.assertEqual(b"".join(pieces), expected)
+
+    def test_orders_added_during_an_export_are_not_attached(self):
+        read_chunks = export_module._chunks
+        late = []
+
+        def chunks(queryset, size):
+            for chunk in read_chunks(queryset, size):
+                # A backdated order committed between reading a chunk's rows and its product ids
+                if not late:
+                    late.append(Order.objects.create(customer=Customer.objects.first(), order_date=chunk[0][2]))
+                    late[0].products.add(Product.objects.first())
+                yield chunk
+
+        with self.settings(CRM_EXPORT_CHUNK_SIZE=2), mock.patch.object(export_module, "_chunks", chunks):
+            rows = [json.loads(line) for piece in stream("orders", Order.objects.all(), "ndjson")
+                    for line in piece.splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertNotIn(late[0].pk, [row["id"] for row in rows])
+
+    def test_bad_requests(self):
+        response = self.client.get("/export/orders.csv?total_amount__gte=lots")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("total_amount__gte", response.json()["errors"])
+        self.assertEqual(self.client.get("/export/orders.xml").status_code, 404)
+        self.assertEqual(self.client.get("/export/products.csv").status_code, 404)
+        self.assertEqual(self.client.post("/export/orders.csv").status_code, 405)
+
+
+@override_settings(CRM_RESPONSE_CACHE=None)
+class BatchTests(TestCase):
+    create = 'mutation { createCustomer(input: {name: "%s", email: "%s@example.com"}) { customer { name } } }'
+    names = "{ customers { name } }"
+
+    def post(self, operations, path="/graphql"):
+        return self.client.post(path, operations, content_type="application/json")
+
+    def test_operations_run_in_order_in_one_request(self):
+        response = self.post([
+            {"query": self.names},
+            {"query": self.create % ("Alice", "alice"), "id": "create"},
+            {"query": self.names},
+        ])
+        self.assertEqual(response.status_code, 200)
+        first, created, second = response.json()
+        self.assertEqual(first["data"]["customers"], [])
+        self.assertEqual((created["id"], created["status"]), ("create", 200))
+        self.assertEqual(second["data"]["customers"], [{"name": "Alice"}])
+
+        # A single operation keeps its plain response; the async view hands batches to the sync path
+        self.assertEqual(self.post({"query": self.names}).json()["data"], {"customers": [{"name": "Alice"}]})
+        response = async_to_sync(self.async_client.post)(
+            "/graphql/async", [{"query": self.names}], content_type="application/json"
+        )
+        self.assertEqual(response.json()[0]["data"]["customers"], [{"name": "Alice"}])
+
+    def test_operations_share_the_request_loaders(self):
+        seed(3)
+        query = "{ orders { customer { name } products { edges { node { name } } } } }"
+        request = RequestFactory().post(
+            "/graphql", json.dumps([{"query": query}, {"query": query}]), content_type="application/json"
+        )
+        # Two queries per operation (orders with their customers, then all their products), on one set of loaders
+        with self.assertNumQueries(2 * 2):
+            response = CachedGraphQLView.as_view()(request)
+        first, second = json.loads(response.content)
+        self.assertEqual(first["data"], second["data"])
+        self.assertEqual(len(request.loaders._levels[("orders",)]), 3 * 2)
+
+    def test_atomic_batch_rolls_back_at_the_first_error(self):
+        response = self.post([
+            {"query": self.create % ("Alice", "alice")},
+            {"query": "{ customers { nope } }"},
+            {"query": self.create % ("Bob", "bob")},
+        ], path="/graphql?atomic=1")
+        self.assertEqual(response.status_code, 400)
+        created, invalid, skipped = response.json()
+        self.assertEqual(created["data"]["createCustomer"]["customer"], {"name": "Alice"})
+        self.assertEqual(invalid["status"], 400)
+        self.assertIn("Not executed", skipped["errors"][0]["message"])
+        self.assertFalse(Customer.objects.exists())
+
+        # Without atomic, each operation stands on its own
+        self.post([{"query": self.create % ("Alice", "alice")}, {"query": "{ customers { nope } }"}])
+        self.assertEqual(list(Customer.objects.values_list("name", flat=True)), ["Alice"])
+
+    @override_settings(CRM_GRAPHQL_MAX_BATCH_SIZE=2)
+    def test_batch_size_limit(self):
+        response = self.post([{"query": self.names}] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("at most 2", response.json()["errors"][0]["message"])
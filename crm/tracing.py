@@ -0,0 +1,231 @@
+
+
+import bisect
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+from inspect import isawaitable
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+
+
+logger = logging.getLogger(__name__)
+
+# Share of executed operations that are traced; CRM_TRACE_SAMPLE_RATE overrides it
+TRACE_SAMPLE_RATE = 0.0
+
+# Identical SQL statements in one operation before they are reported as an N+1
+DUPLICATE_QUERY_THRESHOLD = 3
+
+# Upper bounds (ms) of the resolver time histogram buckets; the last bucket is open
+DURATION_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Path of the resolver running in the current thread or task
+_current_path = ContextVar("crm_trace_path", default=None)
+
+
+
+def sample_rate():
+    return getattr(settings, "CRM_TRACE_SAMPLE_RATE", TRACE_SAMPLE_RATE)
+
+
+def start_trace(request):
+    """A ``Trace`` for a sampled operation, stored on ``request`` for ``TracingMiddleware``, or None."""
+    rate = sample_rate()
+    # Reset per operation: the operations of a batch share their request
+    request.graphql_trace = None
+    if not rate or random.random() >= rate:
+        return None
+    request.graphql_trace = Trace()
+    return request.graphql_trace
+
+
+
+class Trace:
+    """
+    Resolver timings and SQL statements of one operation.
+
+    Used as a (sync or async) context manager around execution: it installs an
+    ``execute_wrapper`` on every database alias (so reads routed to a replica
+    count too) that counts each statement against the resolver that issued it. ``finish`` adds Apollo tracing ``extensions`` to
+    the result and records the timings in ``metrics``; the text of repeated
+    statements is logged, not returned to the client.
+    """
+
+    def __init__(self):
+        self.start_time = timezone.now()
+        self.start = time.perf_counter_ns()
+        self.resolvers = []
+        self.queries = []
+        self._wrapper = None
+
+    def __enter__(self):
+        self._wrapper = ExitStack()
+        for connection in connections.all():
+            self._wrapper.enter_context(connection.execute_wrapper(self.record_query))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    # Connections are per thread: the async ORM runs its queries on the request's sync thread
+    async def __aenter__(self):
+        return await sync_to_async(self.__enter__)()
+
+    async def __aexit__(self, *exc_info):
+        await sync_to_async(self.__exit__)(*exc_info)
+
+    def record_query(self, execute, sql, params, many, context):
+        self.queries.append((sql, _current_path.get()))
+        return execute(sql, params, many, context)
+
+    def record_resolver(self, info, path, start, end):
+        self.resolvers.append({
+            "path": list(path),
+            "parentType": info.parent_type.name,
+            "fieldName": info.field_name,
+            "returnType": str(info.return_type),
+            "startOffset": start - self.start,
+            "duration": end - start,
+        })
+
+    def duplicates(self):
+        # Identical statements run at least DUPLICATE_QUERY_THRESHOLD times, with the paths that ran them
+        counts = Counter(sql for sql, _ in self.queries)
+        paths = defaultdict(set)
+        for sql, path in self.queries:
+            if counts[sql] >= DUPLICATE_QUERY_THRESHOLD:
+                paths[sql].add(path)
+        return {sql: (counts[sql], paths[sql]) for sql in paths}
+
+    def finish(self, result):
+        end = time.perf_counter_ns()
+        queries_by_path = Counter(path for _, path in self.queries)
+        fields = {}
+        for resolver in self.resolvers:
+            path = tuple(resolver["path"])
+            resolver["sqlQueries"] = queries_by_path[path]
+            fields[path] = f'{resolver["parentType"]}.{resolver["fieldName"]}'
+
+        duplicates = []
+        n_plus_one = Counter()
+        for sql, (count, paths) in self.duplicates().items():
+            names = sorted(_field_path(path) for path in paths)
+            # The SQL text only goes to the log; the response names it by a digest to look it up there
+            digest = hashlib.sha1(sql.encode()).hexdigest()[:12]
+            logger.warning("N+1 [%s]: %s runs of %r from %s", digest, count, sql, ", ".join(names))
+            duplicates.append({"digest": digest, "count": count, "fields": names})
+            n_plus_one.update({fields[path] for path in paths if path in fields})
+
+        result.extensions = dict(result.extensions or {}, tracing={
+            "version": 1,
+            "startTime": self.start_time.isoformat(),
+            "endTime": timezone.now().isoformat(),
+            "duration": end - self.start,
+            "execution": {"resolvers": self.resolvers},
+        }, sql={"count": len(self.queries), "duplicates": duplicates})
+        metrics.record(self.resolvers, n_plus_one)
+        return result
+
+
+
+class TracingMiddleware:
+    """
+    Graphene middleware timing every resolver of a traced operation.
+
+    Operations are traced when the view sampled them (see ``start_trace``).
+    The GraphQL views leave the middleware out of unsampled executions, so
+    they pay nothing per field; elsewhere it only looks up the missing trace.
+    """
+
+    def resolve(self, next, root, info, **args):
+        trace = getattr(info.context, "graphql_trace", None)
+        if trace is None:
+            return next(root, info, **args)
+
+        path = tuple(info.path.as_list())
+        token = _current_path.set(path)
+        start = time.perf_counter_ns()
+        try:
+            result = next(root, info, **args)
+        finally:
+            _current_path.reset(token)
+        if isawaitable(result):
+            return self.resolve_async(trace, info, path, start, result)
+        trace.record_resolver(info, path, start, time.perf_counter_ns())
+        return result
+
+    @staticmethod
+    async def resolve_async(trace, info, path, start, result):
+        # Runs in the task awaiting this field, so queries issued meanwhile count against it
+        _current_path.set(path)
+        try:
+            return await result
+        finally:
+            trace.record_resolver(info, path, start, time.perf_counter_ns())
+
+
+
+class Metrics:
+    """
+    Per-field histograms of traced resolver times, SQL statement counts and N+1 reports.
+
+    Fields are keyed ``ParentType.fieldName``; counts are per process since the last ``clear``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.traces = 0
+        self.fields = {}
+
+    def clear(self):
+        with self._lock:
+            self.traces = 0
+            self.fields = {}
+
+    def record(self, resolvers, n_plus_one):
+        with self._lock:
+            self.traces += 1
+            for resolver in resolvers:
+                key = f'{resolver["parentType"]}.{resolver["fieldName"]}'
+                field = self.fields.get(key)
+                if field is None:
+                    field = self.fields[key] = {
+                        "count": 0, "total_ms": 0.0, "max_ms": 0.0, "sql_queries": 0, "n_plus_one": 0,
+                        "buckets": [0] * (len(DURATION_BUCKETS) + 1),
+                    }
+                ms = resolver["duration"] / 1e6
+                field["count"] += 1
+                field["total_ms"] += ms
+                field["max_ms"] = max(field["max_ms"], ms)
+                field["sql_queries"] += resolver["sqlQueries"]
+                field["buckets"][bisect.bisect_left(DURATION_BUCKETS, ms)] += 1
+            for key, count in n_plus_one.items():
+                self.fields[key]["n_plus_one"] += count
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "traces": self.traces,
+                "buckets_ms": list(DURATION_BUCKETS) + ["+Inf"],
+                "fields": {name: dict(field, buckets=list(field["buckets"])) for name, field in self.fields.items()},
+            }
+
+
+metrics = Metrics()
+
+
+
+def _field_path(path):
+    # ("allOrders", "edges", 0, "node", "customer") -> "allOrders.edges.node.customer"
+    if path is None:
+        return "(operation)"
+    return ".".join(str(part) for part in path if not isinstance(part, int))
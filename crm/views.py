@@ -1,3 +1,448 @@
-from django.shortcuts import render
+import json
+import re
+from contextlib import nullcontext
+from functools import wraps
+from inspect import isawaitable
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBadRequest, HttpResponseNotAllowed
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+from django.views.decorators.http import require_GET
+from graphql import ExecutionResult, GraphQLError, OperationType, execute, get_operation_ast, validate_schema
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+
+from .documents import DocumentCache, PersistedQueries, PersistedQueryError
+from .export import EXPORT_FORMATS, EXPORTS, aiterate, filterset, stream
+from .response_cache import ResponseCache
+from .routers import is_pinned, note_write, pin_response, read_database, read_replica, reading_from
+from .search import get_search_backend
+from .tracing import TracingMiddleware, metrics, start_trace
 
 # Create your views here.
+
+accepts_gzip = re.compile(r"\bgzip\b")
+
+# Most operations one request may send as a JSON array
+MAX_BATCH_SIZE = 50
+
+# REMOTE_ADDRs the stats and metrics endpoints answer without DEBUG or a staff login. Behind a
+# reverse proxy on the same host every request comes from these, so set it to () there.
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+
+
+def max_batch_size():
+    return getattr(settings, "CRM_GRAPHQL_MAX_BATCH_SIZE", MAX_BATCH_SIZE)
+
+
+class CachedGraphQLView(GraphQLView):
+    """
+    GraphQLView that parses and validates each distinct document once.
+
+    Documents are looked up in an LRU cache by the sha256 of their text, and
+    clients may send Automatic Persisted Queries (only the hash, once the text
+    is known). Results of read-only operations are served from the response
+    cache until a write to one of the models they read. All three caches count
+    their hits and misses; see ``graphql_stats``.
+
+    Operations over the query cost budget are rejected during validation, and
+    the cost of every executed operation is returned in ``extensions.cost``
+    (see crm/cost.py). A sample of executions is traced (crm/tracing.py).
+
+    With ``CRM_READ_REPLICA`` set, queries read from that database and
+    mutations stay on the primary (crm/routers.py). After a mutation the
+    client reads from the primary, bypassing the response cache, for
+    ``CRM_READ_YOUR_WRITES_SECONDS``.
+
+    A JSON array of operations is a batch: they run in order within the one
+    request, sharing its loaders and caches, and the response is the array of
+    their results. With ``?atomic=1`` the batch runs in one transaction that
+    is rolled back, skipping the remaining operations, at the first error.
+    """
+
+    document_cache = DocumentCache()
+    persisted_queries = PersistedQueries()
+    response_cache = ResponseCache()
+
+    @classmethod
+    def stats(cls):
+        return {
+            "documents": cls.document_cache.stats(),
+            "persisted_queries": cls.persisted_queries.stats(),
+            "responses": cls.response_cache.stats(),
+        }
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except Exception:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        request.persisted_query_error = None
+        try:
+            query = self.persisted_queries.resolve(extensions, query)
+        except PersistedQueryError as e:
+            # Reported as a regular GraphQL error so APQ clients can retry with the text
+            request.persisted_query_error = e
+        return query, variables, operation_name, id
+
+    # Set per request by dispatch (as_view makes an instance per request)
+    atomic_batch = False
+    batch_failed = False
+
+    @classmethod
+    def is_batch(cls, request):
+        return (
+            request.method.lower() == "post"
+            and cls.get_content_type(request) == "application/json"
+            and request.body.lstrip()[:1] == b"["
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.is_batch(request):
+            self.batch = True
+            self.atomic_batch = request.GET.get("atomic", "").lower() in ("1", "true")
+        with transaction.atomic() if self.atomic_batch else nullcontext():
+            response = super().dispatch(request, *args, **kwargs)
+        return pin_response(request, response)
+
+    def parse_body(self, request):
+        data = super().parse_body(request)
+        if self.batch and len(data) > max_batch_size():
+            raise HttpError(HttpResponseBadRequest(f"A batch may hold at most {max_batch_size()} operations."))
+        return data
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        if getattr(request, "graphql_trace", None) is None:
+            # Unsampled operations skip the per-field tracing wrapper entirely
+            middleware = [m for m in middleware or () if not isinstance(m, TracingMiddleware)]
+        return middleware
+
+    def get_response(self, request, data, show_graphiql=False):
+        if self.batch:
+            # The operations of a batch share the request, but not its per-operation flag
+            setattr(request, MUTATION_ERRORS_FLAG, False)
+            if self.batch_failed:
+                error = GraphQLError("Not executed: an earlier operation of the atomic batch failed.")
+                return self.encode_result(request, ExecutionResult(errors=[error]), data.get("id"))
+
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True or (execution_result and execution_result.errors):
+            set_rollback()
+            if self.atomic_batch:
+                self.batch_failed = True
+                transaction.set_rollback(True)
+        if not execution_result:
+            return None, 200
+        return self.encode_result(request, execution_result, id, pretty=show_graphiql)
+
+    def encode_result(self, request, execution_result, id=None, pretty=False):
+        # graphene's response body, plus the result's extensions
+        status_code = 200
+        response = {}
+
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+        if execution_result.errors and any(not getattr(e, "path", None) for e in execution_result.errors):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+
+        return self.json_encode(request, response, pretty=pretty), status_code
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        cached, operation_ast, result = self.prepare_document(request, query, operation_name, show_graphiql)
+        if cached is None:
+            return result
+
+        def run():
+            return self.execute_document(request, cached.document, operation_ast, variables, operation_name)
+
+        if is_pinned(request) or self.atomic_batch:
+            # Read-your-writes: a cached response may come from a lagging replica. Inside an
+            # atomic batch, results may hold writes that are yet to commit
+            result = run()
+        else:
+            result = self.response_cache.fetch(request, self.schema.graphql_schema, cached, operation_name, variables, run)
+        return self.with_cost(result, cached, operation_ast)
+
+    @staticmethod
+    def with_cost(result, cached, operation_ast):
+        cost = cached.cost(operation_ast)
+        if cost is not None:
+            result.extensions = dict(result.extensions or {}, cost=cost.extensions())
+        return result
+
+    def prepare_document(self, request, query, operation_name, show_graphiql=False):
+        """
+        Look up the validated document for a request.
+
+        Returns ``(cached, operation_ast, None)`` when the operation can run,
+        or ``(None, None, result)`` with the result to answer with instead.
+        """
+        error = getattr(request, "persisted_query_error", None)
+        if error is not None:
+            return None, None, ExecutionResult(errors=[GraphQLError(str(error), extensions={"code": error.code})])
+        if not query:
+            if show_graphiql:
+                return None, None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return None, None, ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            cached = self.document_cache.get(schema, query, self.validation_rules)
+        except GraphQLError as e:
+            return None, None, ExecutionResult(errors=[e])
+
+        operation_ast = get_operation_ast(cached.document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None, None, None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if cached.errors:
+            return None, None, ExecutionResult(data=None, errors=cached.errors)
+
+        return cached, operation_ast, None
+
+    def execute_document(self, request, document, operation_ast, variables, operation_name):
+        if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+            note_write(request)
+        trace = start_trace(request)
+        with reading_from(read_database(request, operation_ast)):
+            if trace is None:
+                return self.run_document(request, document, operation_ast, variables, operation_name)
+            with trace:
+                result = self.run_document(request, document, operation_ast, variables, operation_name)
+        return trace.finish(result)
+
+    def run_document(self, request, document, operation_ast, variables, operation_name):
+        schema = self.schema.graphql_schema
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "middleware": self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                execute_options["execution_context_class"] = self.execution_context_class
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            return execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+class AsyncGraphQLView(CachedGraphQLView):
+    """
+    CachedGraphQLView for ASGI that executes queries on the event loop.
+
+    Query resolvers return awaitables and read through Django's async ORM (see
+    ``is_async`` in crm/loaders.py), so independent root fields are awaited
+    concurrently and the request holds no worker thread while it waits.
+    Mutations keep their synchronous, transactional code path and run on the
+    request's sync thread. GraphiQL and batched requests are served by the
+    synchronous view.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Django refuses to wrap async views in ATOMIC_REQUESTS; mutations open that transaction
+        # themselves (see run_mutation)
+        for alias in settings.DATABASES:
+            view = transaction.non_atomic_requests(using=alias)(view)
+        return markcoroutinefunction(view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if self.batch or self.is_batch(request):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+            data = self.parse_body(request)
+            if (
+                request.method.lower() not in ("get", "post")
+                or (self.graphiql and self.can_display_graphiql(request, data))
+            ):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            result, status_code = await self.aget_response(request, data)
+            response = HttpResponse(status=status_code, content=result, content_type="application/json")
+            return pin_response(request, response)
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    async def aget_response(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = await self.aexecute_graphql_request(request, data, query, variables, operation_name)
+        return self.encode_result(request, execution_result)
+
+    async def aexecute_graphql_request(self, request, data, query, variables, operation_name):
+        cached, operation_ast, result = self.prepare_document(request, query, operation_name)
+        if cached is None:
+            return result
+        # The search backend probes the database once per process; do it off the event loop
+        await sync_to_async(get_search_backend)()
+
+        def run():
+            return self.aexecute_document(request, cached.document, operation_ast, variables, operation_name)
+
+        if is_pinned(request):
+            result = await run()
+        else:
+            result = await self.response_cache.afetch(
+                request, self.schema.graphql_schema, cached, operation_name, variables, run
+            )
+        return self.with_cost(result, cached, operation_ast)
+
+    async def aexecute_document(self, request, document, operation_ast, variables, operation_name):
+        if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+            return await sync_to_async(self.run_mutation)(request, document, operation_ast, variables, operation_name)
+        trace = start_trace(request)
+        with reading_from(read_database(request, operation_ast)):
+            if trace is None:
+                return await self.arun_document(request, document, variables, operation_name)
+            async with trace:
+                result = await self.arun_document(request, document, variables, operation_name)
+        return trace.finish(result)
+
+    def run_mutation(self, request, document, operation_ast, variables, operation_name):
+        # The sync view's request transaction and its rollback on errors (see get_response)
+        atomic = connection.settings_dict.get("ATOMIC_REQUESTS", False)
+        with transaction.atomic() if atomic else nullcontext():
+            result = self.execute_document(request, document, operation_ast, variables, operation_name)
+            if getattr(request, MUTATION_ERRORS_FLAG, False) is True or (result and result.errors):
+                set_rollback()
+        return result
+
+    async def arun_document(self, request, document, variables, operation_name):
+        try:
+            result = execute(
+                self.schema.graphql_schema,
+                document,
+                root_value=self.get_root_value(request),
+                context_value=self.get_context(request),
+                variable_values=variables,
+                operation_name=operation_name,
+                middleware=self.get_middleware(request),
+                **({"execution_context_class": self.execution_context_class} if self.execution_context_class else {}),
+            )
+            if isawaitable(result):
+                result = await result
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+def local_only(view):
+    """Serve ``view`` to staff users, under DEBUG, or to requests from the local host; 403 otherwise."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        user = getattr(request, "user", None)
+        if not (settings.DEBUG or (user is not None and user.is_staff)
+                or request.META.get("REMOTE_ADDR") in getattr(settings, "CRM_LOCAL_ADDRESSES", LOCAL_ADDRESSES)):
+            return JsonResponse({"errors": [{"message": "Forbidden"}]}, status=403)
+        return view(request, *args, **kwargs)
+    return wrapped
+
+
+@local_only
+def graphql_stats(request):
+    """Hit/miss counters of the GraphQL document and persisted-query caches."""
+    return JsonResponse(CachedGraphQLView.stats())
+
+
+@local_only
+def graphql_metrics(request):
+    """Per-field resolver time histograms, SQL counts and N+1 reports of the traced operations."""
+    return JsonResponse(metrics.snapshot())
+
+
+@require_GET
+def export(request, dataset, format):
+    """
+    Stream the customers or orders matching the query string's filters as CSV or NDJSON.
+
+    The filters are those of ``allCustomers``/``allOrders`` under their
+    FilterSet names, e.g. ``/export/orders.csv?total_amount__gte=100``. Rows
+    are written as they are read, gzip-compressed when the client accepts it,
+    so the first bytes go out at once and memory does not grow with the
+    export. Reads go to the read replica unless the client is pinned to the
+    primary.
+    """
+    if dataset not in EXPORTS or format not in EXPORT_FORMATS:
+        raise Http404(f"No {format} export of {dataset}")
+    filters = filterset(dataset, request.GET)
+    if not filters.is_valid():
+        return JsonResponse({"errors": filters.errors}, status=400)
+
+    body = stream(dataset, filters.qs, format, None if is_pinned(request) else read_replica())
+    response = StreamingHttpResponse(content_type=EXPORT_FORMATS[format])
+    if accepts_gzip.search(request.headers.get("Accept-Encoding", "")):
+        body = compress_sequence(body)
+        response["Content-Encoding"] = "gzip"
+    # Django's ASGI handler would read a sync iterator into memory before sending it
+    response.streaming_content = aiterate(body) if isinstance(request, ASGIRequest) else body
+    response["Content-Disposition"] = f'attachment; filename="{dataset}.{format}"'
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response